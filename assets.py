@@ -0,0 +1,308 @@
+"""
+Статические файлы из data/: каталог документов, кэш содержимого и file_id Telegram
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import NamedTuple
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileIdCache:
+    """Хранит file_id загруженных в Telegram файлов по SHA-256 их содержимого.
+
+    Файл загружается в Telegram один раз, дальше отправляется по file_id.
+    Изменение файла в data/ меняет хэш, и файл загружается заново.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._file_ids = {}  # sha256 -> file_id
+        self._hashes = {}  # путь -> (mtime_ns, size, sha256)
+        self.hits = 0
+        self.uploads = 0
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                self._file_ids = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш file_id {cache_path} не прочитан: {e}")
+
+    async def send(self, file_path: str, send_func, extract_file_id):
+        """Отправляет файл через send_func(media) и запоминает полученный file_id.
+
+        extract_file_id(message) достаёт file_id из ответа Telegram.
+        """
+        sha = await self._content_hash(file_path)
+        return await self.send_hashed(
+            sha,
+            lambda: asyncio.to_thread(_read_bytes, file_path),
+            send_func,
+            extract_file_id,
+            file_path,
+        )
+
+    async def send_hashed(
+        self, sha: str, load, send_func, extract_file_id, name: str = ""
+    ):
+        """То же, что send, для уже известного хэша; load() - корутина с содержимым"""
+        file_id = self._file_ids.get(sha)
+        if file_id:
+            try:
+                message = await send_func(file_id)
+                self.hits += 1
+                return message
+            except BadRequest as e:
+                logger.warning(f"file_id для {name or sha} отклонён Telegram: {e}")
+                self._file_ids.pop(sha, None)
+
+        content = await load()
+        message = await send_func(content)
+        self.uploads += 1
+        self._file_ids[sha] = extract_file_id(message)
+        await asyncio.to_thread(self._save)
+        return message
+
+    def forget(self, sha: str) -> None:
+        """Файл с таким содержимым больше не отправляется"""
+        self._file_ids.pop(sha, None)
+
+    async def _content_hash(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        cached = self._hashes.get(file_path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        sha = await asyncio.to_thread(file_sha256, file_path)
+        if cached and cached[2] != sha:
+            # Файл изменился: старый file_id больше не нужен
+            self._file_ids.pop(cached[2], None)
+        self._hashes[file_path] = (stat.st_mtime_ns, stat.st_size, sha)
+        return sha
+
+    def _save(self) -> None:
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._file_ids, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+def _read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+class IndexEntry(NamedTuple):
+    mtime_ns: int
+    size: int
+    sha256: str
+
+
+# kind -> (метод Bot, имя параметра с файлом, file_id из ответа)
+_SENDERS = {
+    "photo": ("send_photo", "photo", lambda message: message.photo[-1].file_id),
+    "document": ("send_document", "document", lambda message: message.document.file_id),
+}
+
+
+@dataclass(frozen=True)
+class Asset:
+    """Документ из каталога, отправляется кнопкой doc:<id>"""
+
+    id: str
+    file: str
+    kind: str = "document"
+    caption: str = None
+    filename: str = None
+    unavailable: str = "Извините, документ временно недоступен."
+
+
+def load_catalog(data: dict) -> MappingProxyType:
+    """{"id": {"file": ..., "kind": ..., ...}} -> {id: Asset}"""
+    catalog = {}
+    for asset_id, spec in data.items():
+        asset = Asset(id=asset_id, **spec)
+        if asset.kind not in _SENDERS:
+            raise ValueError(f"{asset_id}: неизвестный тип {asset.kind}")
+        catalog[asset_id] = asset
+    return MappingProxyType(catalog)
+
+
+def scan_directory(data_dir: str, previous: dict = None) -> dict:
+    """Индекс файлов папки: имя -> IndexEntry. Хэш считается только у изменённых"""
+    previous = previous or {}
+    index = {}
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            old = previous.get(entry.name)
+            if old and old[:2] == (stat.st_mtime_ns, stat.st_size):
+                index[entry.name] = old
+            else:
+                sha = file_sha256(entry.path)
+                index[entry.name] = IndexEntry(stat.st_mtime_ns, stat.st_size, sha)
+    return index
+
+
+class AssetManager:
+    """Индекс и каталог файлов data/ для отправки без обращений к диску.
+
+    Файлы индексируются при запуске. Файлы до cache_file_limit байт держатся
+    в памяти (LRU, всего не больше cache_limit байт), крупные читаются в
+    отдельном потоке. watch() замечает изменения по mtime: изменённые файлы
+    выбрасываются из кэша, каталог перечитывается.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        catalog_path: str,
+        file_ids: FileIdCache = None,
+        cache_limit: int = 16 * 1024 * 1024,
+        cache_file_limit: int = 2 * 1024 * 1024,
+    ):
+        self.data_dir = data_dir
+        self.catalog_path = catalog_path
+        self.file_ids = file_ids
+        self.cache_limit = cache_limit
+        self.cache_file_limit = cache_file_limit
+        self._index = {}
+        self._cache = OrderedDict()  # имя -> bytes
+        self._cached_bytes = 0
+        self._catalog = MappingProxyType({})
+        self._catalog_mtime = None
+        self.hits = 0
+        self.misses = 0
+        self._apply(*self._scan())
+
+    @property
+    def catalog(self) -> MappingProxyType:
+        return self._catalog
+
+    def get(self, asset_id: str) -> Asset:
+        return self._catalog.get(asset_id)
+
+    def available(self, asset_id: str) -> bool:
+        asset = self._catalog.get(asset_id)
+        return asset is not None and asset.file in self._index
+
+    def cached_bytes(self) -> int:
+        return self._cached_bytes
+
+    async def read(self, name: str) -> bytes:
+        """Содержимое файла из data/: из памяти или чтением в отдельном потоке"""
+        content = self._cache.get(name)
+        if content is not None:
+            self._cache.move_to_end(name)
+            self.hits += 1
+            return content
+        self.misses += 1
+        entry = self._index[name]
+        content = await asyncio.to_thread(
+            _read_bytes, os.path.join(self.data_dir, name)
+        )
+        if len(content) <= self.cache_file_limit and self._index.get(name) == entry:
+            self._remember(name, content)
+        return content
+
+    async def send(self, asset_id: str, bot, chat_id: int, **kwargs):
+        """Отправляет документ каталога в чат, повторно - по file_id"""
+        asset = self._catalog[asset_id]
+        method, param, extract_file_id = _SENDERS[asset.kind]
+        send_method = getattr(bot, method)
+        options = {"chat_id": chat_id, "caption": asset.caption, **kwargs}
+        if asset.filename:
+            options["filename"] = asset.filename
+
+        def send_func(media):
+            return send_method(**{param: media}, **options)
+
+        entry = self._index[asset.file]
+        if self.file_ids is None:
+            return await send_func(await self.read(asset.file))
+        return await self.file_ids.send_hashed(
+            entry.sha256,
+            lambda: self.read(asset.file),
+            send_func,
+            extract_file_id,
+            asset.file,
+        )
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Фоновая проверка изменений файлов и каталога"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = await asyncio.to_thread(self._scan)
+            except OSError as e:
+                logger.error(f"Папка {self.data_dir} не просканирована: {e}")
+                continue
+            self._apply(*changes)
+
+    def _scan(self) -> tuple:
+        """Выполняется в отдельном потоке: новый индекс и, если файл изменился, каталог"""
+        index = scan_directory(self.data_dir, self._index)
+        mtime = None
+        try:
+            mtime = os.stat(self.catalog_path).st_mtime_ns
+            if mtime == self._catalog_mtime:
+                return index, None, mtime
+            with open(self.catalog_path, encoding="utf-8") as f:
+                return index, load_catalog(json.load(f)), mtime
+        except (OSError, ValueError, TypeError) as e:
+            if self._catalog_mtime is None:
+                raise
+            if mtime != self._catalog_mtime:
+                logger.error(
+                    f"Каталог {self.catalog_path} не загружен, оставлен старый: {e}"
+                )
+            return index, None, mtime or self._catalog_mtime
+
+    def _apply(self, index: dict, catalog, catalog_mtime) -> None:
+        # Выполняется в event loop: кэш меняется только из одного потока
+        for name, entry in self._index.items():
+            if index.get(name) != entry:
+                self._forget(name)
+                if self.file_ids is not None:
+                    self.file_ids.forget(entry.sha256)
+                logger.info(f"Файл {name} изменён или удалён")
+        self._index = index
+        self._catalog_mtime = catalog_mtime
+        if catalog is not None:
+            self._catalog = catalog
+            missing = [a.file for a in catalog.values() if a.file not in index]
+            logger.info(f"Каталог загружен: документов {len(catalog)}")
+            if missing:
+                logger.warning(f"В {self.data_dir} нет файлов: {', '.join(missing)}")
+
+    def _remember(self, name: str, content: bytes) -> None:
+        self._forget(name)
+        self._cache[name] = content
+        self._cached_bytes += len(content)
+        while self._cached_bytes > self.cache_limit:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+
+    def _forget(self, name: str) -> None:
+        content = self._cache.pop(name, None)
+        if content is not None:
+            self._cached_bytes -= len(content)
@@ -0,0 +1,263 @@
+"""
+Вложения пользователей: потоковая загрузка из Telegram на диск и потоковая
+MIME-кодировка при отправке письма
+
+Файл целиком никогда не находится в памяти: загрузка пишется на диск кусками
+по chunk_size, при отправке письма файл читается кусками и сразу кодируется в
+base64 (см. StreamedMessage).
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from email.message import EmailMessage
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from email.policy import SMTP
+from email.utils import formatdate, make_msgid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# 57 байт дают ровно одну строку base64 из 76 символов
+_B64_CHUNK = 57 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    """Файл или все вложения обращения превышают допустимый размер"""
+
+
+@dataclass
+class Attachment:
+    path: str
+    filename: str
+    mime_type: str
+    size: int
+    caption: str = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.0f} МБ"
+
+
+class AttachmentSpool:
+    """Временное хранилище вложений в spool_dir.
+
+    Файлы пользователя копятся в u<user_id>/, пока он не отправит текст
+    обращения; take() переносит их в отдельную папку письма, которую можно
+    удалить после доставки. Папка может быть общей для нескольких процессов.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        max_file_size: int = 10 * 1024 * 1024,
+        max_total_size: int = 18 * 1024 * 1024,
+        downloads: int = 4,
+        chunk_size: int = CHUNK_SIZE,
+        timeout: float = 60,
+    ):
+        self.spool_dir = spool_dir
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # Одновременные загрузки ограничены: память не растёт с числом пользователей
+        self._downloads = asyncio.Semaphore(downloads)
+        self._client = None
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.spool_dir, f"u{user_id}")
+
+    def pending(self, user_id: int) -> list:
+        """Вложения, ожидающие текста обращения, в порядке загрузки"""
+        user_dir = self._user_dir(user_id)
+        try:
+            names = sorted(n for n in os.listdir(user_dir) if n.endswith(".json"))
+        except FileNotFoundError:
+            return []
+        attachments = []
+        for name in names:
+            with open(os.path.join(user_dir, name), encoding="utf-8") as f:
+                attachments.append(Attachment(**json.load(f)))
+        return attachments
+
+    def check(self, user_id: int, size: int) -> None:
+        """Бросает AttachmentTooLarge, если файл размера size не поместится"""
+        if size and size > self.max_file_size:
+            raise AttachmentTooLarge(
+                f"Файл больше {_mb(self.max_file_size)}, его нельзя отправить"
+            )
+        used = sum(a.size for a in self.pending(user_id))
+        if used + (size or 0) > self.max_total_size:
+            raise AttachmentTooLarge(
+                f"Вложения одного обращения не должны превышать "
+                f"{_mb(self.max_total_size)}"
+            )
+
+    async def download(
+        self,
+        user_id: int,
+        url: str,
+        filename: str,
+        mime_type: str,
+        size: int = None,
+        caption: str = None,
+    ) -> Attachment:
+        """Загружает файл по url кусками прямо на диск"""
+        await asyncio.to_thread(self.check, user_id, size)
+        user_dir = self._user_dir(user_id)
+        await asyncio.to_thread(os.makedirs, user_dir, exist_ok=True)
+        file_path = os.path.join(user_dir, f"{time.time_ns()}.bin")
+        limit = min(
+            self.max_file_size,
+            self.max_total_size
+            - sum(a.size for a in await asyncio.to_thread(self.pending, user_id)),
+        )
+        received = 0
+        async with self._downloads:
+            f = await asyncio.to_thread(open, file_path, "wb")
+            try:
+                async with self.client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        received += len(chunk)
+                        if received > limit:
+                            # Telegram мог не сообщить размер заранее
+                            raise AttachmentTooLarge(
+                                f"Файл больше {_mb(limit)}, его нельзя отправить"
+                            )
+                        await asyncio.to_thread(f.write, chunk)
+            except BaseException:
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(_remove, file_path)
+                raise
+            await asyncio.to_thread(f.close)
+
+        attachment = Attachment(file_path, filename, mime_type, received, caption)
+        await asyncio.to_thread(self._save_meta, attachment)
+        return attachment
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def take(self, user_id: int) -> list:
+        """Забирает ожидающие вложения пользователя в отдельную папку письма"""
+        attachments = self.pending(user_id)
+        if not attachments:
+            return []
+        mail_dir = os.path.join(self.spool_dir, f"m{uuid.uuid4().hex}")
+        os.replace(self._user_dir(user_id), mail_dir)
+        for attachment in attachments:
+            attachment.path = os.path.join(mail_dir, os.path.basename(attachment.path))
+        return attachments
+
+    def discard(self, user_id: int) -> None:
+        shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+
+    def remove(self, attachments: list) -> None:
+        """Удаляет папки доставленного письма; attachments - словари из outbox"""
+        root = os.path.realpath(self.spool_dir)
+        for directory in {
+            os.path.dirname(os.path.realpath(a["path"])) for a in attachments
+        }:
+            if os.path.dirname(directory) == root:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def purge(self, max_age: float) -> int:
+        """Удаляет вложения пользователей, так и не отправивших обращение"""
+        removed = 0
+        deadline = time.time() - max_age
+        with os.scandir(self.spool_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("u") and entry.stat().st_mtime < deadline:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+    async def watch(self, max_age: float, interval: float = 3600) -> None:
+        """Фоновая очистка брошенных вложений"""
+        while True:
+            removed = await asyncio.to_thread(self.purge, max_age)
+            if removed:
+                logger.info(f"Удалены брошенные вложения пользователей: {removed}")
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _save_meta(self, attachment: Attachment) -> None:
+        meta_path = os.path.splitext(attachment.path)[0] + ".json"
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(attachment.to_dict(), f, ensure_ascii=False)
+
+
+def _remove(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+class StreamedMessage:
+    """Письмо с вложениями, которое отправляется кусками без сборки в памяти.
+
+    attachments - словари Attachment.to_dict(). chunks() можно вызывать
+    повторно: файлы перечитываются с диска.
+    """
+
+    def __init__(
+        self, sender: str, recipients: list, subject: str, body: str, attachments: list
+    ):
+        self.sender = sender
+        self.recipients = recipients
+        self.subject = subject
+        self.body = body
+        self.attachments = attachments
+
+    def chunks(self):
+        """Байты письма с окончаниями строк CRLF, каждый кусок - целые строки"""
+        boundary = f"=={uuid.uuid4().hex}=="
+        headers = EmailMessage(policy=SMTP)
+        headers["From"] = self.sender
+        headers["To"] = ", ".join(self.recipients)
+        headers["Subject"] = self.subject
+        headers["Date"] = formatdate(localtime=True)
+        headers["Message-ID"] = make_msgid()
+        headers["MIME-Version"] = "1.0"
+        headers["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+        # Заголовки без тела: as_bytes() дописал бы пустую multipart-часть
+        yield b"".join(SMTP.fold_binary(k, v) for k, v in headers.items()) + b"\r\n"
+        yield f"--{boundary}\r\n".encode()
+        yield MIMEText(self.body, "plain", "utf-8").as_bytes(policy=SMTP)
+        for attachment in self.attachments:
+            yield f"\r\n--{boundary}\r\n".encode()
+            maintype, _, subtype = attachment["mime_type"].partition("/")
+            part = MIMEBase(maintype or "application", subtype or "octet-stream")
+            part.add_header(
+                "Content-Disposition", "attachment", filename=attachment["filename"]
+            )
+            part["Content-Transfer-Encoding"] = "base64"
+            part.set_payload("")
+            yield part.as_bytes(policy=SMTP)
+            with open(attachment["path"], "rb") as f:
+                while chunk := f.read(_B64_CHUNK):
+                    yield base64.encodebytes(chunk).replace(b"\n", b"\r\n")
+        yield f"\r\n--{boundary}--\r\n".encode()
@@ -0,0 +1,187 @@
+"""
+Локальные заменители Telegram Bot API и SMTP-сервера для нагрузочных тестов
+
+FakeBotAPI отвечает на запросы python-telegram-bot (getUpdates, sendMessage,
+editMessageText, sendPhoto, sendDocument...) и отдаёт апдейты, добавленные
+через push(). SMTPSink принимает письма с настраиваемой задержкой ответа на DATA.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "TgProbot",
+    "username": "tgprobot_bench_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+# Методы, которыми бот отвечает пользователю
+REPLY_METHODS = frozenset(
+    {"sendMessage", "editMessageText", "sendPhoto", "sendDocument"}
+)
+
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, token, method):
+        params = {
+            name: self.get_body_argument(name) for name in self.request.body_arguments
+        }
+        result = await self.api.handle(method, params)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": result}))
+
+
+class FakeBotAPI:
+    """Bot API на 127.0.0.1: апдейты из очереди, ответы фиксируются по chat_id"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.port = None
+        self.calls = Counter()
+        self._updates = deque()
+        self._has_updates = asyncio.Event()
+        self._waiters = {}
+        self._ids = itertools.count(1)
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self) -> None:
+        app = tornado.web.Application(
+            [(r"/bot([^/]+)/(\w+)", _MethodHandler, {"api": self})]
+        )
+        sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        self._server = tornado.httpserver.HTTPServer(app)
+        self._server.add_sockets(sockets)
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.stop()
+            await self._server.close_all_connections()
+
+    def push(self, update: dict) -> None:
+        self._updates.append(update)
+        self._has_updates.set()
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        """Future с моментом (perf_counter) следующего ответа бота в чат"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = waiter
+        return waiter
+
+    def forget(self, chat_id: int) -> None:
+        self._waiters.pop(chat_id, None)
+
+    async def handle(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return BOT_USER
+        if method in REPLY_METHODS:
+            chat_id = int(params["chat_id"])
+            waiter = self._waiters.pop(chat_id, None)
+            if waiter and not waiter.done():
+                waiter.set_result(time.perf_counter())
+            return self._message(method, chat_id)
+        return True
+
+    async def _get_updates(self, params: dict) -> list:
+        if not self._updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(
+                    self._has_updates.wait(), float(params.get("timeout", 0))
+                )
+            except asyncio.TimeoutError:
+                return []
+        limit = int(params.get("limit", 100))
+        return [self._updates.popleft() for _ in range(min(limit, len(self._updates)))]
+
+    def _message(self, method: str, chat_id: int) -> dict:
+        message_id = next(self._ids)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        file_ref = {"file_id": f"file-{message_id}", "file_unique_id": f"u{message_id}"}
+        if method == "sendPhoto":
+            message["photo"] = [dict(file_ref, width=800, height=600)]
+        elif method == "sendDocument":
+            message["document"] = file_ref
+        else:
+            message["text"] = "ok"
+        return message
+
+
+class SMTPSink:
+    """Минимальный SMTP-сервер без TLS: принимает AUTH PLAIN и любые письма"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.port = None
+        self.received = 0
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._session, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _session(self, reader, writer) -> None:
+        def reply(*lines):
+            writer.write("".join(line + "\r\n" for line in lines).encode())
+
+        reply("220 sink ESMTP")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    reply("250-sink", "250-AUTH PLAIN LOGIN", "250 8BITMIME")
+                elif command == b"AUTH":
+                    reply("235 2.7.0 Authentication successful")
+                elif command == b"DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b""):
+                        pass
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    self.received += 1
+                    reply("250 2.0.0 Ok: queued")
+                elif command == b"QUIT":
+                    reply("221 2.0.0 Bye")
+                    break
+                elif command in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                    reply("250 2.0.0 Ok")
+                else:
+                    reply("502 5.5.2 Command not recognized")
+                await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
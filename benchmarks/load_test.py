@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: настоящий Application из main.py против локальных Bot API и SMTP
+
+Тысячи пользователей одновременно проходят по меню (/start, разделы, документы)
+и отправляют обращение. Каждый пользователь ждёт ответа бота перед следующим
+шагом, задержка считается от выдачи апдейта в getUpdates-очередь до ответа
+бота в чат. Фейковые серверы и пользователи работают в отдельном потоке со
+своим event loop, чтобы не отнимать его у бота.
+
+    python benchmarks/load_test.py --users 2000 --smtp-latency 0.3
+    python benchmarks/load_test.py --users 2000 --compare benchmarks/results/base.json
+
+Результат сохраняется в benchmarks/results/ в JSON; --compare сравнивает с
+прошлым прогоном и завершается с кодом 1 при регрессии больше --max-regression %.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fakes import FakeBotAPI, SMTPSink
+from webhook_harness import make_callback_update, make_message_update
+
+TOKEN = "123456:LOAD-TEST"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Путь пользователя: каждый шаг даёт ровно один ответ бота в чат
+SCENARIO = (
+    ("message", "/start"),
+    ("callback", "menu:psychologists"),
+    ("callback", "menu:main"),
+    ("callback", "menu:social_pedagogues"),
+    ("callback", "menu:documents"),
+    ("callback", "doc:guide"),
+    ("callback", "doc:application"),
+    ("message", "✉️ Написать сообщение"),
+    ("message", "Нагрузочный тест: прошу связаться со мной"),
+)
+MAILS_PER_ROUND = 1
+
+
+class BackgroundLoop:
+    """Event loop в отдельном потоке для фейковых серверов и пользователей"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="load-test-fakes", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    async def call(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        return await asyncio.wrap_future(future)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def import_bot(args, state_dir: str, smtp_port: int):
+    """Импортирует main.py с настройками стенда"""
+    unlimited = "1000000"
+    os.environ.update(
+        TOKEN=TOKEN,
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=str(smtp_port),
+        EMAIL_USER="bench@localhost",
+        EMAIL_PASSWORD="bench",
+        EMAIL_TO="specialists@localhost",
+        STATE_DIR=state_dir,
+        METRICS_PORT="0",
+        SESSION_BACKEND=args.sessions,
+        MAIL_WORKERS=str(args.mail_workers),
+        UPDATE_CONCURRENCY=str(args.concurrency),
+        BOT_API_GLOBAL_RATE="30" if args.telegram_limits else unlimited,
+        BOT_API_CHAT_RATE="1" if args.telegram_limits else unlimited,
+    )
+    # .env разработчика не должен перекрыть настройки стенда
+    import dotenv
+
+    dotenv.load_dotenv = lambda *a, **kw: False
+    os.chdir(ROOT)  # main.py ищет data/ относительно текущей папки
+
+    import main
+    from smtp_pool import SMTPPool, SMTPRelays
+
+    logging.getLogger().setLevel(args.log_level)
+    main.smtp_pool = SMTPRelays(
+        [
+            SMTPPool(
+                "127.0.0.1",
+                smtp_port,
+                main.EMAIL_USER,
+                main.EMAIL_PASSWORD,
+                max_size=args.mail_workers,
+                use_ssl=False,
+            )
+        ]
+    )
+    return main
+
+
+async def simulate_user(api, user_id, args, update_ids, stats) -> None:
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    for _ in range(args.rounds):
+        for kind, payload in SCENARIO:
+            update_id = next(update_ids)
+            if kind == "message":
+                update = make_message_update(update_id, user_id, payload)
+            else:
+                update = make_callback_update(update_id, user_id, payload)
+            waiter = api.expect(user_id)
+            sent = time.perf_counter()
+            api.push(update)
+            try:
+                replied = await asyncio.wait_for(waiter, args.step_timeout)
+                stats["latencies"].append(replied - sent)
+            except asyncio.TimeoutError:
+                api.forget(user_id)
+                stats["timeouts"] += 1
+            if args.think:
+                await asyncio.sleep(random.uniform(0, 2 * args.think))
+
+
+async def drive_users(api, args) -> dict:
+    stats = {"latencies": [], "timeouts": 0}
+    update_ids = itertools.count(1)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            simulate_user(api, 100000 + n, args, update_ids, stats)
+            for n in range(args.users)
+        )
+    )
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+async def wait_for_mail(sink, expected: int, timeout: float) -> float:
+    started = time.perf_counter()
+    while sink.received < expected and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    fakes = BackgroundLoop()
+    fakes.start()
+    api = FakeBotAPI(latency=args.api_latency)
+    sink = SMTPSink(latency=args.smtp_latency)
+    await fakes.call(api.start())
+    await fakes.call(sink.start())
+
+    state_dir = tempfile.mkdtemp(prefix="tgprobot-load-")
+    main = import_bot(args, state_dir, sink.port)
+    from telegram.ext import Application
+
+    application = main.build_application(
+        TOKEN, Application.builder().base_url(api.base_url)
+    )
+    await application.initialize()
+    await main.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+    await application.start()
+
+    print(f"Пользователей: {args.users}, шагов на пользователя: {len(SCENARIO)}")
+    stats = await fakes.call(drive_users(api, args))
+    expected_mails = args.users * args.rounds * MAILS_PER_ROUND
+    drain = await fakes.call(wait_for_mail(sink, expected_mails, args.drain_timeout))
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await main.post_shutdown(application)
+    await fakes.call(api.stop())
+    await fakes.call(sink.stop())
+    fakes.stop()
+
+    ms = sorted(x * 1000 for x in stats["latencies"])
+    quantiles = statistics.quantiles(ms, n=100) if len(ms) > 1 else ms * 99
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "users",
+                "rounds",
+                "think",
+                "ramp",
+                "concurrency",
+                "mail_workers",
+                "sessions",
+                "api_latency",
+                "smtp_latency",
+                "telegram_limits",
+            )
+        },
+        "updates": len(ms),
+        "timeouts": stats["timeouts"],
+        "errors": main.ERRORS.total(),
+        "elapsed": round(stats["elapsed"], 3),
+        "updates_per_sec": round(len(ms) / stats["elapsed"], 1),
+        "latency_ms": {
+            "p50": round(quantiles[49], 2),
+            "p95": round(quantiles[94], 2),
+            "p99": round(quantiles[98], 2),
+            "max": round(ms[-1], 2) if ms else None,
+        },
+        "mails": {
+            "expected": expected_mails,
+            "delivered": sink.received,
+            "drain_seconds": round(drain, 2),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "api_calls": dict(api.calls),
+    }
+
+
+def report(result: dict) -> None:
+    latency = result["latency_ms"]
+    mails = result["mails"]
+    print(
+        f"Апдейтов: {result['updates']} за {result['elapsed']:.2f} с "
+        f"({result['updates_per_sec']:.0f}/с), таймаутов: {result['timeouts']}, "
+        f"ошибок: {result['errors']:.0f}"
+    )
+    print(
+        f"Задержка: p50={latency['p50']:.1f} мс  p95={latency['p95']:.1f} мс  "
+        f"p99={latency['p99']:.1f} мс  max={latency['max']:.1f} мс"
+    )
+    print(
+        f"Письма: {mails['delivered']}/{mails['expected']}, "
+        f"дослано за {mails['drain_seconds']:.1f} с после последнего апдейта"
+    )
+    print(f"Пиковая память процесса: {result['peak_rss_mb']} МБ")
+
+
+def compare(result: dict, baseline_path: str, max_regression: float) -> bool:
+    """Печатает сравнение с прошлым прогоном; False - есть регрессия"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = [
+        ("updates_per_sec", baseline["updates_per_sec"], result["updates_per_sec"], 1),
+        ("p50, мс", baseline["latency_ms"]["p50"], result["latency_ms"]["p50"], -1),
+        ("p95, мс", baseline["latency_ms"]["p95"], result["latency_ms"]["p95"], -1),
+        ("p99, мс", baseline["latency_ms"]["p99"], result["latency_ms"]["p99"], -1),
+        ("peak_rss_mb", baseline["peak_rss_mb"], result["peak_rss_mb"], -1),
+    ]
+    print(f"Сравнение с {baseline_path} ({baseline.get('revision')}):")
+    ok = True
+    for name, old, new, better in rows:
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        regressed = change * better < -max_regression
+        ok = ok and not regressed
+        mark = " <- регрессия" if regressed else ""
+        print(f"  {name:16} {old:>10} -> {new:>10} ({change:+.1f}%){mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=1, help="Проходов сценария")
+    parser.add_argument(
+        "--think", type=float, default=0.0, help="Пауза между шагами, с"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=1.0, help="Разгон пользователей, с"
+    )
+    parser.add_argument("--step-timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="UPDATE_CONCURRENCY"
+    )
+    parser.add_argument("--mail-workers", type=int, default=2)
+    parser.add_argument("--sessions", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0, help="Задержка Bot API, с"
+    )
+    parser.add_argument(
+        "--smtp-latency", type=float, default=0.0, help="Задержка DATA, с"
+    )
+    parser.add_argument(
+        "--telegram-limits",
+        action="store_true",
+        help="Включить реальные лимиты отправки (30/с на бота, 1/с на чат)",
+    )
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Файл результата (по умолчанию в results/)")
+    parser.add_argument("--compare", help="Результат прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="%%")
+    args = parser.parse_args()
+    # Бот запускается из корня репозитория, пути считаются от исходной папки
+    for name in ("output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    result = asyncio.run(run(args))
+    report(result)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load_test-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранён: {output}")
+
+    if args.compare and not compare(result, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
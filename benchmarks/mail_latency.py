@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: задержка обработки апдейтов во время отправки почты
+
+Сравнивает старую схему (smtplib прямо в event loop) с почтовой очередью.
+SMTP имитируется блокирующим sleep, Telegram - короткими корутинами.
+
+    python benchmarks/mail_latency.py --smtp-delay 0.5 --emails 10 --workers 2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mailer import MailQueue
+from outbox import Outbox
+
+
+def make_slow_smtp(delay: float):
+    def send(subject: str, body: str) -> bool:
+        time.sleep(delay)  # Имитация рукопожатия TLS, login и send_message
+        return True
+
+    return send
+
+
+async def measure_updates(count: int, interval: float) -> list:
+    """Имитирует поток апдейтов и возвращает задержку обработки каждого"""
+    latencies = []
+
+    async def handle(scheduled: float):
+        latencies.append(time.perf_counter() - scheduled)
+
+    # Задержка считается от момента, когда апдейт должен был прийти по расписанию
+    tasks = []
+    start = time.perf_counter()
+    for i in range(count):
+        scheduled = start + i * interval
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(handle(scheduled)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def run_inline(args) -> list:
+    send = make_slow_smtp(args.smtp_delay)
+
+    async def blocking_mail():
+        for i in range(args.emails):
+            await asyncio.sleep(args.duration / args.emails)
+            send("bench", str(i))
+
+    mail = asyncio.create_task(blocking_mail())
+    latencies = await measure_updates(args.updates, args.duration / args.updates)
+    await mail
+    return latencies
+
+
+async def run_queue(args) -> list:
+    queue = MailQueue(make_slow_smtp(args.smtp_delay), Outbox(), workers=args.workers)
+    await queue.start()
+
+    async def queued_mail():
+        for i in range(args.emails):
+            await asyncio.sleep(args.duration / args.emails)
+            await queue.submit("bench", str(i))
+
+    mail = asyncio.create_task(queued_mail())
+    latencies = await measure_updates(args.updates, args.duration / args.updates)
+    await mail
+    while queue.qsize():
+        await asyncio.sleep(0.05)
+    await queue.stop()
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(
+        f"{name:<8} p50={statistics.median(ms):8.2f} мс  "
+        f"p95={p95:8.2f} мс  max={ms[-1]:8.2f} мс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--smtp-delay", type=float, default=0.5)
+    parser.add_argument("--emails", type=int, default=10)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    print(
+        f"SMTP {args.smtp_delay} с x {args.emails} писем, "
+        f"{args.updates} апдейтов за {args.duration} с"
+    )
+    report("inline", asyncio.run(run_inline(args)))
+    report("queue", asyncio.run(run_queue(args)))
+
+
+if __name__ == "__main__":
+    main()
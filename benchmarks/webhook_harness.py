@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Отправка синтетических апдейтов на webhook запущенного бота
+
+Бот должен работать в режиме BOT_MODE=webhook. Скрипт имитирует Telegram:
+шлёт POST с JSON апдейтами и заголовком X-Telegram-Bot-Api-Secret-Token,
+затем печатает пропускную способность и задержку приёма апдейтов.
+
+    python benchmarks/webhook_harness.py --url http://127.0.0.1:8443/telegram \\
+        --secret $WEBHOOK_SECRET --updates 1000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+CALLBACKS = ("psychologists", "psycho_tests", "social_pedagogues", "documents", "back")
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Студент {user_id}"}
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "TgProbot"},
+                "text": "menu",
+            },
+        },
+    }
+
+
+def synthetic_updates(count: int, users: int, first_id: int = 1):
+    """Смесь /start, кнопки главного меню и нажатий inline-кнопок"""
+    callbacks = itertools.cycle(CALLBACKS)
+    for n in range(count):
+        update_id, user_id = first_id + n, 100000 + n % users
+        kind = n % 4
+        if kind == 0:
+            yield make_message_update(update_id, user_id, "/start")
+        elif kind == 1:
+            yield make_message_update(update_id, user_id, "🚀 Главное меню 🚀")
+        else:
+            yield make_callback_update(update_id, user_id, next(callbacks))
+
+
+async def post_updates(args) -> tuple:
+    latencies, statuses = [], Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    headers = {SECRET_HEADER: args.secret}
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        # Проверка: апдейт с неверным секретом должен быть отклонён
+        bad = await client.post(
+            args.url,
+            json=make_message_update(0, 1, "/start"),
+            headers={SECRET_HEADER: "wrong"},
+        )
+        print(f"Неверный секрет -> HTTP {bad.status_code}")
+
+        async def post(update):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(args.url, json=update, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(post(u) for u in synthetic_updates(args.updates, args.users))
+        )
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    latencies, statuses, elapsed = asyncio.run(post_updates(args))
+    ms = sorted(x * 1000 for x in latencies)
+    print(f"Апдейтов: {len(ms)} за {elapsed:.2f} с ({len(ms) / elapsed:.0f}/с)")
+    print(f"Ответы: {dict(statuses)}")
+    print(
+        f"p50={statistics.median(ms):.2f} мс  "
+        f"p95={ms[int(len(ms) * 0.95) - 1]:.2f} мс  max={ms[-1]:.2f} мс"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Массовые рассылки всем пользователям бота
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram.error import BadRequest, Forbidden
+
+from rate_limiter import BULK
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+
+
+class ChatRegistry:
+    """Постоянный реестр чатов пользователей и состояния рассылок (SQLite).
+
+    Рассылку ведёт один процесс (owner), пока продлевает аренду на lease
+    секунд; рассылку упавшего процесса продолжает другой.
+    """
+
+    def __init__(self, db_path: str = ":memory:", owner: str = "", lease: float = 300):
+        self.owner = owner
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chats ("
+            "chat_id INTEGER PRIMARY KEY, active INTEGER NOT NULL DEFAULT 1, "
+            "first_seen REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, "
+            "status TEXT NOT NULL, checkpoint INTEGER NOT NULL DEFAULT 0, "
+            "sent INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+            "pruned INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(broadcasts)")}
+        for column, definition in (
+            ("owner", "TEXT NOT NULL DEFAULT ''"),
+            ("lease_until", "REAL NOT NULL DEFAULT 0"),
+        ):
+            if column not in columns:
+                self._db.execute(
+                    f"ALTER TABLE broadcasts ADD COLUMN {column} {definition}"
+                )
+        # Активные чаты в памяти, чтобы не писать в базу на каждом апдейте
+        self._known = {
+            row[0] for row in self._db.execute("SELECT chat_id FROM chats WHERE active")
+        }
+
+    def is_known(self, chat_id: int) -> bool:
+        return chat_id in self._known
+
+    def remember(self, chat_id: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO chats (chat_id, first_seen) VALUES (?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET active = 1",
+                (chat_id, time.time()),
+            )
+        self._known.add(chat_id)
+
+    def deactivate(self, chat_ids: list) -> None:
+        with self._lock:
+            self._db.executemany(
+                "UPDATE chats SET active = 0 WHERE chat_id = ?",
+                [(chat_id,) for chat_id in chat_ids],
+            )
+        self._known.difference_update(chat_ids)
+
+    def active_count(self) -> int:
+        return len(self._known)
+
+    def chats_after(self, chat_id: int, limit: int) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chat_id FROM chats WHERE active AND chat_id > ? "
+                "ORDER BY chat_id LIMIT ?",
+                (chat_id, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def create_broadcast(self, text: str) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO broadcasts "
+                "(text, status, checkpoint, created, owner, lease_until) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                # Идентификаторы групп отрицательные, рассылка идёт по всем
+                (text, RUNNING, -(2**63), now, self.owner, now + self.lease),
+            )
+            return cur.lastrowid
+
+    def claim_broadcast(self, broadcast_id: int) -> bool:
+        """Забирает рассылку, если она своя или аренда другого процесса истекла"""
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE broadcasts SET owner = ?, lease_until = ? "
+                "WHERE id = ? AND status = ? AND (owner = ? OR lease_until < ?)",
+                (self.owner, now + self.lease, broadcast_id, RUNNING, self.owner, now),
+            )
+            return cur.rowcount == 1
+
+    def broadcast(self, broadcast_id: int) -> dict:
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)
+            )
+            row = cur.fetchone()
+            names = [d[0] for d in cur.description]
+        return dict(zip(names, row)) if row else None
+
+    def release_broadcasts(self, broadcast_ids: list) -> None:
+        """Снимает аренду, чтобы другой процесс сразу продолжил рассылки"""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE broadcasts SET lease_until = 0 WHERE id = ? AND owner = ?",
+                [(broadcast_id, self.owner) for broadcast_id in broadcast_ids],
+            )
+
+    def unfinished_broadcasts(self) -> list:
+        """Незавершённые рассылки, которые может продолжить этот процесс"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM broadcasts WHERE status = ? "
+                "AND (owner = ? OR lease_until < ?) ORDER BY id",
+                (RUNNING, self.owner, time.time()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_progress(
+        self, broadcast_id: int, checkpoint: int, sent: int, failed: int, pruned: int
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE broadcasts SET checkpoint = ?, sent = sent + ?, "
+                "failed = failed + ?, pruned = pruned + ?, lease_until = ? "
+                "WHERE id = ?",
+                (
+                    checkpoint,
+                    sent,
+                    failed,
+                    pruned,
+                    time.time() + self.lease,
+                    broadcast_id,
+                ),
+            )
+
+    def finish_broadcast(self, broadcast_id: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE broadcasts SET status = ? WHERE id = ?", (DONE, broadcast_id)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class Broadcaster:
+    """Рассылает сообщение всем активным чатам пачками с сохранением прогресса.
+
+    Скорость ограничивает планировщик Bot API: рассылка идёт с приоритетом
+    BULK и не мешает ответам пользователям. После прерывания рассылка
+    продолжается с последней сохранённой пачки.
+    """
+
+    def __init__(self, bot, registry: ChatRegistry, batch_size: int = 25):
+        self.bot = bot
+        self.registry = registry
+        self.batch_size = batch_size
+        self._tasks = {}
+
+    def start(self, broadcast_id: int, on_done=None) -> asyncio.Task:
+        task = asyncio.create_task(
+            self.run(broadcast_id, on_done), name=f"broadcast-{broadcast_id}"
+        )
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+        return task
+
+    async def resume_unfinished(self) -> None:
+        for broadcast_id in await asyncio.to_thread(
+            self.registry.unfinished_broadcasts
+        ):
+            if broadcast_id in self._tasks:
+                continue
+            if not await asyncio.to_thread(self.registry.claim_broadcast, broadcast_id):
+                continue  # Рассылку уже забрал другой процесс
+            logger.info(f"Продолжение прерванной рассылки #{broadcast_id}")
+            self.start(broadcast_id)
+
+    async def watch(self, interval: float) -> None:
+        """Подхватывает рассылки процессов, переставших продлевать аренду"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resume_unfinished()
+            except Exception as e:
+                logger.error(f"Проверка прерванных рассылок: {e}")
+
+    async def stop(self) -> None:
+        running = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if running:
+            await asyncio.to_thread(self.registry.release_broadcasts, running)
+
+    async def run(self, broadcast_id: int, on_done=None) -> dict:
+        info = await asyncio.to_thread(self.registry.broadcast, broadcast_id)
+        text, checkpoint = info["text"], info["checkpoint"]
+        total = self.registry.active_count()
+        started = time.monotonic()
+        done = 0
+        while True:
+            chats = await asyncio.to_thread(
+                self.registry.chats_after, checkpoint, self.batch_size
+            )
+            if not chats:
+                break
+            results = await asyncio.gather(
+                *(self._send(chat_id, text) for chat_id in chats)
+            )
+            pruned = [chat_id for chat_id, r in zip(chats, results) if r == "pruned"]
+            if pruned:
+                await asyncio.to_thread(self.registry.deactivate, pruned)
+            checkpoint = chats[-1]
+            await asyncio.to_thread(
+                self.registry.save_progress,
+                broadcast_id,
+                checkpoint,
+                results.count("sent"),
+                results.count("failed"),
+                len(pruned),
+            )
+            done += len(chats)
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Рассылка #{broadcast_id}: {done}/{total}, "
+                f"{done / elapsed if elapsed else 0:.1f} сообщ./с"
+            )
+        await asyncio.to_thread(self.registry.finish_broadcast, broadcast_id)
+        info = await asyncio.to_thread(self.registry.broadcast, broadcast_id)
+        info["elapsed"] = time.monotonic() - started
+        logger.info(
+            f"Рассылка #{broadcast_id} завершена: отправлено {info['sent']}, "
+            f"ошибок {info['failed']}, удалено чатов {info['pruned']}, "
+            f"за {info['elapsed']:.1f} с"
+        )
+        if on_done:
+            await on_done(info)
+        return info
+
+    async def _send(self, chat_id: int, text: str) -> str:
+        try:
+            await self.bot.send_message(chat_id, text, rate_limit_args=BULK)
+            return "sent"
+        except Forbidden:
+            return "pruned"  # Пользователь заблокировал бота или удалён
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                return "pruned"
+            logger.error(f"Рассылка в чат {chat_id}: {e}")
+            return "failed"
+        except Exception as e:
+            logger.error(f"Рассылка в чат {chat_id}: {e.__class__.__name__}: {e}")
+            return "failed"
@@ -0,0 +1,37 @@
+"""
+Сводные письма (дайджесты) для режима пакетной отправки почты
+"""
+
+DEFAULT_URGENT_KEYWORDS = (
+    "срочно",
+    "суицид",
+    "насилие",
+    "угроз",
+    "помогите",
+    "травл",
+)
+
+
+def parse_keywords(raw: str) -> tuple:
+    """Разбирает список ключевых слов из строки вида "срочно, угроза" """
+    if not raw:
+        return DEFAULT_URGENT_KEYWORDS
+    return tuple(word.strip().lower() for word in raw.split(",") if word.strip())
+
+
+def is_urgent(text: str, keywords=DEFAULT_URGENT_KEYWORDS) -> bool:
+    """Срочные сообщения отправляются сразу, минуя дайджест"""
+    text = (text or "").lower()
+    return any(word in text for word in keywords)
+
+
+def build_digest(items: list) -> tuple:
+    """Собирает несколько писем из outbox в одно: возвращает (subject, body)"""
+    count = len(items)
+    subject = f"Сводка обращений из Telegram ({count})"
+    parts = [f"Обращений в сводке: {count}", ""]
+    for n, item in enumerate(items, 1):
+        parts.append(f"===== Обращение {n} из {count}: {item.subject} =====")
+        parts.extend(line.strip() for line in item.body.strip().splitlines())
+        parts.append("")
+    return subject, "\n".join(parts)
@@ -0,0 +1,267 @@
+"""
+Автоответы на частые вопросы: база data/faq.json, инвертированный индекс по
+основам слов, собирается один раз при загрузке
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from telegram import InlineKeyboardMarkup
+
+from menus import _inline_button
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[а-яёa-z0-9]+")
+_VOWEL = re.compile(r"[аеиоуыэюя]")
+
+# Служебные слова ничего не говорят о теме вопроса
+STOP_WORDS = frozenset(
+    """
+    а без бы в вам вас ваш вечер во вот все всё вы где да день для до добрый его
+    ее её если есть еще ещё же за здравствуйте и из или им к как какой какие
+    какая каком ко когда кто ли мне мной можно мы на нам не нет ни но ну нужен
+    нужна нужно нужны о об от по под подскажите пожалуйста при про с скажите со
+    спасибо так также то тоже у уже утро хочу что чтобы это эта этот я
+    """.split()
+)
+
+# Окончания стеммера Портера для русского языка (Snowball).
+# Группы с (?<=[ая]) удаляются только после «а» или «я»
+_PERFECTIVE = re.compile(r"(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$")
+_REFLEXIVE = re.compile(r"(ся|сь)$")
+_ADJECTIVAL = re.compile(
+    r"(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))?"
+    r"(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых"
+    r"|ую|юю|ая|яя|ою|ею)$"
+)
+_VERB = re.compile(
+    r"(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят"
+    r"|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю"
+    r"|(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$"
+)
+_NOUN = re.compile(
+    r"(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам"
+    r"|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_DERIVATIONAL = re.compile(r"(ост|ость)$")
+_SUPERLATIVE = re.compile(r"(ейше|ейш)$")
+
+
+def _region(word: str) -> int:
+    """Начало R1/R2: позиция после первой согласной, следующей за гласной"""
+    match = re.search(r"[аеиоуыэюя][^аеиоуыэюя]", word)
+    return match.end() if match else len(word)
+
+
+def stem(word: str) -> str:
+    """Основа слова по алгоритму Портера для русского языка"""
+    word = word.lower().replace("ё", "е")
+    vowel = _VOWEL.search(word)
+    if vowel is None:
+        return word
+    start = vowel.end()
+    head, rv = word[:start], word[start:]
+
+    match = _PERFECTIVE.search(rv)
+    if match:
+        rv = rv[: match.start()]
+    else:
+        rv = _REFLEXIVE.sub("", rv, count=1)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            match = pattern.search(rv)
+            if match:
+                rv = rv[: match.start()]
+                break
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    r1 = _region(head + rv)
+    r2 = r1 + _region((head + rv)[r1:])
+    match = _DERIVATIONAL.search(rv)
+    if match and len(head) + match.start() >= r2:
+        rv = rv[: match.start()]
+
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        match = _SUPERLATIVE.search(rv)
+        if match:
+            rv = rv[: match.start()]
+            if rv.endswith("нн"):
+                rv = rv[:-1]
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+    return head + rv
+
+
+def terms(text: str) -> list:
+    """Основы значимых слов текста в порядке появления"""
+    return [
+        stem(word)
+        for word in _WORD.findall(text.lower().replace("ё", "е"))
+        if word not in STOP_WORDS
+    ]
+
+
+@dataclass(frozen=True)
+class FAQEntry:
+    id: str
+    questions: tuple
+    answer: str
+    reply_markup: InlineKeyboardMarkup = None
+
+
+@dataclass(frozen=True)
+class Match:
+    entry: FAQEntry
+    # Косинусная близость запроса и самой похожей формулировки вопроса, 0..1
+    score: float
+
+
+class FAQIndex:
+    """Инвертированный индекс формулировок вопросов.
+
+    Каждая формулировка - отдельный документ с весами tf-idf; запрос
+    сравнивается по косинусу только с документами, где есть хотя бы одна его
+    основа. Незнакомые слова запроса получают наибольший вес и снижают
+    уверенность: «записаться к стоматологу» не совпадёт с записью к психологу.
+    """
+
+    def __init__(self, entries: list):
+        self.entries = tuple(entries)
+        documents = []  # (номер записи, множество основ)
+        for number, entry in enumerate(self.entries):
+            for question in entry.questions:
+                stems = set(terms(question))
+                if stems:
+                    documents.append((number, stems))
+        total = len(documents)
+        frequency = {}
+        for _, stems in documents:
+            for term in stems:
+                frequency[term] = frequency.get(term, 0) + 1
+        self._idf = MappingProxyType(
+            {t: math.log((total + 1) / (df + 1)) + 1 for t, df in frequency.items()}
+        )
+        self._unknown_idf = math.log(total + 1) + 1
+        postings = {}
+        self._documents = []  # (номер записи, норма вектора)
+        for doc_id, (number, stems) in enumerate(documents):
+            norm = math.sqrt(sum(self._idf[t] ** 2 for t in stems))
+            self._documents.append((number, norm))
+            for term in stems:
+                postings.setdefault(term, []).append(doc_id)
+        self._postings = MappingProxyType({t: tuple(d) for t, d in postings.items()})
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, text: str, limit: int = 3) -> list:
+        """Лучшие записи для текста по убыванию близости: [Match]"""
+        stems = set(terms(text))
+        if not stems:
+            return []
+        scores = {}
+        query_norm = 0.0
+        for term in stems:
+            idf = self._idf.get(term)
+            if idf is None:
+                query_norm += self._unknown_idf**2
+                continue
+            query_norm += idf**2
+            for doc_id in self._postings[term]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf**2
+        query_norm = math.sqrt(query_norm)
+        best = {}  # номер записи -> лучшая близость среди её формулировок
+        for doc_id, dot in scores.items():
+            number, norm = self._documents[doc_id]
+            score = dot / (norm * query_norm)
+            if score > best.get(number, 0.0):
+                best[number] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return [Match(self.entries[n], round(s, 4)) for n, s in ranked[:limit]]
+
+
+def compile_faq(data: list) -> FAQIndex:
+    entries = []
+    for spec in data:
+        rows = [[_inline_button(b) for b in row] for row in spec.get("buttons", [])]
+        entries.append(
+            FAQEntry(
+                id=spec["id"],
+                questions=tuple(spec["questions"]),
+                answer=spec["answer"],
+                reply_markup=InlineKeyboardMarkup(rows) if rows else None,
+            )
+        )
+    return FAQIndex(entries)
+
+
+class FAQ:
+    """Хранит индекс базы вопросов и подменяет его при изменении файла.
+
+    Без файла автоответы отключены. Ответ даётся, только если близость
+    лучшей записи не ниже min_score и она опережает следующую запись на
+    min_margin: на неоднозначный вопрос лучше ответит специалист.
+    """
+
+    def __init__(self, faq_path: str, min_score: float = 0.5, min_margin: float = 0.1):
+        self.faq_path = faq_path
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self._mtime = None
+        self._index = FAQIndex([])
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def match(self, text: str):
+        """Уверенный ответ на текст или None"""
+        matches = self._index.search(text, limit=2)
+        if not matches or matches[0].score < self.min_score:
+            return None
+        if len(matches) > 1 and matches[0].score - matches[1].score < self.min_margin:
+            return None
+        return matches[0]
+
+    def reload(self) -> bool:
+        """Перечитывает базу. При ошибке остаётся прежний индекс"""
+        mtime = None
+        try:
+            mtime = os.stat(self.faq_path).st_mtime_ns
+            with open(self.faq_path, encoding="utf-8") as f:
+                index = compile_faq(json.load(f))
+        except FileNotFoundError:
+            if self._mtime is None:
+                logger.warning(f"{self.faq_path} не найден, автоответы отключены")
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"База вопросов {self.faq_path} не загружена: {e}")
+            self._mtime = mtime or self._mtime  # Не повторять ошибку до новой правки
+            return False
+        self._index = index
+        self._mtime = mtime
+        logger.info(f"База вопросов загружена: записей {len(index)}")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.faq_path).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self._mtime and self.reload()
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Фоновая проверка изменений базы вопросов"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload_if_changed)
@@ -0,0 +1,92 @@
+"""
+Проверки работоспособности бота для /healthz и /readyz
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Собирает состояние процесса без сетевых запросов.
+
+    Задержка event loop измеряется фоновой задачей watch_loop(), остальные
+    показатели - функциями, зарегистрированными через add_check и add_info.
+    Проверки liveness определяют /healthz, проверки readiness добавляются к
+    ним в /readyz.
+    """
+
+    def __init__(self, max_loop_lag: float = 5.0, lag_window: int = 30):
+        self.max_loop_lag = max_loop_lag
+        self.started = time.monotonic()
+        self.loop_lag = 0.0
+        # Последние замеры: блокировка видна в отчёте и после её окончания
+        self._lags = deque(maxlen=lag_window)
+        self.ready = False
+        self._liveness = {}
+        self._readiness = {}
+        self._info = {}
+
+    def add_check(self, name: str, func, readiness: bool = False) -> None:
+        """func() -> bool; False делает проверку неуспешной"""
+        (self._readiness if readiness else self._liveness)[name] = func
+
+    def add_info(self, name: str, func) -> None:
+        """func() -> значение для отчёта, на результат не влияет"""
+        self._info[name] = func
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started
+
+    async def watch_loop(self, interval: float = 1.0) -> None:
+        """Измеряет, насколько позже положенного просыпается event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - started - interval)
+            self._lags.append(self.loop_lag)
+            if self.loop_lag > self.max_loop_lag:
+                logger.warning(f"Event loop заблокирован на {self.loop_lag:.2f} с")
+
+    def max_recent_lag(self) -> float:
+        return max(self._lags, default=self.loop_lag)
+
+    def liveness(self) -> tuple:
+        return self._report(self._liveness)
+
+    def readiness(self) -> tuple:
+        checks = dict(self._liveness)
+        checks.update(self._readiness)
+        checks["started"] = lambda: self.ready
+        return self._report(checks)
+
+    def _report(self, checks: dict) -> tuple:
+        report = {
+            "uptime": round(self.uptime(), 1),
+            "loop_lag_ms": round(self.loop_lag * 1000, 2),
+            "loop_lag_max_ms": round(self.max_recent_lag() * 1000, 2),
+        }
+        failed = []
+        if self.max_recent_lag() > self.max_loop_lag:
+            failed.append("loop_lag")
+        for name, check in checks.items():
+            try:
+                ok = check()
+            except Exception as e:
+                logger.error(f"Проверка {name} завершилась ошибкой: {e}")
+                ok = False
+            if not ok:
+                failed.append(name)
+        for name, func in self._info.items():
+            try:
+                report[name] = func()
+            except Exception as e:
+                report[name] = f"error: {e}"
+        report["status"] = "fail" if failed else "ok"
+        if failed:
+            report["failed"] = failed
+        return not failed, report
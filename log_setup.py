@@ -0,0 +1,180 @@
+"""
+Асинхронное структурированное логирование
+
+Обработчики и потоки только кладут записи в очередь, форматирование и запись
+в stdout/файл выполняет отдельный поток QueueListener.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями из extra
+_RECORD_FIELDS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+    | {"message", "asctime"}
+)
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener = None
+_log_bodies = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от стандартного prepare, трассировка не вклеивается в текст
+        # сообщения, а форматирование целиком остаётся потоку записи
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING для указанных логгеров.
+
+    rates: {"имя логгера": доля}, доля 0.1 - одна запись из десяти. Правило
+    логгера действует и на дочерние логгеры. Предупреждения и ошибки не
+    прореживаются.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._counters = {}
+        self.dropped = 0
+
+    def _rate(self, name: str):
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition(".")[0]
+        return None, None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rule, rate = self._rate(record.name)
+        if rule is None or rate >= 1:
+            return True
+        count = self._counters.get(rule, 0)
+        self._counters[rule] = count + 1
+        if rate > 0 and count % round(1 / rate) == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+def parse_levels(value: str) -> dict:
+    """'httpx=WARNING,main=DEBUG' -> {'httpx': 'WARNING', 'main': 'DEBUG'}"""
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def parse_rates(value: str) -> dict:
+    """'telegram.ext=0.1' -> {'telegram.ext': 0.1}"""
+    return {name: float(rate) for name, rate in parse_levels(value).items() if rate}
+
+
+def redact(text: str) -> str:
+    """Текст пользователя для лога: по умолчанию только длина"""
+    if _log_bodies or text is None:
+        return text
+    return f"<скрыто, {len(text)} симв.>"
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    log_file: str = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    levels: dict = None,
+    sample: dict = None,
+    log_bodies: bool = False,
+) -> logging.handlers.QueueListener:
+    """Направляет корневой логгер в очередь и запускает поток записи"""
+    global _listener, _log_bodies
+    _log_bodies = log_bodies
+    if _listener is not None:
+        return _listener
+
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        # Ротация ограничивает размер ./logs при любой нагрузке
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    if sample:
+        # Прореживание до очереди: отброшенные записи ничего не стоят потоку записи
+        queue_handler.addFilter(SamplingFilter(sample))
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(queue_handler)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Дописывает записи из очереди и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, _QueueHandler):
+                root.removeHandler(handler)
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,127 @@
+"""
+Сторож event loop: задержка планирования и стеки блокирующего кода
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Файлы стандартной библиотеки и установленных пакетов не считаются местом
+# блокировки, если в стеке есть код бота
+_LIBRARY_PATHS = tuple(
+    {
+        os.path.normcase(os.path.abspath(p))
+        for p in (sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"])
+    }
+)
+
+
+def blocking_site(stack: traceback.StackSummary) -> str:
+    """Самый глубокий кадр кода бота: 'main.py:123 send_email_sync'"""
+    for frame in reversed(stack):
+        filename = os.path.normcase(os.path.abspath(frame.filename))
+        if not filename.startswith(_LIBRARY_PATHS):
+            break
+    else:
+        frame = stack[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class LoopWatchdog:
+    """Следит за event loop из отдельного потока.
+
+    Корутина heartbeat() отмечается каждые interval секунд и записывает
+    задержку своего пробуждения. Поток-сторож видит, что отметка не
+    обновлялась дольше threshold, снимает стек потока event loop и сообщает
+    место блокировки: в лог (стек - при первом появлении места) и в метрики.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.05,
+        lag_histogram=None,
+        block_histogram=None,
+        block_counter=None,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag_histogram = lag_histogram
+        self.block_histogram = block_histogram
+        self.block_counter = block_counter
+        self.sites = {}  # место блокировки -> количество
+        self._beat = None
+        self._reported_beat = None
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def start(self) -> None:
+        """Вызывается из event loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self.heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - self._beat - self.interval)
+            self._beat = now
+            if self.lag_histogram:
+                self.lag_histogram.observe(lag)
+            if lag > self.threshold and self.block_histogram:
+                self.block_histogram.observe(lag)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            # Одна блокировка - одно сообщение, сколько бы она ни длилась
+            if stalled > self.threshold and beat != self._reported_beat:
+                self._reported_beat = beat
+                self._report(stalled)
+
+    def _report(self, stalled: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        site = blocking_site(stack)
+        count = self.sites.get(site, 0) + 1
+        self.sites[site] = count
+        if self.block_counter:
+            self.block_counter.inc(site)
+        if count == 1:
+            logger.warning(
+                f"Event loop заблокирован дольше {stalled * 1000:.0f} мс в {site}\n"
+                + "".join(stack.format()),
+                extra={"blocking_site": site},
+            )
+        else:
+            logger.warning(
+                f"Event loop заблокирован дольше {stalled * 1000:.0f} мс в {site} "
+                f"(раз: {count})",
+                extra={"blocking_site": site},
+            )
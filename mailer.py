@@ -0,0 +1,285 @@
+"""
+Асинхронная очередь исходящей почты для TgProbot
+"""
+
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from digest import build_digest
+from outbox import DEAD, PENDING, Outbox
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentError(Exception):
+    """Письмо отклонено сервером окончательно (5xx), повтор не поможет"""
+
+
+class MailQueue:
+    """Очередь писем поверх Outbox с пулом воркеров, работающих вне event loop"""
+
+    def __init__(
+        self,
+        send_func,
+        outbox: Outbox,
+        workers: int = 2,
+        maxsize: int = 0,
+        max_attempts: int = 8,
+        max_age: float = 3 * 86400,
+        backoff_base: float = 5.0,
+        backoff_max: float = 1800.0,
+        digest_window: float = 0.0,
+        digest_max: int = 20,
+        poll_interval: float = None,
+        on_sent=None,
+    ):
+        # send_func - блокирующая функция (subject, body) -> bool; для писем
+        # с вложениями вызывается как (subject, body, attachments).
+        # False - временный сбой (SMTP недоступен): письмо повторяется, пока
+        # оно не старше max_age. PermanentError - письмо сразу откладывается
+        # (dead). Прочие исключения - ошибки кода, после max_attempts таких
+        # попыток письмо откладывается
+        self._send_func = send_func
+        self._outbox = outbox
+        self._workers = max(1, workers)
+        self._maxsize = maxsize
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Режим дайджеста: обычные письма копятся digest_window секунд или до
+        # digest_max штук и уходят одним письмом, срочные отправляются сразу
+        self.digest_window = digest_window
+        self.digest_max = max(1, digest_max)
+        # Outbox общий с другими процессами: их письма появляются без wakeup,
+        # поэтому outbox перечитывается не реже poll_interval секунд
+        self.poll_interval = poll_interval
+        # on_sent(item) выполняется в потоке после доставки, например удаляет
+        # файлы вложений
+        self._on_sent = on_sent
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._executor = None
+        self._tasks = []
+        self._depth = 0
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+        # Отложенных писем в outbox, включая оставшиеся от прошлых запусков
+        self.dead_in_outbox = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def qsize(self) -> int:
+        """Количество недоставленных писем (в outbox и в работе)"""
+        return self._depth
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        replayed = await asyncio.to_thread(self._outbox.requeue_sending)
+        self._depth = await asyncio.to_thread(self._outbox.count)
+        self.dead_in_outbox = await asyncio.to_thread(self._outbox.count, DEAD)
+        if self._depth:
+            logger.info(
+                f"В outbox найдено недоставленных писем: {self._depth} "
+                f"(прерванных отправок: {replayed})"
+            )
+        if self.dead_in_outbox:
+            logger.warning(
+                f"В outbox отложенных писем: {self.dead_in_outbox}, "
+                f"вернуть их в очередь - requeue_dead()"
+            )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="mail"
+        )
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"mail-worker-{n}")
+            for n in range(self._workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._scheduler(), name="mail-drainer"))
+        logger.info(f"Почтовая очередь запущена, воркеров: {self._workers}")
+
+    @property
+    def digest_enabled(self) -> bool:
+        return self.digest_window > 0
+
+    async def submit(
+        self, subject: str, body: str, urgent: bool = False, attachments: list = None
+    ) -> int:
+        """Записывает письмо в outbox и будит отправителя. Бросает asyncio.QueueFull"""
+        if self._maxsize and self._depth >= self._maxsize:
+            raise asyncio.QueueFull
+        delay = 0.0 if urgent or not self.digest_enabled else self.digest_window
+        item_id = await asyncio.to_thread(
+            self._outbox.add, subject, body, delay, urgent, attachments
+        )
+        self._depth += 1
+        if delay:
+            await asyncio.to_thread(self._flush_full_digest)
+        self._wakeup.set()
+        return item_id
+
+    def _flush_full_digest(self) -> None:
+        # Набралось digest_max писем - сводку можно отправлять, не дожидаясь окна
+        if self._outbox.count(PENDING, urgent=False) >= self.digest_max:
+            self._outbox.hurry(urgent=False)
+
+    async def requeue_dead(self) -> int:
+        """Возвращает отложенные письма в очередь (например, после исправления
+        настроек)"""
+        count = await asyncio.to_thread(self._outbox.requeue_dead)
+        self._depth += count
+        self.dead_in_outbox = max(0, self.dead_in_outbox - count)
+        self._wakeup.set()
+        return count
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Дожидается текущих отправок (не дольше timeout) и гасит воркеров.
+
+        Неотправленные письма остаются в outbox и будут отправлены после запуска.
+        """
+        if not self.running:
+            return
+        scheduler = self._tasks.pop()
+        scheduler.cancel()
+        await asyncio.gather(scheduler, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Отправка писем не завершилась за {timeout} с")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        logger.info(
+            f"Почтовая очередь остановлена: отправлено {self.sent}, "
+            f"ошибок {self.failed}, отброшено {self.dead}, в outbox {self._depth}"
+        )
+
+    def backoff(self, attempts: int) -> float:
+        """Задержка перед следующей попыткой: экспонента с небольшим разбросом"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.0)
+
+    async def _scheduler(self) -> None:
+        capacity = self._workers * 2
+        while True:
+            self._wakeup.clear()
+            if self.poll_interval:
+                self._depth = await asyncio.to_thread(self._outbox.count)
+            free = capacity - self._queue.qsize()
+            if free > 0:
+                await self._dispatch(free)
+            if self._queue.qsize() >= capacity:
+                timeout = None  # Ждём, пока освободится воркер
+            else:
+                next_due = await asyncio.to_thread(self._outbox.next_due)
+                timeout = None if next_due is None else max(0.0, next_due - time.time())
+            if self.poll_interval:
+                timeout = (
+                    self.poll_interval
+                    if timeout is None
+                    else min(timeout, self.poll_interval)
+                )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, free: int) -> None:
+        # Каждое задание в очереди - список писем, уходящих одним SMTP-сообщением
+        if not self.digest_enabled:
+            items = await asyncio.to_thread(self._outbox.claim, free)
+            for item in items:
+                self._queue.put_nowait([item])
+            return
+        urgent = await asyncio.to_thread(self._outbox.claim, free, None, True)
+        for item in urgent:
+            self._queue.put_nowait([item])
+        if len(urgent) < free:
+            batch = await asyncio.to_thread(
+                self._outbox.claim, self.digest_max, None, False
+            )
+            if batch and len(batch) < self.digest_max:
+                # Окно отсчитывается от самого старого письма: когда оно
+                # истекло, в сводку идут и более поздние письма этого окна
+                await asyncio.to_thread(self._outbox.hurry, False, True)
+                batch += await asyncio.to_thread(
+                    self._outbox.claim, self.digest_max - len(batch), None, False
+                )
+            if batch:
+                self._queue.put_nowait(batch)
+
+    async def _worker(self, n: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if len(job) == 1:
+                subject, body = job[0].subject, job[0].body
+            else:
+                subject, body = build_digest(job)
+            # Вложения всех обращений сводки уходят в одном письме
+            args = (subject, body)
+            attachments = [a for item in job for a in item.attachments]
+            if attachments:
+                args += (attachments,)
+            try:
+                permanent = counted = False
+                try:
+                    ok = await loop.run_in_executor(
+                        self._executor, self._send_func, *args
+                    )
+                    error = "" if ok else "отправка не удалась"
+                except PermanentError as e:
+                    ok, error, permanent = False, f"отклонено: {e}", True
+                except Exception as e:
+                    logger.error(f"Воркер почты {n}: {e.__class__.__name__}: {e}")
+                    ok, error, counted = False, f"{e.__class__.__name__}: {e}", True
+                for item in job:
+                    await self._finish(item, ok, error, permanent, counted)
+            finally:
+                self._queue.task_done()
+                self._wakeup.set()
+
+    async def _finish(
+        self, item, ok: bool, error: str, permanent: bool = False, counted: bool = False
+    ) -> None:
+        attempts = item.attempts + 1
+        # Сбой SMTP или разомкнутая цепь не тратят попытки: такое письмо
+        # откладывается, только если ждёт дольше max_age
+        expired = item.created and time.time() - item.created > self.max_age
+        if ok:
+            await asyncio.to_thread(self._outbox.mark_sent, item.id)
+            if self._on_sent:
+                try:
+                    await asyncio.to_thread(self._on_sent, item)
+                except Exception as e:
+                    logger.error(f"Письмо #{item.id}: ошибка после отправки: {e}")
+            self.sent += 1
+            self._depth -= 1
+        elif permanent or expired or (counted and attempts >= self.max_attempts):
+            await asyncio.to_thread(self._outbox.mark_dead, item.id, error)
+            self.dead += 1
+            self.dead_in_outbox += 1
+            self._depth -= 1
+            logger.error(
+                f"Письмо #{item.id} «{item.subject}» не доставлено "
+                f"после {attempts} попыток и отложено: {error}"
+            )
+        else:
+            delay = self.backoff(attempts)
+            retry_at = time.time() + delay
+            await asyncio.to_thread(self._outbox.retry_later, item.id, retry_at, error)
+            self.failed += 1
+            logger.warning(
+                f"Письмо #{item.id}: попытка {attempts} не удалась, "
+                f"повтор через {delay:.0f} с"
+            )
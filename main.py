@@ -1,18 +1,14 @@
 from os import getenv, path
 import logging
-from telegram import (
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    Update,
-    ReplyKeyboardMarkup,
-    KeyboardButton,
-)
+from telegram import Update
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 import smtplib
@@ -20,14 +16,61 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 import sys
+import asyncio
+import json
+import socket
+import time
 from dotenv import load_dotenv
+from assets import AssetManager, FileIdCache
+from attachments import AttachmentSpool, AttachmentTooLarge, StreamedMessage
+from broadcast import Broadcaster, ChatRegistry
+from digest import is_urgent, parse_keywords
+from faq import FAQ
+from health import HealthMonitor
+from loop_watchdog import LoopWatchdog
+from log_setup import parse_levels, parse_rates, redact, setup_logging
+from mailer import MailQueue, PermanentError
+from menus import MenuRegistry
+from metrics import MetricsServer, Registry, timed
+from rate_limiter import OutboundScheduler
+from router import CallbackRouter
+from sessions import create_session_store
+from update_journal import (
+    DEDUP_WINDOW,
+    UpdateJournal,
+    drain_pending,
+    replay_unfinished,
+)
+from update_processor import PerUserUpdateProcessor
+from outbox import Outbox
+from shutdown import GracefulShutdown
+from smtp_pool import (
+    CircuitBreaker,
+    CircuitOpenError,
+    SMTPPool,
+    SMTPRelays,
+    is_message_error,
+    parse_relays,
+)
+from submission_limits import SubmissionLimits, fingerprint, format_wait, parse_limits
 
 # Загрузка переменных окружения
 load_dotenv(override=True)
 
-# Настройка логирования
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+# Настройка логирования: запись в отдельном потоке, JSON по умолчанию
+LOG_FILE = getenv("LOG_FILE")
+if LOG_FILE:
+    os.makedirs(path.dirname(LOG_FILE) or ".", exist_ok=True)
+setup_logging(
+    level=getenv("LOG_LEVEL", "INFO"),
+    fmt=getenv("LOG_FORMAT", "json"),  # json или text
+    log_file=LOG_FILE,
+    max_bytes=int(float(getenv("LOG_FILE_MAX_MB", "10")) * 1024 * 1024),
+    backup_count=int(getenv("LOG_FILE_BACKUPS", "5")),
+    # httpx пишет INFO на каждый запрос к Bot API
+    levels=parse_levels(getenv("LOG_LEVELS", "httpx=WARNING")),
+    sample=parse_rates(getenv("LOG_SAMPLE", "")),
+    log_bodies=getenv("LOG_BODIES", "false").lower() == "true",
 )
 logger = logging.getLogger(__name__)
 
@@ -38,19 +81,99 @@ EMAIL_USER = getenv("EMAIL_USER")
 EMAIL_PASSWORD = getenv("EMAIL_PASSWORD")
 EMAIL_TO = getenv("EMAIL_TO")
 token_bot = getenv("TOKEN")
+MAIL_WORKERS = int(getenv("MAIL_WORKERS", "2"))
+MAIL_QUEUE_SIZE = int(getenv("MAIL_QUEUE_SIZE", "1000"))
+SMTP_POOL_SIZE = int(getenv("SMTP_POOL_SIZE", str(MAIL_WORKERS)))
+# Резервные SMTP-серверы по порядку: smtps://логин:пароль@хост:порт,smtp://хост:порт
+SMTP_RELAYS = getenv("SMTP_RELAYS", "")
+SMTP_TIMEOUT = float(getenv("SMTP_TIMEOUT", "30"))
+# Ошибок подряд, после которых сервер пропускается, и пауза до его проверки, с
+SMTP_FAILURE_THRESHOLD = int(getenv("SMTP_FAILURE_THRESHOLD", "3"))
+SMTP_RESET_TIMEOUT = float(getenv("SMTP_RESET_TIMEOUT", "60"))
+SMTP_PROBE_INTERVAL = float(getenv("SMTP_PROBE_INTERVAL", "5"))
+MAIL_MAX_ATTEMPTS = int(getenv("MAIL_MAX_ATTEMPTS", "8"))
+# Сколько секунд письмо повторяется, пока SMTP недоступен
+MAIL_MAX_AGE = float(getenv("MAIL_MAX_AGE", str(3 * 86400)))
+MAIL_RETRY_BASE = float(getenv("MAIL_RETRY_BASE", "5"))
+MAIL_DIGEST_WINDOW = float(getenv("MAIL_DIGEST_WINDOW", "0"))  # 0 - без дайджестов
+MAIL_DIGEST_MAX = int(getenv("MAIL_DIGEST_MAX", "20"))
+MAIL_URGENT_KEYWORDS = parse_keywords(getenv("MAIL_URGENT_KEYWORDS", ""))
+MENU_RELOAD_INTERVAL = float(getenv("MENU_RELOAD_INTERVAL", "5"))
+# Автоответы из data/faq.json: минимальная близость вопроса (0..1), 0 - отключить
+FAQ_MIN_SCORE = float(getenv("FAQ_MIN_SCORE", "0.5"))
+# Кэш содержимого файлов data/ в памяти
+ASSET_CACHE_MB = float(getenv("ASSET_CACHE_MB", "16"))
+ASSET_CACHE_FILE_MB = float(getenv("ASSET_CACHE_FILE_MB", "2"))
+# Вложения обращений: лимит на файл и на все файлы одного обращения, МБ
+ATTACHMENT_MAX_MB = float(getenv("ATTACHMENT_MAX_MB", "10"))
+ATTACHMENT_TOTAL_MB = float(getenv("ATTACHMENT_TOTAL_MB", "18"))
+ATTACHMENT_DOWNLOADS = int(getenv("ATTACHMENT_DOWNLOADS", "4"))
+SESSION_BACKEND = getenv("SESSION_BACKEND", "sqlite")  # sqlite или memory
+SESSION_TTL = float(getenv("SESSION_TTL", "86400"))
+SESSION_MAX_USERS = int(getenv("SESSION_MAX_USERS", "100000"))
+# Обращений на пользователя: вид=количество/окно в секундах, 0 - без лимита.
+# message - письма специалистам, attachment - загрузки вложений
+SUBMISSION_LIMITS = parse_limits(
+    getenv("SUBMISSION_LIMITS", "message=5/3600,attachment=30/3600")
+)
+# Одинаковое обращение в пределах окна (с) не отправляется повторно
+SUBMISSION_DEDUP_WINDOW = float(getenv("SUBMISSION_DEDUP_WINDOW", "600"))
+# Сколько апдейтов разных пользователей обрабатывается одновременно
+UPDATE_CONCURRENCY = int(getenv("UPDATE_CONCURRENCY", "32"))
+# Сообщения, пролежавшие в очереди Telegram дольше (с), после перезапуска не
+# обрабатываются; 0 - обрабатывать все
+UPDATE_MAX_AGE = float(getenv("UPDATE_MAX_AGE", "10800"))
+# Лимиты отправки в Telegram: сообщений в секунду на бота и на один чат
+BOT_API_GLOBAL_RATE = float(getenv("BOT_API_GLOBAL_RATE", "30"))
+BOT_API_CHAT_RATE = float(getenv("BOT_API_CHAT_RATE", "1"))
+# Telegram ID администраторов через запятую: им доступна команда /broadcast
+ADMIN_IDS = {int(x) for x in getenv("ADMIN_IDS", "").split(",") if x.strip()}
+BROADCAST_BATCH_SIZE = int(getenv("BROADCAST_BATCH_SIZE", "25"))
+BOT_MODE = getenv("BOT_MODE", "polling")  # polling или webhook
+WEBHOOK_URL = getenv("WEBHOOK_URL")  # Публичный адрес, например https://bot.example.ru
+WEBHOOK_LISTEN = getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET")
+WEBHOOK_CERT = getenv("WEBHOOK_CERT")  # Только если TLS завершается в самом боте
+WEBHOOK_KEY = getenv("WEBHOOK_KEY")
+# Несколько процессов бота (только webhook) с общей папкой STATE_DIR
+SHARED_STATE = getenv("SHARED_STATE", "false").lower() == "true"
+REPLICA_ID = getenv("REPLICA_ID") or f"{socket.gethostname()}:{WEBHOOK_PORT}"
+MAIL_POLL_INTERVAL = float(getenv("MAIL_POLL_INTERVAL", "2"))
+# Метрики Prometheus и /healthz, /readyz: 0 - не запускать HTTP-сервер
+METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(getenv("METRICS_PORT", "8000"))
+# Бот нездоров, если getUpdates не завершался успешно дольше этого времени, с
+HEALTH_MAX_POLL_AGE = float(getenv("HEALTH_MAX_POLL_AGE", "120"))
+HEALTH_MAX_LOOP_LAG = float(getenv("HEALTH_MAX_LOOP_LAG", "5"))
+# Остановка по SIGTERM: общее время и время на завершение обработчиков, с.
+# Должно быть меньше stop_grace_period в docker-compose.yml
+SHUTDOWN_TIMEOUT = float(getenv("SHUTDOWN_TIMEOUT", "25"))
+SHUTDOWN_HANDLERS_TIMEOUT = float(getenv("SHUTDOWN_HANDLERS_TIMEOUT", "10"))
+# Блокировки event loop дольше порога пишутся в лог со стеком, 0 - отключить
+LOOP_BLOCK_THRESHOLD = float(getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
 
 # Проверка загрузки критических переменных будет при запуске в функции main()
 
 # Константы
 DATA_DIR = "./data"
+STATE_DIR = getenv("STATE_DIR", "./state")
 (
     MAIN_MENU,
     PSYCHOLOGISTS_MENU,
     SOCIAL_PEDAGOGUES_MENU,
     DOCUMENTS_MENU,
     AWAITING_MESSAGE,
-) = range(5)
-user_states = {}
+    # Пользователь получил автоответ: следующий текст уходит специалистам
+    FAQ_ANSWERED,
+) = range(6)
+MENU_STATES = {
+    "MAIN_MENU": MAIN_MENU,
+    "PSYCHOLOGISTS_MENU": PSYCHOLOGISTS_MENU,
+    "SOCIAL_PEDAGOGUES_MENU": SOCIAL_PEDAGOGUES_MENU,
+    "DOCUMENTS_MENU": DOCUMENTS_MENU,
+}
 
 # Проверяем существование папки data
 if not path.exists(DATA_DIR):
@@ -61,19 +184,61 @@ if not path.exists(DATA_DIR):
     except Exception as e:
         logger.error(f"Не удалось создать папку {DATA_DIR}: {e}")
 
+# Папка для состояния бота (outbox и т.п.), в отличие от data доступна на запись
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# Состояния пользователей: ограниченный размер, TTL, сохранение между перезапусками
+user_states = create_session_store(
+    SESSION_BACKEND,
+    path.join(STATE_DIR, "sessions.sqlite3"),
+    ttl=SESSION_TTL,
+    max_size=SESSION_MAX_USERS,
+    shared=SHARED_STATE,
+)
+
+# Частота обращений: в памяти процесса, при SHARED_STATE - у каждой реплики своя
+submission_limits = SubmissionLimits(
+    SUBMISSION_LIMITS, SUBMISSION_DEDUP_WINDOW, max_users=SESSION_MAX_USERS
+)
+
+metrics = Registry()
+HANDLER_LATENCY = metrics.histogram(
+    "tgprobot_handler_seconds", "Время работы обработчиков", ("handler",)
+)
+SMTP_PHASE_LATENCY = metrics.histogram(
+    "tgprobot_smtp_phase_seconds", "Время фаз отправки письма", ("phase",)
+)
+UPDATES = metrics.counter("tgprobot_updates_total", "Полученные апдейты", ("type",))
+ERRORS = metrics.counter(
+    "tgprobot_errors_total", "Ошибки, пойманные error_handler", ("error",)
+)
+LOOP_LAG = metrics.histogram(
+    "tgprobot_loop_lag_seconds", "Задержка пробуждения event loop"
+)
+LOOP_BLOCKS = metrics.histogram(
+    "tgprobot_loop_block_seconds", "Длительность блокировок event loop"
+)
+LOOP_BLOCK_SITES = metrics.counter(
+    "tgprobot_loop_blocked_total", "Блокировки event loop по месту", ("site",)
+)
+SUBMISSIONS_REJECTED = metrics.counter(
+    "tgprobot_submissions_rejected_total",
+    "Обращения, отклонённые лимитом частоты",
+    ("kind",),
+)
+FAQ_ANSWERS = metrics.counter(
+    "tgprobot_faq_answers_total", "Вопросы, получившие автоответ", ("entry",)
+)
+SUBMISSIONS_MERGED = metrics.counter(
+    "tgprobot_submissions_merged_total", "Повторные обращения, слитые с первым"
+)
+UPDATE_TYPES = ("message", "edited_message", "callback_query", "my_chat_member")
+
 
-async def send_email(subject: str, message_text: str) -> bool:
+def send_email_sync(subject: str, message_text: str, attachments: list = None) -> bool:
+    # Блокирующая отправка: вызывается только из потоков почтовой очереди
     try:
         # Проверяем, что все необходимые переменные загружены
-        logger.info("=" * 50)
-        logger.info("Попытка отправки email...")
-        logger.info(f"EMAIL_USER: {'✓' if EMAIL_USER else '✗'}")
-        logger.info(f"EMAIL_PASSWORD: {'✓ (скрыт)' if EMAIL_PASSWORD else '✗'}")
-        logger.info(f"EMAIL_TO: {EMAIL_TO if EMAIL_TO else '✗'}")
-        logger.info(f"EMAIL_HOST: {EMAIL_HOST}")
-        logger.info(f"EMAIL_PORT: {EMAIL_PORT}")
-        logger.info("=" * 50)
-
         if not all([EMAIL_USER, EMAIL_PASSWORD, EMAIL_TO, EMAIL_HOST, EMAIL_PORT]):
             logger.error("❌ Не все email настройки загружены!")
             missing = []
@@ -86,27 +251,45 @@ async def send_email(subject: str, message_text: str) -> bool:
             logger.error(f"Отсутствуют: {', '.join(missing)}")
             return False
 
-        msg = MIMEMultipart()
-        msg["From"] = EMAIL_USER
-        msg["To"] = EMAIL_TO
-        msg["Subject"] = subject
-        msg.attach(MIMEText(message_text, "plain", "utf-8"))
-
-        logger.info(f"Подключение к SMTP: {EMAIL_HOST}:{EMAIL_PORT}")
-
-        with smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT, timeout=30) as server:
-            logger.info("Аутентификация...")
-            server.login(EMAIL_USER, EMAIL_PASSWORD)
-            logger.info("Отправка сообщения...")
-            server.send_message(msg)
-            logger.info("✅ Email успешно отправлен!")
+        if attachments:
+            # Файлы кодируются при отправке кусками, письмо целиком в памяти не собирается
+            msg = StreamedMessage(
+                EMAIL_USER, [EMAIL_TO], subject, message_text, attachments
+            )
+        else:
+            msg = MIMEMultipart()
+            msg["From"] = EMAIL_USER
+            msg["To"] = EMAIL_TO
+            msg["Subject"] = subject
+            msg.attach(MIMEText(message_text, "plain", "utf-8"))
+
+        timings = smtp_pool.send(msg)
+        if not timings.reused:
+            SMTP_PHASE_LATENCY.observe(timings.connect, "connect")
+            SMTP_PHASE_LATENCY.observe(timings.auth, "auth")
+        SMTP_PHASE_LATENCY.observe(timings.send, "send")
+        logger.info(
+            f"✅ Email отправлен через {timings.relay or f'{EMAIL_HOST}:{EMAIL_PORT}'}",
+            extra={
+                "connect_ms": round(timings.connect * 1000),
+                "auth_ms": round(timings.auth * 1000),
+                "send_ms": round(timings.send * 1000),
+                "reused": timings.reused,
+            },
+        )
         return True
 
+    except CircuitOpenError as e:
+        logger.warning(f"Письмо отложено: {e}")
+        return False
     except smtplib.SMTPAuthenticationError as e:
         logger.error(f"❌ Ошибка аутентификации SMTP: {e}")
         logger.error("Проверьте правильность EMAIL_USER и EMAIL_PASSWORD")
         return False
     except smtplib.SMTPException as e:
+        if is_message_error(e):
+            logger.error(f"❌ Письмо отклонено SMTP-сервером: {e}")
+            raise PermanentError(str(e)) from e
         logger.error(f"❌ Ошибка SMTP: {e}")
         return False
     except Exception as e:
@@ -119,21 +302,134 @@ async def send_email(subject: str, message_text: str) -> bool:
         return False
 
 
+async def send_email(subject: str, message_text: str, attachments: list = None) -> bool:
+    # SMTP выполняется в отдельном потоке, чтобы не блокировать event loop
+    return await asyncio.to_thread(send_email_sync, subject, message_text, attachments)
+
+
+def create_smtp_pool(host: str, port: int, user: str, password: str, **kwargs):
+    breaker = CircuitBreaker(
+        SMTP_FAILURE_THRESHOLD, SMTP_RESET_TIMEOUT, name=f"SMTP {host}:{port}"
+    )
+    return SMTPPool(
+        host,
+        port,
+        user,
+        password,
+        max_size=SMTP_POOL_SIZE,
+        timeout=SMTP_TIMEOUT,
+        breaker=breaker,
+        **kwargs,
+    )
+
+
+# Основной сервер EMAIL_HOST и резервные из SMTP_RELAYS
+smtp_pool = SMTPRelays(
+    [create_smtp_pool(EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD)]
+    + parse_relays(SMTP_RELAYS, EMAIL_USER, EMAIL_PASSWORD, factory=create_smtp_pool)
+)
+outbound = OutboundScheduler(
+    global_rate=BOT_API_GLOBAL_RATE, chat_rate=BOT_API_CHAT_RATE
+)
+router = CallbackRouter()
+menus = MenuRegistry(path.join(DATA_DIR, "menus.json"), MENU_STATES)
+faq = FAQ(path.join(DATA_DIR, "faq.json"), min_score=FAQ_MIN_SCORE)
+file_id_cache = FileIdCache(path.join(STATE_DIR, "file_ids.json"))
+assets = AssetManager(
+    DATA_DIR,
+    path.join(DATA_DIR, "catalog.json"),
+    file_id_cache,
+    cache_limit=int(ASSET_CACHE_MB * 1024 * 1024),
+    cache_file_limit=int(ASSET_CACHE_FILE_MB * 1024 * 1024),
+)
+chat_registry = ChatRegistry(path.join(STATE_DIR, "chats.sqlite3"), owner=REPLICA_ID)
+outbox = Outbox(path.join(STATE_DIR, "outbox.sqlite3"), owner=REPLICA_ID)
+# Имя процесса в журнале нужно только с общим STATE_DIR: имя контейнера
+# меняется при пересоздании, а прерванные апдейты должны повториться
+update_journal = UpdateJournal(
+    path.join(STATE_DIR, "updates.sqlite3"), owner=REPLICA_ID if SHARED_STATE else ""
+)
+attachment_spool = AttachmentSpool(
+    path.join(STATE_DIR, "attachments"),
+    max_file_size=int(ATTACHMENT_MAX_MB * 1024 * 1024),
+    max_total_size=int(ATTACHMENT_TOTAL_MB * 1024 * 1024),
+    downloads=ATTACHMENT_DOWNLOADS,
+)
+mail_queue = MailQueue(
+    send_email_sync,
+    outbox,
+    workers=MAIL_WORKERS,
+    maxsize=MAIL_QUEUE_SIZE,
+    max_attempts=MAIL_MAX_ATTEMPTS,
+    max_age=MAIL_MAX_AGE,
+    backoff_base=MAIL_RETRY_BASE,
+    digest_window=MAIL_DIGEST_WINDOW,
+    digest_max=MAIL_DIGEST_MAX,
+    poll_interval=MAIL_POLL_INTERVAL if SHARED_STATE else None,
+    on_sent=lambda item: attachment_spool.remove(item.attachments),
+)
+metrics.gauge("tgprobot_mail_queue_depth", "Писем в очереди", mail_queue.qsize)
+metrics.gauge(
+    "tgprobot_mail_dead", "Отложенных писем в outbox", lambda: mail_queue.dead_in_outbox
+)
+metrics.gauge(
+    "tgprobot_bot_api_waiting", "Запросов к Bot API ждут лимита", outbound.depth
+)
+metrics.gauge(
+    "tgprobot_asset_cache_bytes", "Файлов data/ в памяти, байт", assets.cached_bytes
+)
+
+
+def poll_age():
+    """Секунды с последнего успешного getUpdates (None - ещё не было)"""
+    if outbound.last_poll is None:
+        return None
+    return time.monotonic() - outbound.last_poll
+
+
+def poll_fresh() -> bool:
+    if BOT_MODE == "webhook":
+        return True
+    age = poll_age()
+    # Первый long poll может длиться до timeout getUpdates
+    return (age if age is not None else health.uptime()) < HEALTH_MAX_POLL_AGE
+
+
+health = HealthMonitor(max_loop_lag=HEALTH_MAX_LOOP_LAG)
+shutdown = GracefulShutdown(SHUTDOWN_TIMEOUT, SHUTDOWN_HANDLERS_TIMEOUT)
+health.add_check("poll", poll_fresh)
+health.add_check(
+    "mail_queue", lambda: mail_queue.qsize() < MAIL_QUEUE_SIZE, readiness=True
+)
+health.add_info("mode", lambda: BOT_MODE)
+health.add_info(
+    "since_last_poll", lambda: None if poll_age() is None else round(poll_age(), 1)
+)
+health.add_info("mail_queue_depth", mail_queue.qsize)
+health.add_info("smtp_circuit", lambda: smtp_pool.breaker.state)
+health.add_info("smtp_relays", smtp_pool.status)
+metrics.gauge(
+    "tgprobot_event_loop_lag_seconds", "Задержка event loop", lambda: health.loop_lag
+)
+metrics.gauge(
+    "tgprobot_smtp_circuit_open",
+    "Цепь SMTP-сервера разомкнута",
+    lambda: {
+        (relay["relay"],): int(relay["state"] == CircuitBreaker.OPEN)
+        for relay in smtp_pool.status()
+    },
+    ("relay",),
+)
+
+
 # Убираем дублирующий print, так как он уже есть выше
 
 
 def get_main_reply_markup():
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("🚀 Главное меню 🚀")],
-            [KeyboardButton("✉️ Написать сообщение")],  # Основная кнопка для запросов
-        ],
-        resize_keyboard=True,
-        is_persistent=True,
-        input_field_placeholder="Выберите действие...",
-    )
+    return menus.keyboard("main")
 
 
+@timed(HANDLER_LATENCY, "start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     user_states[user_id] = MAIN_MENU
@@ -154,11 +450,79 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@timed(HANDLER_LATENCY, "handle_message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
 
-    if user_states.get(user_id) == AWAITING_MESSAGE:
+    state = user_states.get(user_id)
+    # Кнопки меню - раньше текста обращения: «Отмена» не уходит специалистам
+    if update.message.text == "🚀 Главное меню 🚀":
+        if state in (AWAITING_MESSAGE, FAQ_ANSWERED):
+            await asyncio.to_thread(attachment_spool.discard, user_id)
+        await show_main_menu(update)
+    elif update.message.text == "✉️ Написать сообщение":
+        # Лимит исчерпан - незачем просить текст, который не будет отправлен
+        wait = submission_limits.retry_after("message", user_id)
+        if wait:
+            await update.message.reply_text(
+                f"⏳ Вы отправили слишком много сообщений. "
+                f"Следующее можно будет отправить через {format_wait(wait)}.",
+                reply_markup=get_main_reply_markup(),
+            )
+            return
+        user_states[user_id] = AWAITING_MESSAGE
+        # Файлы прошлого незаконченного обращения не попадут в новое
+        await asyncio.to_thread(attachment_spool.discard, user_id)
+        await update.message.reply_text(
+            "✍️ **Отправьте ваше сообщение специалистам:**\n\n"
+            "📋 **Что указать в сообщении:**\n"
+            "• Ваше ФИО (если требуется обращение по имени)\n"
+            "• Контактный телефон (если нужен обратный звонок)\n"
+            "• Суть вашего вопроса или проблемы\n\n"
+            "📎 **Можно приложить фото или документы** - отправьте их до текста\n\n"
+            "📧 **Ваше сообщение будет автоматически отправлено специалистам**\n"
+            "✅ **Мы обработаем запрос и свяжемся с вами в ближайшее время!**",
+            reply_markup=menus.keyboard("cancel"),
+            parse_mode="Markdown",
+        )
+    elif update.message.text == "🔙 Отмена":
+        user_states[user_id] = MAIN_MENU
+        if state in (AWAITING_MESSAGE, FAQ_ANSWERED):
+            # Приложенные файлы отменяются вместе с обращением
+            await asyncio.to_thread(attachment_spool.discard, user_id)
+        await update.message.reply_text(
+            "Действие отменено", reply_markup=get_main_reply_markup()
+        )
+    elif state in (AWAITING_MESSAGE, FAQ_ANSWERED):
         user = update.message.from_user
+        pending = await asyncio.to_thread(attachment_spool.pending, user_id)
+        # Обращение с файлами или повторное после автоответа - специалистам
+        if state == AWAITING_MESSAGE and not pending:
+            if await answer_from_faq(update):
+                user_states[user_id] = FAQ_ANSWERED
+                await update.message.reply_text(
+                    "Если это не ответ на ваш вопрос, отправьте сообщение ещё раз - "
+                    "оно уйдёт специалистам.",
+                    reply_markup=menus.keyboard("cancel"),
+                )
+                return
+        key = fingerprint(
+            user_id, update.message.text, tuple((a.filename, a.size) for a in pending)
+        )
+        rejection = check_submission(user_id, key)
+        if rejection:
+            user_states[user_id] = MAIN_MENU
+            await asyncio.to_thread(attachment_spool.discard, user_id)
+            await update.message.reply_text(
+                rejection, reply_markup=get_main_reply_markup()
+            )
+            return
+        try:
+            attachments = await asyncio.to_thread(attachment_spool.take, user_id)
+        except OSError as e:
+            logger.error(f"Не удалось забрать вложения пользователя {user_id}: {e}")
+            attachments = []
+        attachments_text = describe_attachments(attachments)
         # Формируем контактные данные
         contact_info = []
         if user.first_name:
@@ -180,285 +544,316 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         СООБЩЕНИЕ:
         {update.message.text}
-
+        {attachments_text}
         ДОПОЛНИТЕЛЬНО:
         ID пользователя: {user.id}
         Дата отправки: {update.message.date}
         """
 
-        logger.info("Попытка отправки email...")
-        logger.info(f"Текст сообщения: {update.message.text}")
-
-        email_success = await send_email(subject, message)
-
-        if email_success:
-            logger.info("Email успешно отправлен на сервере")
+        logger.info(f"Обращение пользователя: {redact(update.message.text)}")
+
+        # Письмо сохраняется в outbox до ответа пользователю и не теряется при
+        # сбоях SMTP или перезапуске бота
+        try:
+            urgent = is_urgent(update.message.text, MAIL_URGENT_KEYWORDS)
+            await mail_queue.submit(
+                subject,
+                message,
+                urgent=urgent,
+                attachments=[a.to_dict() for a in attachments],
+            )
+            email_queued = True
+        except asyncio.QueueFull:
+            logger.error(f"Почтовая очередь переполнена ({mail_queue.qsize()})")
+            email_queued = False
+        except Exception as e:
+            logger.error(f"Не удалось записать письмо в outbox: {e}")
+            email_queued = False
+        if not email_queued:
+            # Повтор после ошибки - не дубль
+            submission_limits.duplicates.forget(key)
+            if attachments:
+                await asyncio.to_thread(
+                    attachment_spool.remove, [a.to_dict() for a in attachments]
+                )
+
+        if email_queued:
             await update.message.reply_text(
                 "✅ Ваше сообщение успешно отправлено! Сообщение обработают и свяжутся с вами, если для запроса это необходимо!",
                 reply_markup=get_main_reply_markup(),
             )
         else:
-            logger.error("Не удалось отправить email на сервере")
             await update.message.reply_text(
                 "❌ Произошла ошибка при отправке. Пожалуйста, попробуйте позже.",
                 reply_markup=get_main_reply_markup(),
             )
 
         user_states[user_id] = MAIN_MENU
-    elif update.message.text == "🚀 Главное меню 🚀":
-        await show_main_menu(update)
-    elif update.message.text == "✉️ Написать сообщение":
-        user_states[user_id] = AWAITING_MESSAGE
+    elif not await answer_from_faq(update):
         await update.message.reply_text(
-            "✍️ **Отправьте ваше сообщение специалистам:**\n\n"
-            "📋 **Что указать в сообщении:**\n"
-            "• Ваше ФИО (если требуется обращение по имени)\n"
-            "• Контактный телефон (если нужен обратный звонок)\n"
-            "• Суть вашего вопроса или проблемы\n\n"
-            "📧 **Ваше сообщение будет автоматически отправлено специалистам**\n"
-            "✅ **Мы обработаем запрос и свяжемся с вами в ближайшее время!**",
-            reply_markup=ReplyKeyboardMarkup(
-                [[KeyboardButton("🔙 Отмена")]], resize_keyboard=True
-            ),
-            parse_mode="Markdown",
+            "Пожалуйста, используйте кнопки меню для навигации",
+            reply_markup=get_main_reply_markup(),
         )
-    elif update.message.text == "🔙 Отмена":
-        user_states[user_id] = MAIN_MENU
-        await update.message.reply_text(
-            "Действие отменено", reply_markup=get_main_reply_markup()
+
+
+async def answer_from_faq(update: Update) -> bool:
+    """Отвечает из базы вопросов, если ответ найден уверенно"""
+    if not FAQ_MIN_SCORE:
+        return False
+    match = faq.match(update.message.text)
+    if match is None:
+        return False
+    FAQ_ANSWERS.inc(match.entry.id)
+    logger.info(f"Автоответ {match.entry.id} (близость {match.score:.2f})")
+    await update.message.reply_text(
+        match.entry.answer, reply_markup=match.entry.reply_markup
+    )
+    return True
+
+
+def check_submission(user_id: int, key: bytes):
+    """Текст отказа, если обращение повторное или лимит исчерпан; иначе None"""
+    if submission_limits.duplicates.seen(key):
+        SUBMISSIONS_MERGED.inc()
+        logger.info(f"Повторное обращение пользователя {user_id} не отправлено")
+        return "ℹ️ Это сообщение уже отправлено специалистам, повторять его не нужно."
+    if not submission_limits.hit("message", user_id):
+        submission_limits.duplicates.forget(key)
+        SUBMISSIONS_REJECTED.inc("message")
+        wait = submission_limits.retry_after("message", user_id)
+        logger.warning(f"Пользователь {user_id} превысил лимит обращений")
+        return (
+            f"⏳ Вы отправили слишком много сообщений. "
+            f"Попробуйте через {format_wait(wait)}."
         )
-    else:
-        await update.message.reply_text(
-            "Пожалуйста, используйте кнопки меню для навигации",
+    return None
+
+
+def describe_attachments(attachments: list) -> str:
+    if not attachments:
+        return ""
+    lines = ["", "ВЛОЖЕНИЯ:"]
+    for attachment in attachments:
+        line = f"- {attachment.filename} ({attachment.size // 1024 + 1} КБ)"
+        if attachment.caption:
+            line += f": {attachment.caption}"
+        lines.append(line)
+    # Отступ как у остальных строк шаблона письма в handle_message
+    return "\n        ".join(lines + [""])
+
+
+@timed(HANDLER_LATENCY, "handle_attachment")
+async def handle_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    message = update.message
+    if user_states.get(user_id) not in (AWAITING_MESSAGE, FAQ_ANSWERED):
+        await message.reply_text(
+            "Чтобы отправить файл специалистам, нажмите «✉️ Написать сообщение»",
             reply_markup=get_main_reply_markup(),
         )
+        return
+
+    if not submission_limits.hit("attachment", user_id):
+        SUBMISSIONS_REJECTED.inc("attachment")
+        wait = submission_limits.retry_after("attachment", user_id)
+        await message.reply_text(
+            f"⏳ Слишком много файлов. Попробуйте через {format_wait(wait)}.",
+            reply_markup=menus.keyboard("cancel"),
+        )
+        return
 
+    if message.document:
+        media = message.document
+        filename = media.file_name or f"document_{message.message_id}"
+        mime_type = media.mime_type or "application/octet-stream"
+    else:
+        media = message.photo[-1]  # Самый крупный размер
+        filename = f"photo_{message.message_id}.jpg"
+        mime_type = "image/jpeg"
 
-async def show_main_menu(update: Update):
-    user_states[update.effective_user.id] = MAIN_MENU
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "👨‍⚕️ Психологическая служба", callback_data="psychologists"
-            ),
-            InlineKeyboardButton(
-                "👩‍🏫 Социально-педагогическая служба",
-                callback_data="social_pedagogues",
-            ),
-        ]
-        # Убрана кнопка "✉️ Обратиться с запросом"
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        # Проверка до getFile: слишком большой файл не загружается вовсе
+        await asyncio.to_thread(attachment_spool.check, user_id, media.file_size)
+        tg_file = await media.get_file()
+        attachment = await attachment_spool.download(
+            user_id,
+            tg_file.file_path,
+            filename,
+            mime_type,
+            media.file_size,
+            message.caption,
+        )
+    except AttachmentTooLarge as e:
+        await message.reply_text(f"❌ {e}", reply_markup=menus.keyboard("cancel"))
+        return
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке вложения: {e.__class__.__name__}: {e}")
+        await message.reply_text(
+            "❌ Не удалось получить файл. Попробуйте отправить его ещё раз.",
+            reply_markup=menus.keyboard("cancel"),
+        )
+        return
+
+    count = len(await asyncio.to_thread(attachment_spool.pending, user_id))
+    logger.info(f"Вложение пользователя {user_id}: {attachment.size} байт")
+    await message.reply_text(
+        f"📎 Файл «{attachment.filename}» добавлен (всего файлов: {count}).\n"
+        "Отправьте ещё файлы или напишите текст сообщения - файлы уйдут вместе с ним.",
+        reply_markup=menus.keyboard("cancel"),
+    )
+
+
+async def show_screen(update: Update, name: str):
+    screen = menus.screen(name)
+    user_states[update.effective_user.id] = screen.state
 
     if update.callback_query:
         await update.callback_query.edit_message_text(
-            text="Выберите категорию специалистов:", reply_markup=reply_markup
+            text=screen.text,
+            reply_markup=screen.reply_markup,
+            parse_mode=screen.parse_mode,
         )
     else:
         await update.message.reply_text(
-            "🎯 **Вас приветствует отдел социально-психологической работы, мы часть отдела воспитательной работы\n"
-            "Выберите, что вас интересует, мы постараемся вам помочь:**\n\n"
-            "👨‍⚕️ **Психологическая служба** - консультации, тесты, диагностика\n"
-            "👩‍🏫 **Социально-педагогическая служба** - документы, контакты специалистов\n\n"
-            "💬 **Используйте кнопку «Написать сообщение» для отправки запроса на электронную почту нашего отдела, вы всегда можете написать\n"
-            "- жалобы(студентов, педагогов)\n"
-            "- для педагогов, запрос на работу с группой или студентом\n"
-            "- другие комментарии о воспитательном процессе**"
-            "Запрос будет обработан и ответ будет направлен вам в сообщения.\n\n",
-            reply_markup=reply_markup,
-            parse_mode="Markdown",
+            screen.entry_text or screen.text,
+            reply_markup=screen.reply_markup,
+            parse_mode=screen.entry_parse_mode or screen.parse_mode,
         )
 
 
+async def show_main_menu(update: Update):
+    await show_screen(update, "main")
+
+
+@timed(HANDLER_LATENCY, "button_click")
 async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id
-    current_state = user_states.get(user_id)
-
-    if query.data == "back":
-        if current_state in (PSYCHOLOGISTS_MENU, SOCIAL_PEDAGOGUES_MENU):
-            await show_main_menu(update)
-        elif current_state == DOCUMENTS_MENU:
-            await show_social_pedagogues_menu(update)
-    elif query.data == "psychologists":
-        user_states[user_id] = PSYCHOLOGISTS_MENU
-        await show_psychologists_menu(update)
-    elif query.data == "social_pedagogues":
-        user_states[user_id] = SOCIAL_PEDAGOGUES_MENU
-        await show_social_pedagogues_menu(update)
-    elif query.data == "documents":
-        user_states[user_id] = DOCUMENTS_MENU
-        await show_documents_menu(update)
-    elif query.data == "get_guide":
-        await send_photo(update, context)
-    elif query.data == "get_application":
-        await send_document(update, context)
-    elif query.data == "psycho_tests":
-        await show_psycho_test_menu(update)
-    # Убрана обработка query.data == "send_message"
-    elif query.data == "cancel_message":
-        await show_main_menu(update)
+    # После автоответа нажата кнопка - пользователь продолжил работу с ботом,
+    # и следующий текст уже не уточнение вопроса
+    if user_states.get(update.effective_user.id) == FAQ_ANSWERED:
+        user_states[update.effective_user.id] = MAIN_MENU
 
+    if not await router.dispatch(query.data, update, context):
+        logger.warning(f"Неизвестная кнопка: {query.data}")
 
-async def send_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
 
-    try:
-        photo_path = path.join(DATA_DIR, "guide.jpg")
-        if not path.exists(photo_path):
-            await query.edit_message_text("Извините, изображение временно недоступно.")
-            return
+@router.route("menu:<node>")
+async def open_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, node: str):
+    if node in menus:
+        await show_screen(update, node)
 
-        with open(photo_path, "rb") as photo:
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=photo,
-                caption="Памятка на документы для социальных выплат",
-            )
-    except Exception as e:
-        logger.error(f"Ошибка при отправке изображения: {e}")
-        await query.edit_message_text("Произошла ошибка при отправке изображения.")
 
+@router.route("doc:<doc_id>")
+@timed(HANDLER_LATENCY, "open_document")
+async def open_document(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, doc_id: str
+):
+    # Документы описаны в data/catalog.json, новый документ не требует обработчика
+    asset = assets.get(doc_id)
+    if asset is None:
+        logger.warning(f"Неизвестный документ: {doc_id}")
+        return
 
-async def send_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-
     try:
-        doc_path = path.join(DATA_DIR, "application.docx")
-        if not path.exists(doc_path):
-            await query.edit_message_text("Извините, документ временно недоступен.")
+        if not assets.available(doc_id):
+            await query.edit_message_text(asset.unavailable)
             return
-
-        with open(doc_path, "rb") as doc:
-            await context.bot.send_document(
-                chat_id=query.message.chat_id,
-                document=doc,
-                filename="Заявление на мат. помощь.docx",
-                caption="Заявление на материальную помощь",
-            )
+        await assets.send(doc_id, context.bot, query.message.chat_id)
     except Exception as e:
-        logger.error(f"Ошибка при отправке документа: {e}")
+        logger.error(f"Ошибка при отправке {asset.file}: {e}")
         await query.edit_message_text("Произошла ошибка при отправке документа.")
 
 
-async def show_psychologists_menu(update: Update):
-    user_states[update.effective_user.id] = PSYCHOLOGISTS_MENU
-    message = (
-        "👨‍⚕️ Психологи:\n\n"
-        "• Андриевский А.А. - 5-Железнодорожная (325 кабинет)\n"
-        "• Степанец В.П. - 5-Железнодорожная (324 кабинет)\n\n"
-        "• Теплякова Е.Н. - ул. Звездинская (215 кабинет)\n\n"
-        "У Андриевского А.А. и Степанец В.П. запись производится по ссылке ниже\n\n"
-    )
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "📅 Андриевский записаться",
-                url="https://calendar.app.google/mfryoPypDq1gmBRv9",
-            ),
-            InlineKeyboardButton(
-                "📅 Степанец записаться",
-                url="https://calendar.app.google/VUcjHWTg2mi5EtL77",
-            ),
-        ],
-        [InlineKeyboardButton("🧠 Диагностика", callback_data="psycho_tests")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back")],
-    ]
-    await update.callback_query.edit_message_text(
-        text=message, reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+# Старые callback_data: кнопки из уже отправленных сообщений остаются у
+# пользователей в чатах и должны продолжать работать
+@router.route("back")
+async def legacy_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    current_state = user_states.get(update.effective_user.id)
+    if current_state in (PSYCHOLOGISTS_MENU, SOCIAL_PEDAGOGUES_MENU):
+        await show_main_menu(update)
+    elif current_state == DOCUMENTS_MENU:
+        await show_screen(update, "social_pedagogues")
 
 
-async def show_psycho_test_menu(update: Update):
-    user_states[update.effective_user.id] = PSYCHOLOGISTS_MENU
-    message = "🧠 Психологическая диагностика:\nВыберите тест:"
-
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "ИРКПО платформа для тестирования", url="https://irkpo.ru/test/psy"
-            ),
-            InlineKeyboardButton(
-                "СПС (состояния)",
-                url="https://psytests.org/emo/eyespsy-run.html?ysclid=makjgxwmo6267738449",
-            ),
-        ],
-        [
-            InlineKeyboardButton(
-                "Депрессия (Бека)", url="https://psytests.org/depr/bdi-run.html"
-            ),
-            InlineKeyboardButton(
-                "Способы совладающего поведения",
-                url="https://psytests.org/coping/wcq-run.html",
-            ),
-        ],
-        [
-            InlineKeyboardButton(
-                "Опросник Акцент-2-90",
-                url="https://psytests.org/accent/shmi90acc-run.html?ysclid=makklskzii872720319",
-            ),
-            InlineKeyboardButton(
-                "СОП",
-                url="https://psytests.org/parent/osopFf-run.html?ysclid=m6q6vdbfac18846130",
-            ),
-        ],
-        [
-            InlineKeyboardButton("🔙 Назад", callback_data="psychologists")
-        ],  # Возврат в меню психологов
-    ]
+@router.route("cancel_message")
+async def legacy_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_main_menu(update)
 
-    await update.callback_query.edit_message_text(
-        text=message, reply_markup=InlineKeyboardMarkup(keyboard)
-    )
 
+def _legacy_route(target: str):
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await router.dispatch(target, update, context)
 
-async def show_social_pedagogues_menu(update: Update):
-    user_states[update.effective_user.id] = SOCIAL_PEDAGOGUES_MENU
-    message = (
-        "👩‍🏫 Социальный педагог: Дунаевская Елена Николаевна Ул. 5-ая Железнодорожная, д. 53 каб. 216\n"
-        "👩‍🏫 Начальник отдела СППС: Тепляшин Д.В.:\n\n"
-    )
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "💬 Дунаевская Е.Н.", url="https://t.me/lina_dunaevskya"
-            ),
-            InlineKeyboardButton("💬 Тепляшин Д.В.", url="https://t.me/DVteplyi"),
-        ],
-        [InlineKeyboardButton("📄 Документы", callback_data="documents")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back")],
-    ]
-    await update.callback_query.edit_message_text(
-        text=message, reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    return handler
 
 
-async def show_documents_menu(update: Update):
-    user_states[update.effective_user.id] = DOCUMENTS_MENU
-    message = "📄 Документы от социальных педагогов:"
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "📝 Памятка на документы для социальных выплат",
-                callback_data="get_guide",
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                "📝 Заявление на мат. помощь", callback_data="get_application"
-            )
-        ],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back")],
-    ]
-    await update.callback_query.edit_message_text(
-        text=message, reply_markup=InlineKeyboardMarkup(keyboard)
+for _name in ("psychologists", "social_pedagogues", "documents", "psycho_tests"):
+    router.add(_name, _legacy_route(f"menu:{_name}"))
+router.add("get_guide", _legacy_route("doc:guide"))
+router.add("get_application", _legacy_route("doc:application"))
+
+
+async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    kind = next((t for t in UPDATE_TYPES if getattr(update, t, None)), "other")
+    UPDATES.inc(kind)
+
+
+async def remember_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Реестр получателей рассылок: все личные чаты, в которых писали боту
+    chat = update.effective_chat
+    if chat and chat.type == "private" and not chat_registry.is_known(chat.id):
+        await asyncio.to_thread(chat_registry.remember, chat.id)
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text(
+            "Пожалуйста, используйте кнопки меню для навигации",
+            reply_markup=get_main_reply_markup(),
+        )
+        return
+
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text("Использование: /broadcast текст рассылки")
+        return
+
+    admin_chat_id = update.effective_chat.id
+
+    async def report(info: dict):
+        await context.bot.send_message(
+            admin_chat_id,
+            f"📣 Рассылка #{info['id']} завершена\n"
+            f"Отправлено: {info['sent']}\n"
+            f"Ошибок: {info['failed']}\n"
+            f"Заблокировали бота: {info['pruned']}\n"
+            f"Время: {info['elapsed']:.0f} с",
+        )
+
+    broadcast_id = await asyncio.to_thread(chat_registry.create_broadcast, parts[1])
+    context.bot_data["broadcaster"].start(broadcast_id, on_done=report)
+    await update.message.reply_text(
+        f"📣 Рассылка #{broadcast_id} запущена, получателей: "
+        f"{chat_registry.active_count()}"
     )
 
 
+async def requeue_dead_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text(
+            "Пожалуйста, используйте кнопки меню для навигации",
+            reply_markup=get_main_reply_markup(),
+        )
+        return
+
+    count = await mail_queue.requeue_dead()
+    await update.message.reply_text(f"📬 Возвращено в очередь писем: {count}")
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    ERRORS.inc(type(context.error).__name__)
     try:
         logger.error(f"Ошибка: {context.error}", exc_info=context.error)
 
@@ -476,6 +871,179 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Ошибка в error_handler: {e}")
 
 
+def health_response(result: tuple) -> tuple:
+    ok, report = result
+    return 200 if ok else 503, "application/json", json.dumps(report)
+
+
+async def start_metrics_server(application: Application) -> None:
+    if not METRICS_PORT:
+        return
+    server = MetricsServer(METRICS_HOST, METRICS_PORT)
+    server.add_route(
+        "/metrics",
+        lambda: (200, "text/plain; version=0.0.4", metrics.render()),
+    )
+    server.add_route("/healthz", lambda: health_response(health.liveness()))
+    server.add_route("/readyz", lambda: health_response(health.readiness()))
+    try:
+        await server.start()
+    except OSError as e:
+        # Бот важнее метрик: занятый порт не должен мешать запуску
+        logger.error(f"Не удалось запустить сервер метрик: {e}")
+        return
+    application.bot_data["metrics_server"] = server
+
+
+def mark_not_ready() -> None:
+    # /readyz отвечает 503: балансировщик перестаёт слать webhook-запросы
+    health.ready = False
+
+
+async def post_init(application: Application) -> None:
+    if application.bot_data.get("handle_signals"):
+        if not shutdown.install(application, on_start=mark_not_ready):
+            logger.warning("Сигналы остановки не перехвачены, остановка без ожидания")
+    await mail_queue.start()
+    await start_metrics_server(application)
+    # Приложение ещё не запущено, поэтому задачи отменяются в post_shutdown
+    application.bot_data["background_tasks"] = [
+        asyncio.create_task(menus.watch(MENU_RELOAD_INTERVAL), name="menu-watch"),
+        asyncio.create_task(assets.watch(MENU_RELOAD_INTERVAL), name="asset-watch"),
+        asyncio.create_task(faq.watch(MENU_RELOAD_INTERVAL), name="faq-watch"),
+        asyncio.create_task(
+            attachment_spool.watch(SESSION_TTL), name="attachment-purge"
+        ),
+        asyncio.create_task(health.watch_loop(), name="loop-lag"),
+        asyncio.create_task(update_journal.watch(), name="update-journal-purge"),
+        asyncio.create_task(user_states.watch(), name="session-purge"),
+        asyncio.create_task(smtp_pool.watch(SMTP_PROBE_INTERVAL), name="smtp-probe"),
+    ]
+    broadcaster = Broadcaster(
+        application.bot, chat_registry, batch_size=BROADCAST_BATCH_SIZE
+    )
+    application.bot_data["broadcaster"] = broadcaster
+    await broadcaster.resume_unfinished()
+    if SHARED_STATE:
+        application.bot_data["background_tasks"].append(
+            asyncio.create_task(broadcaster.watch(60), name="broadcast-watch")
+        )
+    if LOOP_BLOCK_THRESHOLD:
+        watchdog = LoopWatchdog(
+            threshold=LOOP_BLOCK_THRESHOLD,
+            lag_histogram=LOOP_LAG,
+            block_histogram=LOOP_BLOCKS,
+            block_counter=LOOP_BLOCK_SITES,
+        )
+        watchdog.start()
+        application.bot_data["watchdog"] = watchdog
+    await catch_up(application)
+    health.ready = True
+
+
+async def catch_up(application: Application) -> None:
+    # Апдейты, прерванные прошлой остановкой, и накопившиеся за время простоя
+    # обрабатываются до начала обычного опроса
+    await replay_unfinished(application, update_journal, UPDATE_MAX_AGE or DEDUP_WINDOW)
+    if BOT_MODE == "webhook":
+        return  # Накопившиеся апдейты Telegram пришлёт на webhook сам
+    try:
+        await drain_pending(application, update_journal)
+    except TelegramError as e:
+        # Апдейты не потеряны: их заберёт обычный опрос
+        logger.warning(f"Не удалось забрать накопившиеся апдейты: {e}")
+
+
+async def post_shutdown(application: Application) -> None:
+    broadcaster = application.bot_data.get("broadcaster")
+    if broadcaster:
+        await broadcaster.stop()  # Прогресс сохранён, рассылка продолжится
+    health.ready = False
+    watchdog = application.bot_data.get("watchdog")
+    if watchdog:
+        await watchdog.stop()
+    for task in application.bot_data.get("background_tasks", []):
+        task.cancel()
+    metrics_server = application.bot_data.get("metrics_server")
+    if metrics_server:
+        await metrics_server.stop()
+    sent_before = mail_queue.sent
+    # Письма досылаются в оставшееся от остановки время, остальные ждут в outbox
+    await mail_queue.stop(timeout=shutdown.remaining(default=30.0))
+    await asyncio.to_thread(smtp_pool.close)
+    await attachment_spool.close()
+    outbox.close()
+    user_states.close()
+    chat_registry.close()
+    update_journal.close()
+    shutdown.log_report(
+        updates_deferred=application.update_processor.deferred,
+        bot_api_waiting=outbound.depth(),
+        mail_sent=mail_queue.sent - sent_before,
+        mail_in_outbox=mail_queue.qsize(),
+    )
+
+
+def build_application(
+    token: str, builder=None, handle_signals: bool = False
+) -> Application:
+    """handle_signals=True - SIGTERM/SIGINT обрабатывает GracefulShutdown;
+    run_polling/run_webhook тогда вызываются с stop_signals=None"""
+    builder = builder or Application.builder()
+    application = (
+        builder.token(token)
+        .concurrent_updates(
+            PerUserUpdateProcessor(
+                UPDATE_CONCURRENCY,
+                journal=update_journal,
+                max_age=UPDATE_MAX_AGE or None,
+            )
+        )
+        .rate_limiter(outbound)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, count_update), group=-2)
+    application.add_handler(TypeHandler(Update, remember_chat), group=-1)
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("requeue_dead", requeue_dead_command))
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
+    )
+    application.add_handler(
+        MessageHandler(filters.PHOTO | filters.Document.ALL, handle_attachment)
+    )
+    application.add_handler(CallbackQueryHandler(button_click))
+    application.add_error_handler(error_handler)
+    application.bot_data["handle_signals"] = handle_signals
+    return application
+
+
+def run_webhook(application: Application) -> None:
+    # Telegram сам присылает апдейты на WEBHOOK_URL; TLS обычно завершается на
+    # reverse proxy, а бот слушает обычный HTTP. Запросы без правильного
+    # заголовка X-Telegram-Bot-Api-Secret-Token отклоняются с кодом 403
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        logger.error("Для режима webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+        sys.exit(1)
+    webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}"
+    logger.info(f"Webhook: {webhook_url} -> {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=WEBHOOK_SECRET,
+        cert=WEBHOOK_CERT or None,
+        key=WEBHOOK_KEY or None,
+        # Апдейты, пришедшие во время простоя, обрабатываются после запуска
+        drop_pending_updates=False,
+        stop_signals=None,  # Сигналы обрабатывает GracefulShutdown
+    )
+
+
 def main() -> None:
     try:
         # Проверяем, что все переменные окружения загружены
@@ -487,23 +1055,26 @@ def main() -> None:
             logger.error(f"TOKEN: {'✓' if token_bot else '✗'}")
             sys.exit(1)
 
+        if SHARED_STATE and BOT_MODE != "webhook":
+            # Два процесса с getUpdates получают Conflict от Telegram
+            logger.error("SHARED_STATE=true работает только с BOT_MODE=webhook")
+            sys.exit(1)
+
         logger.info(f"Настройки загружены: {EMAIL_USER}@{EMAIL_HOST}:{EMAIL_PORT}")
         logger.info("Запуск Telegram бота...")
 
-        application = Application.builder().token(token_bot).build()
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(
-            MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
-        )
-        application.add_handler(CallbackQueryHandler(button_click))
-        application.add_error_handler(error_handler)
+        application = build_application(token_bot, handle_signals=True)
 
         logger.info("Бот запущен и готов к работе!")
-        application.run_polling(
-            poll_interval=1.0,  # Увеличиваем интервал для стабильности
-            timeout=30,  # Увеличиваем timeout
-            drop_pending_updates=True,
-        )
+        if BOT_MODE == "webhook":
+            run_webhook(application)
+        else:
+            application.run_polling(
+                poll_interval=1.0,  # Увеличиваем интервал для стабильности
+                timeout=30,  # Увеличиваем timeout
+                drop_pending_updates=False,
+                stop_signals=None,  # Сигналы обрабатывает GracefulShutdown
+            )
 
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}")
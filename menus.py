@@ -0,0 +1,121 @@
+"""
+Декларативное меню бота: описание в data/menus.json, собирается один раз при запуске
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Screen:
+    """Готовый экран меню: текст и клавиатура, общие для всех пользователей"""
+
+    name: str
+    state: int
+    text: str
+    reply_markup: InlineKeyboardMarkup
+    parse_mode: str = None
+    # Текст, с которым экран отправляется новым сообщением (а не правкой старого)
+    entry_text: str = None
+    entry_parse_mode: str = None
+
+
+def _inline_button(spec: dict) -> InlineKeyboardButton:
+    if "callback" in spec:
+        return InlineKeyboardButton(spec["text"], callback_data=spec["callback"])
+    if "url" in spec:
+        return InlineKeyboardButton(spec["text"], url=spec["url"])
+    raise ValueError(f"Кнопка «{spec.get('text')}» без callback и url")
+
+
+def compile_menus(data: dict, states: dict) -> tuple:
+    """Собирает экраны и reply-клавиатуры из описания меню.
+
+    states сопоставляет имена состояний из файла их числовым значениям.
+    """
+    keyboards = {}
+    for name, spec in data.get("keyboards", {}).items():
+        options = {k: v for k, v in spec.items() if k != "buttons"}
+        rows = [[KeyboardButton(text) for text in row] for row in spec["buttons"]]
+        keyboards[name] = ReplyKeyboardMarkup(rows, **options)
+
+    screens = {}
+    for name, spec in data["screens"].items():
+        if spec["state"] not in states:
+            raise ValueError(f"Экран {name}: неизвестное состояние {spec['state']}")
+        rows = [[_inline_button(b) for b in row] for row in spec.get("buttons", [])]
+        screens[name] = Screen(
+            name=name,
+            state=states[spec["state"]],
+            text=spec["text"],
+            reply_markup=InlineKeyboardMarkup(rows),
+            parse_mode=spec.get("parse_mode"),
+            entry_text=spec.get("entry_text"),
+            entry_parse_mode=spec.get("entry_parse_mode"),
+        )
+    return MappingProxyType(screens), MappingProxyType(keyboards)
+
+
+class MenuRegistry:
+    """Хранит собранное меню и атомарно подменяет его при изменении файла"""
+
+    def __init__(self, menu_path: str, states: dict):
+        self.menu_path = menu_path
+        self.states = states
+        self._mtime = None
+        self._menus = (MappingProxyType({}), MappingProxyType({}))
+        self.reload()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._menus[0]
+
+    def screen(self, name: str) -> Screen:
+        return self._menus[0][name]
+
+    def keyboard(self, name: str) -> ReplyKeyboardMarkup:
+        return self._menus[1][name]
+
+    def reload(self) -> bool:
+        """Перечитывает файл меню. При ошибке остаётся прежняя версия"""
+        mtime = None
+        try:
+            mtime = os.stat(self.menu_path).st_mtime_ns
+            with open(self.menu_path, encoding="utf-8") as f:
+                menus = compile_menus(json.load(f), self.states)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if self._mtime is None:
+                raise
+            logger.error(f"Меню {self.menu_path} не загружено, оставлено старое: {e}")
+            self._mtime = mtime or self._mtime  # Не повторять ошибку до новой правки
+            return False
+        # Подмена одним присваиванием: обработчики видят либо старое, либо новое меню
+        self._menus = menus
+        self._mtime = mtime
+        logger.info(f"Меню загружено: экранов {len(menus[0])}")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.menu_path).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self._mtime and self.reload()
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Фоновая проверка изменений файла меню"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload_if_changed)
@@ -0,0 +1,212 @@
+"""
+Постоянная очередь исходящих писем (SQLite в режиме WAL)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+PENDING = "pending"
+SENDING = "sending"
+DEAD = "dead"
+
+
+@dataclass
+class OutboxItem:
+    id: int
+    subject: str
+    body: str
+    attempts: int
+    # Вложения: словари attachments.Attachment.to_dict()
+    attachments: list = field(default_factory=list)
+    created: float = 0.0
+
+
+class Outbox:
+    """Хранилище писем, которые ещё не доставлены. Потокобезопасно.
+
+    Файл может использоваться несколькими процессами бота одновременно:
+    забранное письмо закрепляется за owner на lease секунд, письма упавшего
+    процесса после истечения аренды забирают остальные.
+    """
+
+    def __init__(self, db_path: str = ":memory:", owner: str = "", lease: float = 300):
+        self.owner = owner
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                urgent INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        for column, definition in (
+            ("urgent", "INTEGER NOT NULL DEFAULT 0"),
+            ("owner", "TEXT NOT NULL DEFAULT ''"),
+            ("lease_until", "REAL NOT NULL DEFAULT 0"),
+            ("attachments", "TEXT"),
+        ):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)"
+        )
+
+    def add(
+        self,
+        subject: str,
+        body: str,
+        delay: float = 0.0,
+        urgent: bool = False,
+        attachments: list = None,
+    ) -> int:
+        now = time.time()
+        attachments = (
+            json.dumps(attachments, ensure_ascii=False) if attachments else None
+        )
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox "
+                "(subject, body, urgent, next_attempt, created, attachments) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (subject, body, int(urgent), now + delay, now, attachments),
+            )
+            return cur.lastrowid
+
+    def claim(self, limit: int, now: float = None, urgent: bool = None) -> list:
+        """Забирает до limit писем, время отправки которых наступило.
+
+        Кроме ожидающих, забираются письма с истёкшей арендой другого процесса.
+        urgent=True/False ограничивает выборку срочными/обычными письмами.
+        """
+        now = time.time() if now is None else now
+        query = (
+            "SELECT id, subject, body, attempts, attachments, created FROM outbox "
+            "WHERE ((status = ? AND next_attempt <= ?) "
+            "OR (status = ? AND lease_until < ?))"
+        )
+        params = [PENDING, now, SENDING, now]
+        if urgent is not None:
+            query += " AND urgent = ?"
+            params.append(int(urgent))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    query + " ORDER BY next_attempt LIMIT ?", (*params, limit)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE outbox SET status = ?, owner = ?, lease_until = ? "
+                    "WHERE id = ?",
+                    [(SENDING, self.owner, now + self.lease, row[0]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [
+            OutboxItem(*row[:4], json.loads(row[4]) if row[4] else [], row[5])
+            for row in rows
+        ]
+
+    def mark_sent(self, item_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (item_id,))
+
+    def retry_later(self, item_id: int, retry_at: float, error: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, "
+                "next_attempt = ?, last_error = ? WHERE id = ?",
+                (PENDING, retry_at, error, item_id),
+            )
+
+    def mark_dead(self, item_id: int, error: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, "
+                "last_error = ? WHERE id = ?",
+                (DEAD, error, item_id),
+            )
+
+    def requeue_sending(self) -> int:
+        """Возвращает в очередь письма этого процесса, отправка которых
+        прервалась остановкой бота. Чужие письма не трогаются до конца аренды
+        """
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE outbox SET status = ? WHERE status = ? AND owner = ?",
+                (PENDING, SENDING, self.owner),
+            )
+            return cur.rowcount
+
+    def requeue_dead(self) -> int:
+        """Возвращает в очередь письма, отложенные после ошибок, с новым
+        счётчиком попыток"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt = ? "
+                "WHERE status = ?",
+                (PENDING, time.time(), DEAD),
+            )
+            return cur.rowcount
+
+    def hurry(self, urgent: bool = False, fresh_only: bool = False) -> int:
+        """Делает все ожидающие письма (срочные или обычные) готовыми к отправке.
+
+        fresh_only=True не трогает письма, ждущие повтора после ошибки.
+        """
+        now = time.time()
+        query = (
+            "UPDATE outbox SET next_attempt = ? "
+            "WHERE status = ? AND urgent = ? AND next_attempt > ?"
+        )
+        if fresh_only:
+            query += " AND attempts = 0"
+        with self._lock:
+            cur = self._db.execute(query, (now, PENDING, int(urgent), now))
+            return cur.rowcount
+
+    def next_due(self):
+        """Время ближайшей попытки отправки или None, если ждать нечего"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(t) FROM ("
+                "SELECT MIN(next_attempt) AS t FROM outbox WHERE status = ? "
+                "UNION ALL SELECT MIN(lease_until) FROM outbox WHERE status = ?)",
+                (PENDING, SENDING),
+            ).fetchone()
+        return row[0]
+
+    def count(self, *statuses: str, urgent: bool = None) -> int:
+        statuses = statuses or (PENDING, SENDING)
+        marks = ", ".join("?" * len(statuses))
+        query = f"SELECT COUNT(*) FROM outbox WHERE status IN ({marks})"
+        params = list(statuses)
+        if urgent is not None:
+            query += " AND urgent = ?"
+            params.append(int(urgent))
+        with self._lock:
+            row = self._db.execute(query, params).fetchone()
+        return row[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,189 @@
+"""
+Планировщик исходящих запросов к Bot API с учётом лимитов Telegram
+"""
+
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты передаются в методы бота через rate_limit_args
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Методы, на которые не распространяются лимиты отправки сообщений
+UNLIMITED_ENDPOINTS = frozenset(
+    {
+        "answerCallbackQuery",
+        "getUpdates",
+        "getMe",
+        "getFile",
+        "setWebhook",
+        "deleteWebhook",
+        "getWebhookInfo",
+        "close",
+        "logOut",
+    }
+)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до появления целого токена (0 - можно отправлять)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+def _seconds(value) -> float:
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Ограничивает отправку общим лимитом бота и лимитами каждого чата.
+
+    Интерактивные ответы пропускаются вперёд массовых рассылок
+    (rate_limit_args=BULK), после RetryAfter отправка приостанавливается на
+    указанное Telegram время и запрос повторяется.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        max_retries: int = 2,
+    ):
+        self._global = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._chats = {}
+        self._paused_until = 0.0
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self.requests = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.retry_after_hits = 0
+        self.last_poll = None  # monotonic-время последнего успешного getUpdates
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        logger.info(f"Планировщик Bot API: {self.stats()}")
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        if endpoint in UNLIMITED_ENDPOINTS:
+            result = await callback(*args, **kwargs)
+            if endpoint == "getUpdates":
+                self.last_poll = time.monotonic()
+            return result
+
+        priority = BULK if rate_limit_args == BULK else INTERACTIVE
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            self._record_wait(await self._acquire(priority, chat_id))
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                self.retry_after_hits += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = _seconds(exc.retry_after) + 0.1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(
+                    f"Flood control Telegram ({endpoint}), пауза {delay:.1f} с"
+                )
+
+    def depth(self, priority: str = None) -> int:
+        """Количество запросов, ожидающих отправки"""
+        if priority:
+            return self._waiting[priority]
+        return sum(self._waiting.values())
+
+    def stats(self) -> dict:
+        return {
+            "waiting_interactive": self._waiting[INTERACTIVE],
+            "waiting_bulk": self._waiting[BULK],
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+            "retry_after": self.retry_after_hits,
+        }
+
+    async def _acquire(self, priority: str, chat_id) -> float:
+        started = time.monotonic()
+        bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        self._waiting[priority] += 1
+        slept = False
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0 and bucket:
+                    delay = bucket.wait_time(now)
+                if delay <= 0:
+                    delay = self._global.wait_time(now)
+                if delay <= 0 and priority == BULK and self._waiting[INTERACTIVE]:
+                    delay = 0.01  # Уступаем место интерактивным ответам
+                if delay <= 0:
+                    self._global.take()
+                    if bucket:
+                        bucket.take()
+                    return now - started if slept else 0.0
+                slept = True
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting[priority] -= 1
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10_000:
+                self._prune_chats()
+            is_group = isinstance(chat_id, str) or int(chat_id) < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune_chats(self) -> None:
+        # Полностью восстановившиеся корзины эквивалентны новым, их можно забыть
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chats.items()):
+            bucket.wait_time(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._chats[chat_id]
+
+    def _record_wait(self, waited: float) -> None:
+        self.requests += 1
+        if waited > 0:
+            self.delayed += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
@@ -0,0 +1,132 @@
+"""
+Маршрутизация callback_data inline-кнопок
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+
+
+class Route:
+    __slots__ = ("pattern", "handler", "count", "total", "max")
+
+    def __init__(self, pattern: str, handler):
+        self.pattern = pattern
+        self.handler = handler
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class _Node:
+    __slots__ = ("children", "param", "param_node", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.param = None
+        self.param_node = None
+        self.route = None
+
+
+class CallbackRouter:
+    """Словарь для точных маршрутов и дерево сегментов для параметризованных.
+
+    Шаблоны разделяются двоеточием, параметры записываются в угловых скобках:
+
+        @router.route("doc:<doc_id>")
+        async def send_doc(update, context, doc_id): ...
+
+    Стоимость выбора маршрута не зависит от их количества: поиск в словаре
+    или проход по сегментам callback_data.
+    """
+
+    def __init__(self, slow_threshold: float = 1.0):
+        self.slow_threshold = slow_threshold
+        self._exact = {}
+        self._root = _Node()
+        self._routes = []
+
+    def route(self, pattern: str):
+        def decorator(handler):
+            self.add(pattern, handler)
+            return handler
+
+        return decorator
+
+    def add(self, pattern: str, handler) -> None:
+        route = Route(pattern, handler)
+        self._routes.append(route)
+        segments = pattern.split(SEPARATOR)
+        if not any(s.startswith("<") for s in segments):
+            self._exact[pattern] = route
+            return
+
+        node = self._root
+        for segment in segments:
+            if segment.startswith("<") and segment.endswith(">"):
+                name = segment[1:-1]
+                if node.param is None:
+                    node.param, node.param_node = name, _Node()
+                elif node.param != name:
+                    raise ValueError(f"Конфликт параметров в маршруте {pattern}")
+                node = node.param_node
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if node.route is not None:
+            raise ValueError(f"Маршрут {pattern} уже зарегистрирован")
+        node.route = route
+
+    def resolve(self, data: str):
+        """Возвращает (маршрут, параметры) или (None, None)"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+
+        node, params = self._root, {}
+        for segment in data.split(SEPARATOR):
+            child = node.children.get(segment)
+            if child is None:
+                if node.param is None:
+                    return None, None
+                params[node.param] = segment
+                child = node.param_node
+            node = child
+        if node.route is None:
+            return None, None
+        return node.route, params
+
+    async def dispatch(self, data: str, update, context) -> bool:
+        route, params = self.resolve(data or "")
+        if route is None:
+            return False
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context, **params)
+        finally:
+            elapsed = time.perf_counter() - started
+            route.record(elapsed)
+            if elapsed > self.slow_threshold:
+                logger.warning(
+                    f"Медленный маршрут {route.pattern}: {elapsed * 1000:.0f} мс"
+                )
+        return True
+
+    def stats(self) -> dict:
+        """Статистика по маршрутам: количество вызовов, среднее и максимум, с"""
+        return {
+            r.pattern: {
+                "count": r.count,
+                "avg": r.total / r.count if r.count else 0.0,
+                "max": r.max,
+            }
+            for r in self._routes
+        }
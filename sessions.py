@@ -0,0 +1,211 @@
+"""
+Хранилище состояний пользователей с TTL и LRU-вытеснением
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Состояние (0..255) и время последнего обращения упакованы в одно целое:
+# (timestamp << 8) | state
+STATE_BITS = 8
+STATE_MASK = (1 << STATE_BITS) - 1
+
+
+def pack(state: int, timestamp: float) -> int:
+    return (int(timestamp) << STATE_BITS) | state
+
+
+def unpack(value: int) -> tuple:
+    return value & STATE_MASK, value >> STATE_BITS
+
+
+class SessionStore:
+    """Интерфейс хранилища: user_id -> состояние меню (небольшое целое)"""
+
+    def get(self, user_id: int, default=None):
+        raise NotImplementedError
+
+    def __setitem__(self, user_id: int, state: int) -> None:
+        raise NotImplementedError
+
+    def pop(self, user_id: int, default=None):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    async def watch(self, interval: float = 60) -> None:
+        """Фоновая очистка устаревших сессий (в памяти не нужна: они
+        вытесняются при записи)"""
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Сессии в памяти: не больше max_size записей, старше ttl секунд удаляются"""
+
+    def __init__(self, ttl: float = 86400, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()  # user_id -> упакованное значение, от старых к новым
+        self.evicted = 0
+
+    def get(self, user_id: int, default=None):
+        value = self._data.get(user_id)
+        if value is None:
+            return default
+        state, touched = unpack(value)
+        if time.time() - touched > self.ttl:
+            del self._data[user_id]
+            return default
+        self._data.move_to_end(user_id)
+        return state
+
+    def __setitem__(self, user_id: int, state: int) -> None:
+        now = time.time()
+        self._data[user_id] = pack(state, now)
+        self._data.move_to_end(user_id)
+        self._evict(now)
+
+    def pop(self, user_id: int, default=None):
+        value = self._data.pop(user_id, None)
+        return default if value is None else unpack(value)[0]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def items(self):
+        """Пары (user_id, состояние, время обращения) от старых к новым"""
+        for user_id, value in self._data.items():
+            yield (user_id, *unpack(value))
+
+    def _evict(self, now: float) -> None:
+        # Записи упорядочены по времени обращения, поэтому достаточно смотреть
+        # на начало словаря
+        deadline = now - self.ttl
+        while self._data:
+            user_id, value = next(iter(self._data.items()))
+            if len(self._data) <= self.max_size and unpack(value)[1] >= deadline:
+                break
+            del self._data[user_id]
+            self.evicted += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """Сессии в SQLite с кэшем в памяти; переживают перезапуск бота.
+
+    cache_size=0 отключает кэш: так файл можно делить между несколькими
+    процессами бота, каждое чтение видит последнюю запись любого из них.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl: float = 86400,
+        max_size: int = 100_000,
+        cache_size: int = 10_000,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache = MemorySessionStore(ttl, cache_size) if cache_size else None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self.purge()
+
+    def get(self, user_id: int, default=None):
+        if self._cache is not None:
+            state = self._cache.get(user_id)
+            if state is not None:
+                return state
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return default
+        state, touched = unpack(row[0])
+        if time.time() - touched > self.ttl:
+            return default
+        if self._cache is not None:
+            self._cache[user_id] = state
+        return state
+
+    def __setitem__(self, user_id: int, state: int) -> None:
+        if self._cache is not None:
+            self._cache[user_id] = state
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, value) VALUES (?, ?)",
+                (user_id, pack(state, time.time())),
+            )
+
+    def pop(self, user_id: int, default=None):
+        state = self.get(user_id, default)
+        if self._cache is not None:
+            self._cache.pop(user_id)
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return state
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def purge(self, batch: int = 1000) -> None:
+        """Удаляет просроченные сессии и самые старые сверх max_size.
+
+        Удаляет порциями по batch записей и отпускает блокировку между ними,
+        чтобы запись состояний из event loop не ждала всю очистку.
+        """
+        deadline = pack(0, time.time() - self.ttl)
+        for query, args in (
+            (
+                "SELECT user_id FROM sessions WHERE value < ? LIMIT ?",
+                (deadline, batch),
+            ),
+            (
+                "SELECT user_id FROM sessions ORDER BY value DESC LIMIT ? OFFSET ?",
+                (batch, self.max_size),
+            ),
+        ):
+            removed = batch
+            while removed == batch:
+                with self._lock:
+                    removed = self._db.execute(
+                        f"DELETE FROM sessions WHERE user_id IN ({query})", args
+                    ).rowcount
+
+    async def watch(self, interval: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.purge)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def create_session_store(
+    backend: str, db_path: str, ttl: float, max_size: int, shared: bool = False
+) -> SessionStore:
+    """shared=True - хранилище используют несколько процессов бота"""
+    if backend == "memory":
+        if shared:
+            raise ValueError("Сессии в памяти нельзя разделить между процессами")
+        return MemorySessionStore(ttl, max_size)
+    if backend == "sqlite":
+        cache_size = 0 if shared else 10_000
+        return SQLiteSessionStore(db_path, ttl, max_size, cache_size=cache_size)
+    raise ValueError(f"Неизвестное хранилище сессий: {backend}")
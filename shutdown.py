@@ -0,0 +1,101 @@
+"""
+Согласованная остановка бота по SIGTERM/SIGINT
+"""
+
+import asyncio
+import logging
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulShutdown:
+    """Останавливает бота по сигналу за общее время timeout.
+
+    1. on_start() (например, /readyz начинает отвечать 503), приём апдейтов
+       прекращается: останавливается опрос или webhook-сервер;
+    2. обработчики в работе завершаются не дольше handlers_timeout; оставшиеся
+       прерываются и с журналом апдейтов повторятся после запуска;
+    3. application.stop_running(): дальше PTB вызывает post_shutdown, где
+       остаток времени (remaining()) отдаётся почтовой очереди.
+
+    Итоги шагов собираются в report и пишутся в лог через log_report().
+    """
+
+    def __init__(self, timeout: float = 25.0, handlers_timeout: float = 10.0):
+        self.timeout = timeout
+        self.handlers_timeout = handlers_timeout
+        self.started = None
+        self.report = {}
+        self._on_start = None
+        self._task = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self.started is not None
+
+    def remaining(self, default: float = None) -> float:
+        """Сколько времени осталось до конца остановки (default - если она не начата)"""
+        if self.started is None:
+            return default
+        return max(0.0, self.timeout - (time.monotonic() - self.started))
+
+    def install(
+        self, application, on_start=None, signals=(signal.SIGTERM, signal.SIGINT)
+    ) -> bool:
+        """Перехватывает сигналы вместо PTB. False - цикл событий не умеет
+        (Windows), тогда остановка идёт обычным путём PTB"""
+        self._on_start = on_start
+        loop = asyncio.get_running_loop()
+        try:
+            for sig in signals:
+                loop.add_signal_handler(sig, self._on_signal, application, sig)
+        except NotImplementedError:
+            return False
+        return True
+
+    def _on_signal(self, application, sig: int) -> None:
+        if self.in_progress:
+            logger.warning(f"Остановка уже идёт, осталось {self.remaining():.0f} с")
+            return
+        logger.info(
+            f"Получен {signal.Signals(sig).name}: остановка не дольше {self.timeout:.0f} с"
+        )
+        self._task = asyncio.create_task(self.run(application), name="shutdown")
+
+    async def run(self, application) -> None:
+        self.started = time.monotonic()
+        try:
+            if self._on_start:
+                self._on_start()
+            updater = application.updater
+            if updater and updater.running:
+                await updater.stop()
+            await self._drain_handlers(application)
+        except Exception as e:
+            logger.error(f"Ошибка при остановке: {e.__class__.__name__}: {e}")
+        finally:
+            application.stop_running()
+
+    async def _drain_handlers(self, application) -> None:
+        processor = application.update_processor
+        started = processor.in_flight() + application.update_queue.qsize()
+        deadline = time.monotonic() + min(self.handlers_timeout, self.remaining())
+        while processor.in_flight() or not application.update_queue.empty():
+            if time.monotonic() >= deadline:
+                self.report["handlers_deferred"] = processor.cancel_in_flight()
+                break
+            await asyncio.sleep(0.05)
+        self.report["handlers_finished"] = max(
+            0, started - self.report.get("handlers_deferred", 0)
+        )
+
+    def log_report(self, **extra) -> None:
+        """Итог остановки одной записью: что успели завершить и что отложено"""
+        if not self.in_progress:
+            return
+        self.report.update(extra)
+        self.report["duration_s"] = round(time.monotonic() - self.started, 2)
+        summary = ", ".join(f"{key}={value}" for key, value in self.report.items())
+        logger.info(f"Остановка завершена: {summary}", extra=self.report)
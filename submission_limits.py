@@ -0,0 +1,202 @@
+"""
+Ограничение частоты обращений пользователей и слияние повторных обращений
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+
+# Счётчики окна упакованы в одно целое: (номер окна << 32) | (prev << 16) | cur
+COUNT_BITS = 16
+COUNT_MASK = (1 << COUNT_BITS) - 1
+
+
+def pack(window: int, prev: int, cur: int) -> int:
+    return (
+        (window << 2 * COUNT_BITS)
+        | (min(prev, COUNT_MASK) << COUNT_BITS)
+        | min(cur, COUNT_MASK)
+    )
+
+
+def unpack(value: int) -> tuple:
+    return (
+        value >> 2 * COUNT_BITS,
+        (value >> COUNT_BITS) & COUNT_MASK,
+        value & COUNT_MASK,
+    )
+
+
+def parse_limits(spec: str) -> dict:
+    """'message=5/3600,attachment=30/3600' -> {'message': (5, 3600.0), ...}"""
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        try:
+            name, rule = part.split("=", 1)
+            count, window = rule.split("/", 1)
+            limits[name.strip()] = (int(count), float(window))
+        except ValueError:
+            raise ValueError(f"Неверный лимит обращений: {part.strip()!r}") from None
+    return limits
+
+
+class SlidingWindowLimiter:
+    """Не больше limit событий за window секунд на пользователя.
+
+    Скользящее окно приближается двумя соседними фиксированными окнами: число
+    событий предыдущего окна учитывается с весом, убывающим по мере движения
+    времени. На пользователя хранится одно целое, записей не больше max_users;
+    вытесняются давно не активные, у которых окно и так истекло бы первым.
+    """
+
+    def __init__(self, limit: int, window: float, max_users: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_users = max_users
+        self._data = OrderedDict()  # user_id -> упакованные счётчики
+        self.rejected = 0
+        self.evicted = 0
+
+    def _counts(self, user_id: int, now: float) -> tuple:
+        index = int(now // self.window)
+        value = self._data.get(user_id)
+        if value is None:
+            return index, 0, 0
+        window, prev, cur = unpack(value)
+        if window == index:
+            return index, prev, cur
+        if window == index - 1:
+            return index, cur, 0
+        return index, 0, 0
+
+    def _estimate(self, index: int, prev: int, cur: int, now: float) -> float:
+        elapsed = now / self.window - index
+        return prev * (1 - elapsed) + cur
+
+    def retry_after(self, user_id: int, now: float = None) -> float:
+        """Через сколько секунд будет разрешено следующее событие (0 - сейчас)"""
+        now = time.time() if now is None else now
+        index, prev, cur = self._counts(user_id, now)
+        if self._estimate(index, prev, cur, now) + 1 <= self.limit:
+            return 0.0
+        start = index * self.window
+        room = self.limit - 1 - cur
+        if room >= 0 and prev:
+            # Ещё в этом окне: вес prev должен упасть до room
+            return max(0.0, start + self.window * (1 - room / prev) - now)
+        # Только в следующем окне: теперь уже cur убывает с весом
+        return max(0.0, start + self.window * (2 - (self.limit - 1) / cur) - now)
+
+    def hit(self, user_id: int, now: float = None) -> bool:
+        """Учитывает событие. False - лимит исчерпан, событие не учтено"""
+        now = time.time() if now is None else now
+        index, prev, cur = self._counts(user_id, now)
+        if self._estimate(index, prev, cur, now) + 1 > self.limit:
+            self.rejected += 1
+            return False
+        self._data[user_id] = pack(index, prev, cur + 1)
+        self._data.move_to_end(user_id)
+        self._evict(index)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _evict(self, index: int) -> None:
+        # Записи упорядочены по последнему событию: устаревшие в начале словаря
+        while self._data:
+            user_id, value = next(iter(self._data.items()))
+            if len(self._data) <= self.max_users and unpack(value)[0] >= index - 1:
+                break
+            del self._data[user_id]
+            self.evicted += 1
+
+
+def fingerprint(user_id: int, text: str, extra: tuple = ()) -> bytes:
+    """Хэш обращения: регистр и пробелы в тексте не важны"""
+    normalized = " ".join(text.split()).casefold()
+    data = "\x00".join([str(user_id), normalized, *map(str, extra)])
+    return hashlib.blake2b(data.encode(), digest_size=8).digest()
+
+
+class DuplicateFilter:
+    """Помнит хэши обращений window секунд: повтор сливается с первым.
+
+    Хранится 8-байтовый хэш и время, записей не больше max_entries.
+    """
+
+    def __init__(self, window: float = 600, max_entries: int = 100_000):
+        self.window = window
+        self.max_entries = max_entries
+        self._seen = OrderedDict()  # хэш -> время первого обращения
+        self.merged = 0
+
+    def seen(self, key: bytes, now: float = None) -> bool:
+        """True - такое обращение уже было в окне; иначе запоминает его"""
+        now = time.time() if now is None else now
+        self._expire(now)
+        if key in self._seen:
+            self.merged += 1
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, key: bytes) -> None:
+        """Обращение не дошло до очереди: повтор не считается дублем"""
+        self._seen.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        deadline = now - self.window
+        while self._seen:
+            key, added = next(iter(self._seen.items()))
+            if added >= deadline:
+                break
+            del self._seen[key]
+
+
+class SubmissionLimits:
+    """Лимиты по видам обращений (состояниям диалога) и фильтр повторов"""
+
+    def __init__(
+        self,
+        limits: dict,
+        dedup_window: float = 600,
+        max_users: int = 100_000,
+    ):
+        # Лимит 0 отключает ограничение
+        self.limiters = {
+            name: SlidingWindowLimiter(limit, window, max_users)
+            for name, (limit, window) in limits.items()
+            if limit > 0
+        }
+        self.duplicates = DuplicateFilter(dedup_window, max_users)
+
+    def retry_after(self, name: str, user_id: int) -> float:
+        limiter = self.limiters.get(name)
+        return 0.0 if limiter is None else limiter.retry_after(user_id)
+
+    def hit(self, name: str, user_id: int) -> bool:
+        """False - лимит вида name для пользователя исчерпан"""
+        limiter = self.limiters.get(name)
+        return True if limiter is None else limiter.hit(user_id)
+
+    def stats(self) -> dict:
+        stats = {f"rejected_{n}": lim.rejected for n, lim in self.limiters.items()}
+        stats["merged"] = self.duplicates.merged
+        return stats
+
+
+def format_wait(seconds: float) -> str:
+    """Время ожидания для пользователя: '45 с', '12 мин', '2 ч'"""
+    if seconds < 60:
+        return f"{max(1, round(seconds))} с"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} мин"
+    return f"{round(seconds / 3600)} ч"
@@ -0,0 +1,151 @@
+"""
+Тесты кэша file_id и каталога документов
+"""
+
+import json
+import os
+import sys
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram.error import BadRequest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from assets import AssetManager, FileIdCache
+
+
+def sent_message(file_id):
+    return Mock(document=Mock(file_id=file_id))
+
+
+class TestFileIdCache:
+    """Тесты FileIdCache"""
+
+    @pytest.mark.asyncio
+    async def test_upload_once_then_file_id(self, tmp_path):
+        """Файл загружается один раз, дальше отправляется по file_id"""
+        doc = tmp_path / "doc.docx"
+        doc.write_bytes(b"content")
+        send = AsyncMock(return_value=sent_message("FILE1"))
+        cache = FileIdCache(str(tmp_path / "file_ids.json"))
+
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+
+        assert send.await_args_list[0].args == (b"content",)
+        assert send.await_args_list[1].args == ("FILE1",)
+
+        # Кэш переживает перезапуск
+        restarted = FileIdCache(str(tmp_path / "file_ids.json"))
+        await restarted.send(str(doc), send, lambda m: m.document.file_id)
+        assert send.await_args.args == ("FILE1",)
+
+    @pytest.mark.asyncio
+    async def test_changed_file_uploaded_again(self, tmp_path):
+        """Изменение файла инвалидирует file_id"""
+        doc = tmp_path / "doc.docx"
+        doc.write_bytes(b"old")
+        send = AsyncMock(side_effect=[sent_message("OLD"), sent_message("NEW")])
+        cache = FileIdCache(str(tmp_path / "file_ids.json"))
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+
+        doc.write_bytes(b"new content")
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+
+        assert send.await_args.args == (b"new content",)
+        assert cache.uploads == 2
+
+    @pytest.mark.asyncio
+    async def test_rejected_file_id_falls_back_to_upload(self, tmp_path):
+        """Если Telegram отклонил file_id, файл загружается заново"""
+        doc = tmp_path / "doc.docx"
+        doc.write_bytes(b"content")
+        send = AsyncMock(
+            side_effect=[
+                sent_message("STALE"),
+                BadRequest("Wrong file identifier"),
+                sent_message("FRESH"),
+            ]
+        )
+        cache = FileIdCache(str(tmp_path / "file_ids.json"))
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+        await cache.send(str(doc), send, lambda m: m.document.file_id)
+
+        assert send.await_args.args == (b"content",)
+        assert cache.hits == 0
+
+
+def make_data_dir(tmp_path, catalog):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "catalog.json").write_text(json.dumps(catalog), encoding="utf-8")
+    return data_dir
+
+
+class TestAssetManager:
+    """Тесты AssetManager"""
+
+    @pytest.mark.asyncio
+    async def test_send_from_catalog(self, tmp_path):
+        """Документ отправляется по описанию из каталога, повторно - по file_id"""
+        data_dir = make_data_dir(
+            tmp_path,
+            {"form": {"file": "form.docx", "filename": "Заявление.docx"}},
+        )
+        (data_dir / "form.docx").write_bytes(b"content")
+        assets = AssetManager(
+            str(data_dir),
+            str(data_dir / "catalog.json"),
+            FileIdCache(str(tmp_path / "file_ids.json")),
+        )
+        bot = Mock(send_document=AsyncMock(return_value=sent_message("FILE1")))
+
+        assert assets.available("form")
+        assert not assets.available("missing")
+        await assets.send("form", bot, 42)
+        await assets.send("form", bot, 42)
+
+        first, second = bot.send_document.await_args_list
+        assert first.kwargs["document"] == b"content"
+        assert first.kwargs["filename"] == "Заявление.docx"
+        assert second.kwargs["document"] == "FILE1"
+
+    @pytest.mark.asyncio
+    async def test_cache_bounded_and_invalidated(self, tmp_path):
+        """Кэш ограничен по размеру, изменённый файл перечитывается"""
+        data_dir = make_data_dir(tmp_path, {})
+        for name in ("a", "b", "big"):
+            (data_dir / name).write_bytes(name.encode() * 4)
+        assets = AssetManager(
+            str(data_dir),
+            str(data_dir / "catalog.json"),
+            cache_limit=8,
+            cache_file_limit=8,
+        )
+
+        await assets.read("big")  # 12 байт: крупнее лимита, не кэшируется
+        await assets.read("a")
+        await assets.read("b")
+        assert assets.cached_bytes() == 8
+        await assets.read("a")
+        assert assets.hits == 1
+
+        (data_dir / "a").write_bytes(b"new")
+        assets._apply(*assets._scan())
+        assert await assets.read("a") == b"new"
+        assert assets.cached_bytes() == 7  # b и новая версия a
+
+    def test_broken_catalog_keeps_previous(self, tmp_path):
+        """Ошибка в каталоге не сбрасывает уже загруженный"""
+        data_dir = make_data_dir(
+            tmp_path, {"guide": {"file": "guide.jpg", "kind": "photo"}}
+        )
+        assets = AssetManager(str(data_dir), str(data_dir / "catalog.json"))
+
+        (data_dir / "catalog.json").write_text('{"guide": {"kind": "video"}}')
+        os.utime(data_dir / "catalog.json", ns=(1, 1))
+        assets._apply(*assets._scan())
+
+        assert assets.get("guide").kind == "photo"
+        assert not assets.available("guide")  # Файла нет в data/
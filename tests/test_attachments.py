@@ -0,0 +1,115 @@
+"""
+Тесты вложений: загрузка на диск и потоковая отправка письма
+"""
+
+import email
+import os
+import sys
+from email import policy
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from attachments import AttachmentSpool, AttachmentTooLarge, StreamedMessage
+from smtp_pool import SMTPPool
+
+
+def make_spool(tmp_path, content: bytes, **kwargs) -> AttachmentSpool:
+    spool = AttachmentSpool(str(tmp_path / "spool"), chunk_size=1024, **kwargs)
+    spool._client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=content)
+        )
+    )
+    return spool
+
+
+class TestAttachmentSpool:
+    """Тесты AttachmentSpool"""
+
+    @pytest.mark.asyncio
+    async def test_download_take_and_remove(self, tmp_path):
+        """Файл пишется на диск, take переносит вложения в папку письма"""
+        spool = make_spool(tmp_path, b"x" * 5000)
+        await spool.download(1, "https://files/a", "скан.pdf", "application/pdf", 5000)
+        await spool.download(
+            1, "https://files/b", "фото.jpg", "image/jpeg", None, "справка"
+        )
+
+        attachments = spool.take(1)
+        assert [(a.filename, a.size) for a in attachments] == [
+            ("скан.pdf", 5000),
+            ("фото.jpg", 5000),
+        ]
+        assert attachments[1].caption == "справка"
+        assert spool.pending(1) == []
+        with open(attachments[0].path, "rb") as f:
+            assert f.read() == b"x" * 5000
+
+        spool.remove([a.to_dict() for a in attachments])
+        assert not os.path.exists(attachments[0].path)
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_size_limits(self, tmp_path):
+        """Лимиты на файл и на обращение, в том числе без заранее известного размера"""
+        spool = make_spool(
+            tmp_path, b"x" * 3000, max_file_size=4000, max_total_size=5000
+        )
+        with pytest.raises(AttachmentTooLarge):
+            spool.check(1, 4001)
+
+        await spool.download(1, "https://files/a", "a", "text/plain")
+        with pytest.raises(AttachmentTooLarge):
+            # Размер не сообщён, загрузка прерывается по мере получения данных
+            await spool.download(1, "https://files/b", "b", "text/plain")
+        # Недокачанный файл удалён, остались файл и описание первого вложения
+        assert len(spool.pending(1)) == 1
+        assert len(os.listdir(tmp_path / "spool" / "u1")) == 2
+        await spool.close()
+
+
+class TestStreamedMessage:
+    """Тесты потоковой отправки письма с вложениями"""
+
+    def test_smtp_pool_streams_message(self, tmp_path):
+        """Письмо уходит кусками через DATA и собирается в исходные файлы"""
+        scan = tmp_path / "scan.pdf"
+        scan.write_bytes(os.urandom(300_000))
+        msg = StreamedMessage(
+            "bot@example.ru",
+            ["staff@example.ru"],
+            "Обращение",
+            "Текст\n.строка с точкой",
+            [
+                {
+                    "path": str(scan),
+                    "filename": "Справка.pdf",
+                    "mime_type": "application/pdf",
+                }
+            ],
+        )
+        server = MagicMock()
+        server.mail.return_value = (250, b"ok")
+        server.rcpt.return_value = (250, b"ok")
+        server.docmd.return_value = (354, b"go")
+        server.getreply.return_value = (250, b"queued")
+        pool = SMTPPool("smtp.example.ru", 465, "u", "p")
+        pool._connect = MagicMock(return_value=server)
+
+        pool.send(msg)
+
+        chunks = [call.args[0] for call in server.send.call_args_list]
+        assert chunks[-1] == b".\r\n"
+        assert (
+            max(len(chunk) for chunk in chunks) < 100_000
+        )  # Файл не собирается целиком
+        parsed = email.message_from_bytes(b"".join(chunks[:-1]), policy=policy.default)
+        assert parsed["Subject"] == "Обращение"
+        assert parsed.get_body().get_content() == "Текст\n.строка с точкой"
+        (part,) = parsed.iter_attachments()
+        assert part.get_filename() == "Справка.pdf"
+        assert part.get_content() == scan.read_bytes()
@@ -4,13 +4,17 @@
 
 import pytest
 import os
+import smtplib
 import sys
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 
 # Добавляем путь к модулю
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+import main
 from main import send_email, get_main_reply_markup
+from mailer import PermanentError
+from smtp_pool import SMTPPool
 
 
 class TestTgProbot:
@@ -30,26 +34,34 @@ class TestTgProbot:
     async def test_send_email_success(self):
         """Тест успешной отправки email"""
         with patch("smtplib.SMTP_SSL") as mock_smtp:
-            # Настраиваем мок
+            # Настраиваем мок: пул использует соединение без контекстного менеджера
             mock_server = MagicMock()
-            mock_smtp.return_value.__enter__.return_value = mock_server
-
-            # Устанавливаем переменные окружения
-            with patch.dict(
-                os.environ,
-                {
-                    "EMAIL_HOST": "smtp.test.com",
-                    "EMAIL_PORT": "587",
-                    "EMAIL_USER": "test@test.com",
-                    "EMAIL_PASSWORD": "test_password",
-                    "EMAIL_TO": "recipient@test.com",
-                },
+            mock_smtp.return_value = mock_server
+
+            # Настройки читаются при импорте, поэтому подменяем их в модуле
+            with patch.multiple(
+                main,
+                EMAIL_HOST="smtp.test.com",
+                EMAIL_PORT=587,
+                EMAIL_USER="test@test.com",
+                EMAIL_PASSWORD="test_password",
+                EMAIL_TO="recipient@test.com",
+                smtp_pool=SMTPPool(
+                    "smtp.test.com", 587, "test@test.com", "test_password"
+                ),
             ):
                 result = await send_email("Test Subject", "Test Message")
                 assert result is True
                 mock_server.login.assert_called_once()
                 mock_server.send_message.assert_called_once()
 
+                # Повторная отправка переиспользует соединение без новой авторизации
+                result = await send_email("Test Subject", "Test Message")
+                assert result is True
+                mock_smtp.assert_called_once()
+                mock_server.login.assert_called_once()
+                assert mock_server.send_message.call_count == 2
+
     @pytest.mark.asyncio
     async def test_send_email_missing_config(self):
         """Тест отправки email с отсутствующими настройками"""
@@ -76,6 +88,89 @@ class TestTgProbot:
                 result = await send_email("Test Subject", "Test Message")
                 assert result is False
 
+    @pytest.mark.asyncio
+    async def test_send_email_rejected(self):
+        """Окончательный отказ сервера (5xx) - PermanentError, письмо не повторяется"""
+        with patch("smtplib.SMTP_SSL") as mock_smtp:
+            mock_smtp.return_value.send_message.side_effect = smtplib.SMTPDataError(
+                554, b"Message rejected"
+            )
+            with patch.multiple(
+                main,
+                EMAIL_USER="test@test.com",
+                EMAIL_PASSWORD="test_password",
+                EMAIL_TO="recipient@test.com",
+                smtp_pool=SMTPPool(
+                    "smtp.test.com", 465, "test@test.com", "test_password"
+                ),
+            ):
+                with pytest.raises(PermanentError):
+                    await send_email("Test Subject", "Test Message")
+
+    def test_build_application(self):
+        """Приложение собирается с обработчиками команд, сообщений и кнопок"""
+        application = main.build_application("123456:TEST")
+        handlers = application.handlers[0]
+        assert len(handlers) == 6
+        assert len(application.handlers[-1]) == 1  # Реестр чатов для рассылок
+        assert len(application.handlers[-2]) == 1  # Счётчик апдейтов
+        assert application.error_handlers
+
+
+def text_update(user_id: int, text: str):
+    update = MagicMock(callback_query=None)
+    update.effective_user.id = user_id
+    update.message.text = text
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+class TestMenuButtons:
+    """Кнопки меню во время обращения не уходят специалистам"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("state", [main.AWAITING_MESSAGE, main.FAQ_ANSWERED])
+    async def test_cancel_drops_message_and_attachments(self, state):
+        """«Отмена» после автоответа или с приложенными файлами - не письмо"""
+        user_id = 1000 + state
+        main.user_states[user_id] = state
+        spool = MagicMock()
+        submit = AsyncMock()
+        with patch.object(main, "attachment_spool", spool), patch.object(
+            main.mail_queue, "submit", submit
+        ):
+            await main.handle_message(text_update(user_id, "🔙 Отмена"), None)
+
+        submit.assert_not_called()
+        spool.discard.assert_called_once_with(user_id)
+        assert main.user_states.get(user_id) == main.MAIN_MENU
+
+    @pytest.mark.asyncio
+    async def test_main_menu_button_leaves_faq_follow_up(self):
+        user_id = 2000
+        main.user_states[user_id] = main.FAQ_ANSWERED
+        submit = AsyncMock()
+        with patch.object(main, "attachment_spool", MagicMock()), patch.object(
+            main.mail_queue, "submit", submit
+        ):
+            await main.handle_message(text_update(user_id, "🚀 Главное меню 🚀"), None)
+
+        submit.assert_not_called()
+        assert main.user_states.get(user_id) == main.MAIN_MENU
+
+    @pytest.mark.asyncio
+    async def test_inline_button_ends_faq_follow_up(self):
+        """Нажатие кнопки после автоответа возвращает в главное меню"""
+        user_id = 3000
+        main.user_states[user_id] = main.FAQ_ANSWERED
+        update = MagicMock()
+        update.effective_user.id = user_id
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.data = "unknown"
+        await main.button_click(update, None)
+
+        assert main.user_states.get(user_id) == main.MAIN_MENU
+
 
 class TestEnvironmentSetup:
     """Тесты настройки окружения"""
@@ -0,0 +1,77 @@
+"""
+Тесты массовых рассылок
+"""
+
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram.error import Forbidden
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from broadcast import DONE, Broadcaster, ChatRegistry
+
+
+class TestBroadcaster:
+    """Тесты Broadcaster и ChatRegistry"""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_sends_in_batches_and_prunes_blocked(self):
+        """Рассылка доходит до всех, заблокировавшие бота удаляются из реестра"""
+        registry = ChatRegistry()
+        for chat_id in range(1, 8):
+            registry.remember(chat_id)
+
+        async def send_message(chat_id, text, rate_limit_args=None):
+            if chat_id == 3:
+                raise Forbidden("bot was blocked by the user")
+
+        bot = AsyncMock()
+        bot.send_message.side_effect = send_message
+        broadcaster = Broadcaster(bot, registry, batch_size=3)
+        info = await broadcaster.run(registry.create_broadcast("Объявление"))
+
+        assert info["status"] == DONE
+        assert (info["sent"], info["failed"], info["pruned"]) == (6, 0, 1)
+        assert bot.send_message.await_args.kwargs["rate_limit_args"] == "bulk"
+        assert not registry.is_known(3)
+        assert registry.active_count() == 6
+
+    @pytest.mark.asyncio
+    async def test_resume_from_checkpoint(self, tmp_path):
+        """Прерванная рассылка продолжается с сохранённой пачки"""
+        db_path = str(tmp_path / "chats.sqlite3")
+        registry = ChatRegistry(db_path)
+        for chat_id in range(1, 6):
+            registry.remember(chat_id)
+        broadcast_id = registry.create_broadcast("Объявление")
+        registry.save_progress(broadcast_id, 3, 3, 0, 0)  # Первая пачка ушла
+        registry.close()
+
+        registry = ChatRegistry(db_path)
+        bot = AsyncMock()
+        broadcaster = Broadcaster(bot, registry)
+        assert registry.unfinished_broadcasts() == [broadcast_id]
+        await broadcaster.resume_unfinished()
+        await broadcaster._tasks[broadcast_id]
+
+        sent_to = [call.args[0] for call in bot.send_message.await_args_list]
+        assert sent_to == [4, 5]
+        assert registry.broadcast(broadcast_id)["sent"] == 5
+        assert registry.unfinished_broadcasts() == []
+
+    def test_claim_respects_other_replica_lease(self, tmp_path):
+        """Рассылку другого процесса можно забрать только после снятия аренды"""
+        db_path = str(tmp_path / "chats.sqlite3")
+        first = ChatRegistry(db_path, owner="a")
+        second = ChatRegistry(db_path, owner="b")
+        broadcast_id = first.create_broadcast("Объявление")
+
+        assert second.unfinished_broadcasts() == []
+        assert not second.claim_broadcast(broadcast_id)
+        first.release_broadcasts([broadcast_id])
+        assert second.unfinished_broadcasts() == [broadcast_id]
+        assert second.claim_broadcast(broadcast_id)
+        assert not first.claim_broadcast(broadcast_id)
@@ -0,0 +1,144 @@
+"""
+Тесты автоответов на частые вопросы
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from faq import FAQ, FAQIndex, compile_faq, stem, terms
+
+DATA_FAQ = os.path.join(os.path.dirname(__file__), "..", "data", "faq.json")
+
+
+def write_faq(path, entries) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    return str(path)
+
+
+class TestStemmer:
+    """Тесты стеммера и нормализации"""
+
+    @pytest.mark.parametrize(
+        "words",
+        [
+            ("Андриевский", "Андриевского", "андриевскому"),
+            ("кабинет", "кабинете", "кабинетов"),
+            ("стипендия", "стипендии", "стипендию"),
+            ("документы", "документов", "Документ"),
+            ("записаться", "записался", "записалась"),
+        ],
+    )
+    def test_word_forms_share_stem(self, words):
+        assert len({stem(word) for word in words}) == 1
+
+    def test_terms_drop_stop_words_and_punctuation(self):
+        assert terms("Подскажите, пожалуйста: где кабинет?!") == ["кабинет"]
+        assert terms("Ещё") == []
+
+
+class TestFAQIndex:
+    """Тесты FAQIndex"""
+
+    def make_index(self) -> FAQIndex:
+        return compile_faq(
+            [
+                {
+                    "id": "book",
+                    "questions": ["Как записаться к психологу"],
+                    "answer": "По ссылке",
+                },
+                {
+                    "id": "office",
+                    "questions": ["Где кабинет психолога", "Номер кабинета"],
+                    "answer": "325",
+                    "buttons": [[{"text": "Меню", "callback": "menu:main"}]],
+                },
+            ]
+        )
+
+    def test_best_question_wins(self):
+        index = self.make_index()
+        matches = index.search("В каком кабинете психолог?")
+        assert [m.entry.id for m in matches] == ["office", "book"]
+        assert matches[0].score == pytest.approx(1.0)
+        assert matches[0].entry.reply_markup.inline_keyboard[0][0].text == "Меню"
+
+    def test_unknown_words_lower_score(self):
+        index = self.make_index()
+        known = index.search("записаться к психологу")[0].score
+        unknown = index.search("записаться к психологу на массаж")[0].score
+        assert unknown < known
+
+    def test_no_common_terms(self):
+        assert self.make_index().search("расписание экзаменов") == []
+        assert FAQIndex([]).search("кабинет") == []
+
+
+class TestFAQ:
+    """Тесты FAQ: порог уверенности и перезагрузка базы"""
+
+    def test_real_base(self):
+        """Типичные вопросы студентов из data/faq.json"""
+        faq = FAQ(DATA_FAQ)
+        cases = {
+            "Как записаться к Андриевскому?": "book_andrievsky",
+            "в каком кабинете Андриевский": "psychologists_offices",
+            "Добрый день, какие нужны документы для социальной стипендии?": (
+                "stipend_documents"
+            ),
+            "как связаться с Дунаевской": "social_pedagogue",
+        }
+        for text, entry_id in cases.items():
+            assert faq.match(text).entry.id == entry_id, text
+        # Не по теме базы или неоднозначно - специалистам
+        assert faq.match("Меня обижают в группе, помогите") is None
+        assert faq.match("как записаться к стоматологу") is None
+
+    def test_match_under_millisecond(self):
+        faq = FAQ(DATA_FAQ)
+        text = "Подскажите, какие документы нужны для социальной стипендии?"
+        started = time.perf_counter()
+        for _ in range(1000):
+            faq.match(text)
+        assert (time.perf_counter() - started) / 1000 < 0.001
+
+    def test_ambiguous_match_is_rejected(self, tmp_path):
+        faq_path = write_faq(
+            tmp_path / "faq.json",
+            [
+                {"id": "a", "questions": ["кабинет психолога"], "answer": "1"},
+                {"id": "b", "questions": ["кабинет педагога"], "answer": "2"},
+            ],
+        )
+        faq = FAQ(faq_path, min_score=0.3, min_margin=0.1)
+        assert faq.match("кабинет") is None
+        assert faq.match("кабинет психолога").entry.id == "a"
+
+    def test_missing_file_disables_answers(self, tmp_path):
+        faq = FAQ(str(tmp_path / "faq.json"))
+        assert len(faq) == 0
+        assert faq.match("где кабинет психолога") is None
+
+    def test_reload_keeps_old_index_on_error(self, tmp_path):
+        entries = [{"id": "a", "questions": ["кабинет психолога"], "answer": "1"}]
+        faq_path = write_faq(tmp_path / "faq.json", entries)
+        faq = FAQ(faq_path)
+        with open(faq_path, "w", encoding="utf-8") as f:
+            f.write("[{")
+        os.utime(faq_path, ns=(0, 1))
+        assert not faq.reload_if_changed()
+        assert faq.match("кабинет психолога").entry.id == "a"
+
+        write_faq(
+            faq_path, entries + [{"id": "b", "questions": ["бланк"], "answer": ""}]
+        )
+        os.utime(faq_path, ns=(0, 2))
+        assert faq.reload_if_changed()
+        assert len(faq) == 2
@@ -0,0 +1,60 @@
+"""
+Тесты проверок здоровья
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from health import HealthMonitor
+
+
+class TestHealthMonitor:
+    """Тесты HealthMonitor"""
+
+    def test_liveness_and_readiness(self):
+        """Readiness включает проверки liveness, готовность и свои проверки"""
+        health = HealthMonitor()
+        queue_ok = True
+        health.add_check("poll", lambda: True)
+        health.add_check("mail_queue", lambda: queue_ok, readiness=True)
+        health.add_info("smtp_circuit", lambda: "closed")
+
+        ok, report = health.liveness()
+        assert ok and report["status"] == "ok"
+        assert report["smtp_circuit"] == "closed"
+
+        ok, report = health.readiness()
+        assert not ok and report["failed"] == ["started"]
+
+        health.ready = True
+        queue_ok = False
+        ok, report = health.readiness()
+        assert not ok and report["failed"] == ["mail_queue"]
+        assert health.liveness()[0]
+
+    def test_failing_check_does_not_raise(self):
+        """Исключение в проверке считается неуспехом, а не ошибкой сервера"""
+        health = HealthMonitor()
+        health.add_check("broken", lambda: 1 / 0)
+        ok, report = health.liveness()
+        assert not ok and report["failed"] == ["broken"]
+
+    @pytest.mark.asyncio
+    async def test_loop_lag_detected(self):
+        """Блокирующий вызов в event loop виден как задержка"""
+        health = HealthMonitor(max_loop_lag=0.05)
+        task = asyncio.create_task(health.watch_loop(interval=0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # Блокируем event loop
+        await asyncio.sleep(0.03)
+        task.cancel()
+
+        ok, report = health.liveness()
+        assert not ok and "loop_lag" in report["failed"]
+        assert report["loop_lag_max_ms"] >= 50
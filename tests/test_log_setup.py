@@ -0,0 +1,75 @@
+"""
+Тесты настройки логирования
+"""
+
+import json
+import logging
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import log_setup
+from log_setup import JsonFormatter, SamplingFilter, parse_levels, parse_rates
+
+
+def make_record(name="main", level=logging.INFO, msg="сообщение", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter:
+    """Тесты JSON-формата"""
+
+    def test_fields_and_extra(self):
+        """В JSON попадают уровень, логгер, текст и поля из extra"""
+        line = JsonFormatter().format(make_record(send_ms=42, reused=True))
+        data = json.loads(line)
+        assert data["level"] == "INFO"
+        assert data["logger"] == "main"
+        assert data["msg"] == "сообщение"
+        assert data["send_ms"] == 42 and data["reused"] is True
+        assert "ts" in data
+
+    def test_exception_goes_to_separate_field(self):
+        """Трассировка не смешивается с текстом сообщения"""
+        log_queue = queue.SimpleQueue()
+        handler = log_setup._QueueHandler(log_queue)
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            record = make_record(level=logging.ERROR, msg="ошибка %s", exc_info=None)
+            record.args = ("SMTP",)
+            record.exc_info = sys.exc_info()
+            handler.emit(record)
+
+        data = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+        assert data["msg"] == "ошибка SMTP"
+        assert "ValueError: сбой" in data["exc"]
+
+
+class TestSampling:
+    """Тесты прореживания и разбора настроек"""
+
+    def test_keeps_every_nth_and_all_warnings(self):
+        """Из INFO остаётся каждая N-я запись, предупреждения проходят все"""
+        sampler = SamplingFilter({"telegram.ext": 0.25})
+        kept = [sampler.filter(make_record("telegram.ext.Updater")) for _ in range(8)]
+        assert kept.count(True) == 2
+        assert sampler.dropped == 6
+        assert sampler.filter(make_record("telegram.ext", logging.WARNING))
+        assert sampler.filter(make_record("main"))
+
+    def test_parse_settings(self):
+        """Разбор LOG_LEVELS и LOG_SAMPLE"""
+        assert parse_levels("httpx=warning, main=DEBUG,") == {
+            "httpx": "WARNING",
+            "main": "DEBUG",
+        }
+        assert parse_rates("telegram.ext=0.1") == {"telegram.ext": 0.1}
+
+    def test_redact_hides_body_by_default(self):
+        """Текст пользователя по умолчанию не попадает в лог"""
+        assert log_setup.redact("мой телефон 8-900-000-00-00") == "<скрыто, 27 симв.>"
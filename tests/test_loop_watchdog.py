@@ -0,0 +1,60 @@
+"""
+Тесты сторожа event loop
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from loop_watchdog import LoopWatchdog
+from metrics import Registry
+
+
+def blocking_helper():
+    time.sleep(0.2)  # Типичная ошибка: синхронный вызов в обработчике
+
+
+class TestLoopWatchdog:
+    """Тесты LoopWatchdog"""
+
+    @pytest.mark.asyncio
+    async def test_reports_blocking_site(self):
+        """Блокировка обнаруживается, место указывает на блокирующую функцию"""
+        registry = Registry()
+        blocks = registry.counter("blocked_total", "Блокировки", ("site",))
+        durations = registry.histogram("block_seconds", "Длительность")
+        watchdog = LoopWatchdog(
+            threshold=0.05,
+            interval=0.01,
+            block_histogram=durations,
+            block_counter=blocks,
+        )
+        watchdog.start()
+        await asyncio.sleep(0.03)
+        blocking_helper()
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+
+        assert len(watchdog.sites) == 1
+        site = next(iter(watchdog.sites))
+        assert site.startswith("test_loop_watchdog.py:") and "blocking_helper" in site
+        assert blocks.value(site) == 1
+        assert durations.count() == 1
+
+    @pytest.mark.asyncio
+    async def test_quiet_loop_not_reported(self):
+        """Без блокировок сторож молчит, задержка при этом измеряется"""
+        registry = Registry()
+        lag = registry.histogram("lag_seconds", "Задержка")
+        watchdog = LoopWatchdog(threshold=0.1, interval=0.01, lag_histogram=lag)
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        await watchdog.stop()
+
+        assert watchdog.sites == {}
+        assert lag.count() > 0
@@ -0,0 +1,247 @@
+"""
+Тесты почтовой очереди и outbox
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from digest import build_digest, is_urgent
+from mailer import MailQueue, PermanentError
+from outbox import DEAD, Outbox
+
+
+async def wait_until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+class TestMailQueue:
+    """Тесты MailQueue"""
+
+    @pytest.mark.asyncio
+    async def test_jobs_sent_off_event_loop(self):
+        """Письма отправляются в потоках пула, а не в потоке event loop"""
+        threads = []
+
+        def send(subject, body):
+            threads.append(threading.current_thread())
+            return True
+
+        queue = MailQueue(send, Outbox(), workers=2)
+        await queue.start()
+        await queue.submit("s1", "b1")
+        await queue.submit("s2", "b2")
+        await wait_until(lambda: queue.sent == 2)
+        await queue.stop()
+
+        assert queue.qsize() == 0
+        assert threading.main_thread() not in threads
+
+    @pytest.mark.asyncio
+    async def test_retry_with_backoff_then_dead(self):
+        """Неудачные письма повторяются, а после max_attempts откладываются"""
+        outbox = Outbox()
+        attempts = []
+
+        def send(subject, body):
+            attempts.append(subject)
+            if subject == "boom":
+                raise RuntimeError("SMTP down")
+            return len(attempts) > 2
+
+        queue = MailQueue(send, outbox, workers=1, max_attempts=2, backoff_base=0.01)
+        await queue.start()
+        await queue.submit("boom", "")
+        await wait_until(lambda: queue.dead == 1)
+        await queue.submit("flaky", "")
+        await wait_until(lambda: queue.sent == 1)
+        await queue.stop()
+
+        assert attempts == ["boom", "boom", "flaky"]
+        assert queue.failed == 1
+        assert outbox.count() == 0
+        assert outbox.count(DEAD) == 1
+
+    @pytest.mark.asyncio
+    async def test_outage_does_not_spend_attempts(self):
+        """Пока SMTP недоступен, письмо повторяется без учёта max_attempts"""
+        outbox = Outbox()
+        attempts = []
+
+        def send(subject, body):
+            attempts.append(subject)
+            return len(attempts) > 5
+
+        queue = MailQueue(send, outbox, workers=1, max_attempts=2, backoff_base=0.01)
+        await queue.start()
+        await queue.submit("outage", "")
+        await wait_until(lambda: queue.sent == 1)
+        await queue.stop()
+
+        assert len(attempts) == 6
+        assert queue.dead == 0
+
+    @pytest.mark.asyncio
+    async def test_permanent_error_and_age_limit(self):
+        """Отклонённое сервером письмо откладывается сразу, недоставленное -
+        по возрасту; отложенные можно вернуть в очередь"""
+        outbox = Outbox()
+        attempts = []
+        deliver = threading.Event()
+
+        def send(subject, body):
+            attempts.append(subject)
+            if deliver.is_set():
+                return True
+            if subject == "rejected":
+                raise PermanentError("554 spam")
+            return False
+
+        queue = MailQueue(send, outbox, workers=1, max_age=0.2, backoff_base=0.01)
+        await queue.start()
+        await queue.submit("rejected", "")
+        await wait_until(lambda: queue.dead == 1)
+        assert attempts == ["rejected"]
+        await queue.submit("old", "")
+        await wait_until(lambda: queue.dead == 2)
+        assert queue.dead_in_outbox == outbox.count(DEAD) == 2
+
+        deliver.set()
+        assert await queue.requeue_dead() == 2
+        await wait_until(lambda: queue.sent == 2)
+        await queue.stop()
+        assert queue.dead_in_outbox == outbox.count(DEAD) == 0
+
+    @pytest.mark.asyncio
+    async def test_undelivered_replayed_on_start(self, tmp_path):
+        """Письма, не отправленные до остановки, отправляются после перезапуска"""
+        db_path = str(tmp_path / "outbox.sqlite3")
+        outbox = Outbox(db_path)
+        outbox.add("queued", "")
+        outbox.add("interrupted", "")
+        outbox.claim(1)  # Отправка прервана остановкой процесса
+        outbox.close()
+
+        sent = []
+        queue = MailQueue(lambda s, b: sent.append(s) or True, Outbox(db_path))
+        await queue.start()
+        assert queue.qsize() == 2
+        await wait_until(lambda: queue.sent == 2)
+        await queue.stop()
+
+        assert sorted(sent) == ["interrupted", "queued"]
+
+    @pytest.mark.asyncio
+    async def test_digest_batches_regular_and_sends_urgent_immediately(self):
+        """В режиме дайджеста обычные письма копятся, срочные уходят сразу"""
+        sent = []
+        queue = MailQueue(
+            lambda s, b: sent.append((s, b)) or True,
+            Outbox(),
+            digest_window=60,
+            digest_max=3,
+        )
+        await queue.start()
+        await queue.submit("первое", "текст 1")
+        await queue.submit("второе", "текст 2")
+        await queue.submit("срочное", "срочно", urgent=True)
+        await wait_until(lambda: queue.sent == 1)
+        assert sent == [("срочное", "срочно")]
+
+        await queue.submit("третье", "текст 3")  # digest_max набран
+        await wait_until(lambda: queue.sent == 4)
+        await queue.stop()
+
+        subject, body = sent[1]
+        assert subject == "Сводка обращений из Telegram (3)"
+        assert "текст 1" in body and "текст 3" in body
+
+    @pytest.mark.asyncio
+    async def test_digest_window_anchored_on_oldest_message(self):
+        """Письма, пришедшие в пределах одного окна, уходят одной сводкой"""
+        sent = []
+        queue = MailQueue(
+            lambda s, b: sent.append(s) or True,
+            Outbox(),
+            digest_window=0.5,
+            digest_max=20,
+        )
+        await queue.start()
+        for n in range(6):
+            await queue.submit(f"письмо {n}", f"текст {n}")
+            await asyncio.sleep(0.05)
+        await wait_until(lambda: queue.sent == 6)
+        await queue.stop()
+
+        assert sent == ["Сводка обращений из Telegram (6)"]
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        """Переполненная очередь сразу сообщает об ошибке"""
+        queue = MailQueue(lambda s, b: True, Outbox(), maxsize=1)
+        await queue.submit("s", "b")
+        with pytest.raises(asyncio.QueueFull):
+            await queue.submit("s", "b")
+
+    @pytest.mark.asyncio
+    async def test_attachments_passed_and_cleaned_up(self):
+        """Вложения доходят до send_func, после доставки вызывается on_sent"""
+        sent, delivered = [], []
+        queue = MailQueue(
+            lambda *args: sent.append(args) or True,
+            Outbox(),
+            on_sent=lambda item: delivered.append(item.attachments),
+        )
+        await queue.start()
+        files = [
+            {"path": "/tmp/a", "filename": "a.pdf", "mime_type": "application/pdf"}
+        ]
+        await queue.submit("с файлом", "b", attachments=files)
+        await queue.submit("без файлов", "b")
+        await wait_until(lambda: len(delivered) == 2)
+        await queue.stop()
+
+        assert sorted(sent) == [("без файлов", "b"), ("с файлом", "b", files)]
+        assert files in delivered
+
+
+class TestSharedOutbox:
+    """Тесты outbox, общего для нескольких процессов"""
+
+    def test_lease_expiry_lets_other_replica_claim(self, tmp_path):
+        """Письмо упавшего процесса забирает другой после истечения аренды"""
+        db_path = str(tmp_path / "outbox.sqlite3")
+        first = Outbox(db_path, owner="a", lease=60)
+        second = Outbox(db_path, owner="b", lease=60)
+        first.add("s", "b")
+
+        assert [item.subject for item in first.claim(10, now=2e9)] == ["s"]
+        assert second.claim(10, now=2e9 + 30) == []
+        assert second.requeue_sending() == 0  # Чужие письма не возвращаются
+        assert len(second.claim(10, now=2e9 + 61)) == 1
+        assert first.requeue_sending() == 0  # Письмо уже закреплено за b
+        assert second.requeue_sending() == 1
+
+    """Тесты сборки дайджеста"""
+
+    def test_is_urgent(self):
+        """Срочность определяется по ключевым словам без учёта регистра"""
+        assert is_urgent("Помогите, СРОЧНО нужна консультация")
+        assert not is_urgent("Когда работает кабинет 216?")
+        assert not is_urgent(None)
+
+    def test_build_digest_strips_indentation(self):
+        """Письма в сводке нумеруются, отступы шаблона убираются"""
+        item = type("Item", (), {"subject": "Тема", "body": "\n    строка\n    ещё"})
+        subject, body = build_digest([item, item])
+        assert subject == "Сводка обращений из Telegram (2)"
+        assert "===== Обращение 2 из 2: Тема =====" in body
+        assert "\nстрока\nещё\n" in body
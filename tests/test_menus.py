@@ -0,0 +1,56 @@
+"""
+Тесты декларативного меню
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from menus import MenuRegistry
+
+MENU_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "menus.json")
+STATES = {
+    "MAIN_MENU": 0,
+    "PSYCHOLOGISTS_MENU": 1,
+    "SOCIAL_PEDAGOGUES_MENU": 2,
+    "DOCUMENTS_MENU": 3,
+}
+
+
+class TestMenuRegistry:
+    """Тесты MenuRegistry"""
+
+    def test_shipped_menu_compiles(self):
+        """Меню из data/menus.json собирается, экраны общие для всех вызовов"""
+        menus = MenuRegistry(MENU_PATH, STATES)
+        documents = menus.screen("documents")
+        assert documents.state == STATES["DOCUMENTS_MENU"]
+        callbacks = [
+            button.callback_data
+            for row in documents.reply_markup.inline_keyboard
+            for button in row
+        ]
+        assert callbacks == ["doc:guide", "doc:application", "menu:social_pedagogues"]
+        assert menus.screen("documents") is documents
+        assert menus.keyboard("cancel").keyboard[0][0].text == "🔙 Отмена"
+
+    def test_reload_swaps_menu_and_keeps_old_on_error(self, tmp_path):
+        """Изменённый файл подхватывается, а битый не ломает текущее меню"""
+        menu_path = tmp_path / "menus.json"
+        screen = {"state": "MAIN_MENU", "text": "Старое", "buttons": []}
+        menu_path.write_text(json.dumps({"screens": {"main": screen}}))
+        menus = MenuRegistry(str(menu_path), STATES)
+
+        screen["text"] = "Новое"
+        menu_path.write_text(json.dumps({"screens": {"main": screen, "new": screen}}))
+        os.utime(menu_path, ns=(1, 1))
+        assert menus.reload_if_changed()
+        assert menus.screen("main").text == "Новое"
+        assert "new" in menus
+
+        menu_path.write_text("{not json")
+        os.utime(menu_path, ns=(2, 2))
+        assert not menus.reload_if_changed()
+        assert menus.screen("main").text == "Новое"
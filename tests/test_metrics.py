@@ -0,0 +1,103 @@
+"""
+Тесты метрик Prometheus
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metrics import MetricsServer, Registry, timed
+
+
+class TestRegistry:
+    """Тесты счётчиков, гистограмм и текстового формата"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Корзины гистограммы накопительные, сумма и количество верны"""
+        registry = Registry()
+        latency = registry.histogram(
+            "latency_seconds", "Время", ("handler",), buckets=(0.1, 1.0)
+        )
+        for value in (0.05, 0.5, 0.5, 5.0):
+            latency.observe(value, "start")
+
+        text = registry.render()
+        assert 'latency_seconds_bucket{handler="start",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{handler="start",le="1.0"} 3' in text
+        assert 'latency_seconds_bucket{handler="start",le="+Inf"} 4' in text
+        assert 'latency_seconds_count{handler="start"} 4' in text
+        assert 'latency_seconds_sum{handler="start"} 6.05' in text
+        assert latency.count("start") == 4
+
+    def test_counter_and_gauge(self):
+        """Счётчики с метками и значения, снимаемые функцией"""
+        registry = Registry()
+        updates = registry.counter("updates_total", "Апдейты", ("type",))
+        updates.inc("message")
+        updates.inc("message")
+        updates.inc("callback_query")
+        registry.gauge("queue_depth", "Очередь", lambda: 7)
+
+        text = registry.render()
+        assert "# TYPE updates_total counter" in text
+        assert 'updates_total{type="message"} 2' in text
+        assert 'updates_total{type="callback_query"} 1' in text
+        assert "queue_depth 7" in text
+
+    def test_gauge_with_labels(self):
+        """Функция gauge с метками возвращает значения по наборам меток"""
+        registry = Registry()
+        registry.gauge(
+            "relay_up", "Серверы", lambda: {("a:465",): 1, ("b:25",): 0}, ("relay",)
+        )
+        text = registry.render()
+        assert 'relay_up{relay="a:465"} 1' in text
+        assert 'relay_up{relay="b:25"} 0' in text
+
+    @pytest.mark.asyncio
+    async def test_timed_records_failures_too(self):
+        """Декоратор timed учитывает и завершившиеся ошибкой вызовы"""
+        registry = Registry()
+        latency = registry.histogram("h_seconds", "Время", ("handler",))
+
+        @timed(latency, "broken")
+        async def broken():
+            raise ValueError("сбой")
+
+        with pytest.raises(ValueError):
+            await broken()
+        assert latency.count("broken") == 1
+
+
+class TestMetricsServer:
+    """Тесты HTTP-сервера метрик"""
+
+    @pytest.mark.asyncio
+    async def test_serves_metrics_and_404(self):
+        """GET /metrics отдаёт текст, неизвестный путь - 404"""
+        registry = Registry()
+        registry.gauge("queue_depth", "Очередь", lambda: 3)
+        server = MetricsServer("127.0.0.1", 0)
+        server.add_route("/metrics", lambda: (200, "text/plain", registry.render()))
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+
+        async def get(path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+
+        try:
+            ok = await get("/metrics")
+            assert ok.startswith("HTTP/1.1 200")
+            assert "queue_depth 3" in ok
+            assert (await get("/other")).startswith("HTTP/1.1 404")
+        finally:
+            await server.stop()
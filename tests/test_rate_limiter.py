@@ -0,0 +1,83 @@
+"""
+Тесты планировщика запросов к Bot API
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from telegram.error import RetryAfter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limiter import BULK, OutboundScheduler
+
+
+async def send(scheduler, chat_id, log, name, priority=None):
+    async def callback():
+        log.append(name)
+        return True
+
+    return await scheduler.process_request(
+        callback, (), {}, "sendMessage", {"chat_id": chat_id}, priority
+    )
+
+
+class TestOutboundScheduler:
+    """Тесты OutboundScheduler"""
+
+    @pytest.mark.asyncio
+    async def test_chat_limit_delays_burst(self):
+        """Сверх burst сообщения в один чат ждут пополнения корзины"""
+        scheduler = OutboundScheduler(chat_rate=20, chat_burst=2)
+        log = []
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for n in range(4):
+            await send(scheduler, 1, log, n)
+        assert loop.time() - started >= 0.09
+        assert scheduler.stats()["delayed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_interactive_before_bulk(self):
+        """При исчерпании общего лимита интерактивные ответы идут первыми"""
+        scheduler = OutboundScheduler(global_rate=20)
+        scheduler._global.tokens = 0
+        log = []
+        await asyncio.gather(
+            *(send(scheduler, 100 + n, log, f"bulk{n}", BULK) for n in range(3)),
+            send(scheduler, 1, log, "reply"),
+        )
+        assert log[0] == "reply"
+
+    @pytest.mark.asyncio
+    async def test_retry_after_respected(self):
+        """После RetryAfter запрос повторяется"""
+        scheduler = OutboundScheduler()
+        calls = []
+
+        async def callback():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RetryAfter(0)
+            return "ok"
+
+        result = await scheduler.process_request(
+            callback, (), {}, "sendMessage", {"chat_id": 1}, None
+        )
+        assert result == "ok"
+        assert scheduler.retry_after_hits == 1
+
+    @pytest.mark.asyncio
+    async def test_callback_answers_not_limited(self):
+        """answerCallbackQuery не расходует лимит сообщений"""
+        scheduler = OutboundScheduler()
+
+        async def callback():
+            return True
+
+        await scheduler.process_request(
+            callback, (), {}, "answerCallbackQuery", {}, None
+        )
+        assert scheduler.requests == 0
@@ -0,0 +1,76 @@
+"""
+Тесты маршрутизации inline-кнопок
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from router import CallbackRouter
+
+
+class TestCallbackRouter:
+    """Тесты CallbackRouter"""
+
+    @pytest.mark.asyncio
+    async def test_exact_and_parameterized_routes(self):
+        """Точные маршруты и маршруты с параметрами вызывают свои обработчики"""
+        router = CallbackRouter()
+        calls = []
+
+        @router.route("back")
+        async def back(update, context):
+            calls.append("back")
+
+        @router.route("doc:<doc_id>")
+        async def doc(update, context, doc_id):
+            calls.append(("doc", doc_id))
+
+        @router.route("menu:<node>:page:<page>")
+        async def page(update, context, node, page):
+            calls.append((node, page))
+
+        assert await router.dispatch("back", None, None)
+        assert await router.dispatch("doc:guide", None, None)
+        assert await router.dispatch("menu:tests:page:2", None, None)
+        assert not await router.dispatch("doc", None, None)
+        assert not await router.dispatch("unknown:x", None, None)
+        assert not await router.dispatch(None, None, None)
+        assert calls == ["back", ("doc", "guide"), ("tests", "2")]
+
+    @pytest.mark.asyncio
+    async def test_static_segment_wins_over_parameter(self):
+        """Статический сегмент имеет приоритет над параметром"""
+        router = CallbackRouter()
+        calls = []
+
+        @router.route("doc:<doc_id>")
+        async def doc(update, context, doc_id):
+            calls.append(doc_id)
+
+        @router.route("doc:all")
+        async def all_docs(update, context):
+            calls.append("ALL")
+
+        await router.dispatch("doc:all", None, None)
+        await router.dispatch("doc:guide", None, None)
+        assert calls == ["ALL", "guide"]
+
+    @pytest.mark.asyncio
+    async def test_route_timings_collected(self):
+        """Для каждого маршрута собирается количество вызовов и время"""
+        router = CallbackRouter()
+
+        @router.route("doc:<doc_id>")
+        async def doc(update, context, doc_id):
+            pass
+
+        for doc_id in ("a", "b", "c"):
+            await router.dispatch(f"doc:{doc_id}", None, None)
+
+        stats = router.stats()["doc:<doc_id>"]
+        assert stats["count"] == 3
+        assert stats["max"] >= stats["avg"] >= 0
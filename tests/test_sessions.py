@@ -0,0 +1,112 @@
+"""
+Тесты хранилища сессий
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from sessions import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+
+class TestMemorySessionStore:
+    """Тесты MemorySessionStore"""
+
+    def test_lru_eviction_keeps_size_bounded(self):
+        """Сверх max_size вытесняются давно не активные пользователи"""
+        store = MemorySessionStore(max_size=2)
+        store[1] = 1
+        store[2] = 2
+        store.get(1)  # Пользователь 1 снова активен
+        store[3] = 3
+
+        assert len(store) == 2
+        assert store.get(2) is None
+        assert store.get(1) == 1
+        assert store.evicted == 1
+
+    def test_ttl_expiry(self):
+        """Состояние старше TTL забывается"""
+        store = MemorySessionStore(ttl=60)
+        with patch("sessions.time.time", return_value=1000):
+            store[1] = 4
+        with patch("sessions.time.time", return_value=1030):
+            assert store.get(1) == 4
+        with patch("sessions.time.time", return_value=1100):
+            assert store.get(1, 0) == 0
+            assert len(store) == 0
+
+
+class TestSQLiteSessionStore:
+    """Тесты SQLiteSessionStore"""
+
+    def test_sessions_survive_restart(self, tmp_path):
+        """Состояния сохраняются между перезапусками"""
+        db_path = str(tmp_path / "sessions.sqlite3")
+        store = SQLiteSessionStore(db_path)
+        store[42] = 3
+        store[7] = 0
+        store.close()
+
+        restarted = SQLiteSessionStore(db_path)
+        assert restarted.get(42) == 3
+        assert restarted.get(7) == 0
+        assert restarted.get(99) is None
+        assert restarted.pop(42) == 3
+        assert restarted.get(42) is None
+
+    def test_purge_bounds_size(self, tmp_path):
+        """purge удаляет просроченные и самые старые записи"""
+        store = SQLiteSessionStore(str(tmp_path / "s.sqlite3"), ttl=60, max_size=2)
+        for user_id, now in ((1, 900), (2, 1000), (3, 1010), (4, 1020)):
+            with patch("sessions.time.time", return_value=now):
+                store[user_id] = 1
+        with patch("sessions.time.time", return_value=1030):
+            store.purge()
+
+        assert len(store) == 2
+
+    def test_purge_in_batches(self, tmp_path):
+        store = SQLiteSessionStore(
+            str(tmp_path / "s.sqlite3"), ttl=60, max_size=5, cache_size=0
+        )
+        with patch("sessions.time.time", return_value=1000):
+            for user_id in range(20):
+                store[user_id] = 1
+        with patch("sessions.time.time", return_value=1030):
+            for user_id in range(20, 30):
+                store[user_id] = 1
+            store.purge(batch=3)
+
+        assert len(store) == 5
+        assert store.get(29) == 1
+
+    @pytest.mark.asyncio
+    async def test_writes_do_not_purge_inline(self, tmp_path):
+        """Запись не запускает очистку, её выполняет фоновая задача watch"""
+        store = SQLiteSessionStore(str(tmp_path / "s.sqlite3"), max_size=10)
+        with patch.object(store, "purge") as purge:
+            for user_id in range(2000):
+                store[user_id] = 1
+            purge.assert_not_called()
+            task = asyncio.create_task(store.watch(interval=0.01))
+            await asyncio.sleep(0.05)
+            task.cancel()
+        assert purge.called
+
+    def test_shared_store_sees_other_process_writes(self, tmp_path):
+        """В режиме shared кэш отключён и изменения другого процесса видны сразу"""
+        db_path = str(tmp_path / "s.sqlite3")
+        first = create_session_store("sqlite", db_path, 60, 100, shared=True)
+        second = create_session_store("sqlite", db_path, 60, 100, shared=True)
+        first[1] = 2
+        assert second.get(1) == 2
+        second[1] = 5
+        assert first.get(1) == 5
+        with pytest.raises(ValueError):
+            create_session_store("memory", db_path, 60, 100, shared=True)
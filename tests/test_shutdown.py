@@ -0,0 +1,90 @@
+"""
+Тесты согласованной остановки
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram import Update, User
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from shutdown import GracefulShutdown
+from update_journal import UpdateJournal
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    update = Update(update_id)
+    update._effective_user = User(user_id, "Студент", False)
+    return update
+
+
+def make_application(journal: UpdateJournal) -> Mock:
+    application = Mock()
+    application.update_processor = PerUserUpdateProcessor(4, journal=journal)
+    application.update_queue = asyncio.Queue()
+    application.updater.running = True
+    application.updater.stop = AsyncMock()
+    return application
+
+
+class TestGracefulShutdown:
+    """Тесты GracefulShutdown"""
+
+    @pytest.mark.asyncio
+    async def test_in_flight_handlers_finish(self):
+        """Обработчик, успевающий до дедлайна, завершается, приём апдейтов прекращён"""
+        application = make_application(UpdateJournal())
+        processor = application.update_processor
+        done = []
+
+        async def handler():
+            await asyncio.sleep(0.1)
+            done.append(1)
+
+        task = asyncio.create_task(
+            processor.process_update(make_update(1, 1), handler())
+        )
+        await asyncio.sleep(0.01)
+        on_start = Mock()
+        shutdown = GracefulShutdown(timeout=5, handlers_timeout=2)
+        shutdown._on_start = on_start
+        await shutdown.run(application)
+        await task
+
+        assert done == [1]
+        on_start.assert_called_once()
+        application.updater.stop.assert_awaited_once()
+        application.stop_running.assert_called_once()
+        assert shutdown.report == {"handlers_finished": 1}
+        assert 0 < shutdown.remaining() < 5
+
+    @pytest.mark.asyncio
+    async def test_slow_handlers_deferred_to_next_start(self):
+        """После дедлайна обработка прерывается, апдейты остаются в журнале"""
+        journal = UpdateJournal()
+        application = make_application(journal)
+        processor = application.update_processor
+        tasks = [
+            asyncio.create_task(
+                processor.process_update(make_update(1, 1), asyncio.sleep(10))
+            ),
+            asyncio.create_task(
+                processor.process_update(make_update(2, 1), asyncio.sleep(10))
+            ),
+        ]
+        await asyncio.sleep(0.01)
+        shutdown = GracefulShutdown(timeout=5, handlers_timeout=0.1)
+        await shutdown.run(application)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Пришедший после прерывания апдейт тоже откладывается
+        await processor.process_update(make_update(3, 2), asyncio.sleep(10))
+
+        assert shutdown.report["handlers_deferred"] == 2
+        assert processor.deferred == 1
+        assert [update_id for update_id, _ in journal.unfinished(60)] == [1, 2, 3]
@@ -0,0 +1,107 @@
+"""
+Тесты лимитов частоты обращений и фильтра повторов
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from submission_limits import (
+    DuplicateFilter,
+    SlidingWindowLimiter,
+    SubmissionLimits,
+    fingerprint,
+    parse_limits,
+)
+
+
+class TestSlidingWindowLimiter:
+    """Тесты SlidingWindowLimiter"""
+
+    def test_limit_within_window(self):
+        """Сверх лимита события отклоняются, у других пользователей свой счёт"""
+        limiter = SlidingWindowLimiter(limit=2, window=100)
+        assert limiter.hit(1, now=1000)
+        assert limiter.hit(1, now=1010)
+        assert not limiter.hit(1, now=1020)
+        assert limiter.hit(2, now=1020)
+        assert limiter.rejected == 1
+
+    def test_previous_window_decays(self):
+        """События прошлого окна учитываются с убывающим весом"""
+        limiter = SlidingWindowLimiter(limit=2, window=100)
+        limiter.hit(1, now=1050)
+        limiter.hit(1, now=1060)
+        # Начало следующего окна: прошлые 2 события весят почти полностью
+        assert not limiter.hit(1, now=1110)
+        assert limiter.retry_after(1, now=1110) == pytest.approx(40)
+        # Середина окна: вес 2 * 0.4 = 0.8, одно событие помещается
+        assert limiter.hit(1, now=1160)
+        assert limiter.retry_after(1, now=1160) > 0
+
+    def test_retry_after_matches_hit(self):
+        """Через retry_after секунд событие действительно разрешено"""
+        limiter = SlidingWindowLimiter(limit=3, window=60)
+        for now in (0, 1, 2):
+            limiter.hit(1, now=now)
+        wait = limiter.retry_after(1, now=2)
+        assert wait > 0
+        assert not limiter.hit(1, now=2 + wait - 0.5)
+        assert limiter.hit(1, now=2 + wait + 0.01)
+
+    def test_memory_bounded(self):
+        """Записей не больше max_users, устаревшие вытесняются первыми"""
+        limiter = SlidingWindowLimiter(limit=5, window=10, max_users=100)
+        for user_id in range(1000):
+            limiter.hit(user_id, now=1000)
+        assert len(limiter) == 100
+        limiter.hit(5000, now=1100)  # Окна остальных давно истекли
+        assert len(limiter) == 1
+
+
+class TestDuplicateFilter:
+    """Тесты DuplicateFilter и fingerprint"""
+
+    def test_repeat_within_window_is_merged(self):
+        dedup = DuplicateFilter(window=600)
+        key = fingerprint(1, "Нужна  консультация")
+        assert not dedup.seen(key, now=1000)
+        assert dedup.seen(fingerprint(1, "нужна консультация "), now=1100)
+        assert not dedup.seen(key, now=1700)  # Окно истекло
+        assert dedup.merged == 1
+
+    def test_keys_differ_by_user_and_attachments(self):
+        assert fingerprint(1, "текст") != fingerprint(2, "текст")
+        assert fingerprint(1, "текст") != fingerprint(1, "текст", (("a.pdf", 10),))
+
+    def test_forget(self):
+        """Письмо не попало в очередь: повтор отправляется заново"""
+        dedup = DuplicateFilter()
+        key = fingerprint(1, "текст")
+        dedup.seen(key)
+        dedup.forget(key)
+        assert not dedup.seen(key)
+
+
+class TestSubmissionLimits:
+    """Тесты SubmissionLimits и parse_limits"""
+
+    def test_parse_limits(self):
+        assert parse_limits("message=5/3600, attachment=30/60,") == {
+            "message": (5, 3600.0),
+            "attachment": (30, 60.0),
+        }
+        with pytest.raises(ValueError):
+            parse_limits("message=5")
+
+    def test_zero_and_unknown_kinds_are_unlimited(self):
+        limits = SubmissionLimits({"message": (0, 60), "attachment": (1, 60)})
+        assert all(limits.hit("message", 1) for _ in range(10))
+        assert limits.hit("other", 1)
+        assert limits.hit("attachment", 1)
+        assert not limits.hit("attachment", 1)
+        assert limits.retry_after("attachment", 1) > 0
+        assert limits.stats() == {"rejected_attachment": 1, "merged": 0}
@@ -0,0 +1,94 @@
+"""
+Тесты журнала апдейтов
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from update_journal import UpdateJournal, drain_pending, replay_unfinished
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int = 1, age: float = 0) -> Update:
+    date = datetime.now(timezone.utc) - timedelta(seconds=age)
+    user = User(user_id, "Студент", False)
+    message = Message(
+        update_id, date, Chat(user_id, "private"), from_user=user, text="Привет"
+    )
+    return Update(update_id, message=message)
+
+
+async def handled(log: list, update_id: int):
+    log.append(update_id)
+
+
+class TestUpdateJournal:
+    """Тесты UpdateJournal и журналирующего PerUserUpdateProcessor"""
+
+    @pytest.mark.asyncio
+    async def test_duplicates_and_expired_skipped(self):
+        """Повторно доставленный и слишком старый апдейты не обрабатываются"""
+        processor = PerUserUpdateProcessor(4, journal=UpdateJournal(), max_age=60)
+        log = []
+        for update in (make_update(1), make_update(1), make_update(2, age=120)):
+            await processor.process_update(update, handled(log, update.update_id))
+
+        assert log == [1]
+        assert (processor.duplicates, processor.expired) == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_update_replayed_after_restart(self, tmp_path):
+        """Апдейт, прерванный остановкой, повторяется после запуска, но только раз"""
+        db_path = str(tmp_path / "updates.sqlite3")
+        journal = UpdateJournal(db_path)
+        processor = PerUserUpdateProcessor(4, journal=journal)
+        task = asyncio.create_task(
+            processor.process_update(make_update(7), asyncio.sleep(10))
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        journal.close()
+
+        journal = UpdateJournal(db_path)
+        log = []
+        application = MagicMock(bot=None)
+        application.update_processor = PerUserUpdateProcessor(4, journal=journal)
+        application.process_update = lambda update: handled(log, update.update_id)
+        assert await replay_unfinished(application, journal, 3600) == 1
+        assert log == [7]
+        assert journal.unfinished(3600) == []
+
+        # Telegram доставил тот же апдейт ещё раз
+        await application.update_processor.process_update(
+            make_update(7), handled(log, 7)
+        )
+        assert log == [7]
+
+    @pytest.mark.asyncio
+    async def test_drain_pending_in_batches(self):
+        """Накопившиеся апдейты забираются пачками, offset - после обработки"""
+        journal = UpdateJournal()
+        journal.begin(4)
+        journal.finish(4)
+        batches = [[make_update(5), make_update(6, 2)], [make_update(7)], []]
+        log = []
+        application = MagicMock()
+        application.bot.get_updates = AsyncMock(side_effect=batches)
+        application.update_processor = PerUserUpdateProcessor(4, journal=journal)
+        application.process_update = lambda update: handled(log, update.update_id)
+
+        assert await drain_pending(application, journal, batch=2) == 3
+        assert sorted(log) == [5, 6, 7]
+        offsets = [
+            c.kwargs["offset"] for c in application.bot.get_updates.await_args_list
+        ]
+        assert offsets == [5, 7, 8]
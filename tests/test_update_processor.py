@@ -0,0 +1,102 @@
+"""
+Тесты параллельной обработки апдейтов
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from telegram import Update, User
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from update_journal import UpdateJournal
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    update = Update(update_id)
+    update._effective_user = User(user_id, "Студент", False)
+    return update
+
+
+class TestPerUserUpdateProcessor:
+    """Тесты PerUserUpdateProcessor"""
+
+    @pytest.mark.asyncio
+    async def test_same_user_serialized_other_users_parallel(self):
+        """Апдейты одного пользователя идут по порядку, разных - параллельно"""
+        processor = PerUserUpdateProcessor(4)
+        log = []
+        release = asyncio.Event()
+
+        async def handle(name, wait=False):
+            log.append(f"start {name}")
+            if wait:
+                await release.wait()
+            log.append(f"end {name}")
+
+        tasks = [
+            asyncio.create_task(
+                processor.process_update(make_update(1, 1), handle("a1", True))
+            ),
+            asyncio.create_task(
+                processor.process_update(make_update(2, 1), handle("a2"))
+            ),
+            asyncio.create_task(
+                processor.process_update(make_update(3, 2), handle("b1"))
+            ),
+        ]
+        await asyncio.sleep(0.01)
+        # Пользователь 2 не ждёт медленный апдейт пользователя 1
+        assert log == ["start a1", "start b1", "end b1"]
+        assert processor.queued == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert log[3:] == ["end a1", "start a2", "end a2"]
+        assert processor.queued == 0
+
+    @pytest.mark.asyncio
+    async def test_same_user_order_kept_with_journal(self):
+        """Запись в журнал в потоках не переставляет апдейты пользователя"""
+        journal = UpdateJournal()
+        processor = PerUserUpdateProcessor(8, journal=journal)
+        log = []
+
+        async def handle(update_id):
+            log.append(update_id)
+
+        for trial in range(50):
+            ids = range(trial * 5, trial * 5 + 5)
+            await asyncio.gather(
+                *(
+                    asyncio.create_task(
+                        processor.process_update(make_update(i, 1), handle(i))
+                    )
+                    for i in ids
+                )
+            )
+            assert log[-5:] == list(ids)
+        assert journal.unfinished(max_age=60) == []
+
+    @pytest.mark.asyncio
+    async def test_error_does_not_break_user_queue(self):
+        """Ошибка в обработчике не останавливает очередь пользователя"""
+        processor = PerUserUpdateProcessor(2)
+        done = []
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append(True)
+
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), fail()),
+            processor.process_update(make_update(2, 1), ok()),
+        )
+        assert done == [True]
+        assert processor.active_users == 0
@@ -0,0 +1,176 @@
+"""
+Журнал апдейтов: дедупликация по update_id и повтор необработанных после перезапуска
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Telegram хранит неподтверждённые апдейты 24 часа: дольше помнить update_id незачем
+DEDUP_WINDOW = 24 * 3600
+
+
+def update_age(update: Update, now: float = None):
+    """Возраст сообщения в секундах или None, если у апдейта нет даты.
+
+    Дата сообщения, к которому привязана inline-кнопка, ничего не говорит о
+    времени нажатия, поэтому callback_query возраста не имеет.
+    """
+    message = update.message or update.edited_message
+    if message is None:
+        return None
+    sent = message.edit_date or message.date
+    return (time.time() if now is None else now) - sent.timestamp()
+
+
+class UpdateJournal:
+    """Апдейт записывается в SQLite до обработки и отмечается после неё.
+
+    Повторно доставленный апдейт (Telegram не получил подтверждение до падения
+    бота) отбрасывается. Апдейты, обработка которых прервалась остановкой,
+    остаются незавершёнными и повторяются через unfinished() при запуске.
+    """
+
+    def __init__(self, db_path: str = ":memory:", owner: str = ""):
+        self.owner = owner
+        self._lock = threading.Lock()
+        # Апдейты, которые обрабатываются в этом процессе прямо сейчас
+        self._active = set()
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS updates (
+                update_id INTEGER PRIMARY KEY,
+                data TEXT,
+                owner TEXT NOT NULL DEFAULT '',
+                received REAL NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+    def begin(self, update_id: int, data: dict = None) -> bool:
+        """Записывает апдейт. False - апдейт уже обработан или обрабатывается"""
+        with self._lock:
+            if update_id in self._active:
+                return False
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO updates (update_id, data, owner, received) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    update_id,
+                    json.dumps(data, ensure_ascii=False),
+                    self.owner,
+                    time.time(),
+                ),
+            )
+            if cur.rowcount == 0:
+                row = self._db.execute(
+                    "SELECT done, owner FROM updates WHERE update_id = ?", (update_id,)
+                ).fetchone()
+                # Незавершённый апдейт своего процесса - это повтор после перезапуска
+                if row[0] or row[1] != self.owner:
+                    return False
+            self._active.add(update_id)
+            return True
+
+    def finish(self, update_id: int) -> None:
+        with self._lock:
+            self._active.discard(update_id)
+            self._db.execute(
+                "UPDATE updates SET done = 1, data = NULL WHERE update_id = ?",
+                (update_id,),
+            )
+
+    def release(self, update_id: int) -> None:
+        """Обработка прервана: апдейт останется незавершённым для повтора"""
+        with self._lock:
+            self._active.discard(update_id)
+
+    def unfinished(self, max_age: float) -> list:
+        """Незавершённые апдейты этого процесса не старше max_age: [(update_id, dict)]"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT update_id, data FROM updates "
+                "WHERE done = 0 AND owner = ? AND received >= ? ORDER BY update_id",
+                (self.owner, time.time() - max_age),
+            ).fetchall()
+        return [(update_id, json.loads(data)) for update_id, data in rows]
+
+    def last_update_id(self):
+        """Наибольший записанный update_id (None, если журнал пуст)"""
+        with self._lock:
+            return self._db.execute("SELECT MAX(update_id) FROM updates").fetchone()[0]
+
+    def purge(self, window: float = DEDUP_WINDOW) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM updates WHERE received < ?", (time.time() - window,)
+            )
+            return cur.rowcount
+
+    async def watch(self, interval: float = 3600) -> None:
+        """Фоновая очистка записей старше окна дедупликации"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.purge)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+async def _process_batch(application, updates: list) -> None:
+    # Через update_processor: журнал, порядок по пользователю и лимит параллельности
+    processor = application.update_processor
+    await asyncio.gather(
+        *(
+            processor.process_update(update, application.process_update(update))
+            for update in updates
+        )
+    )
+
+
+async def replay_unfinished(application, journal: UpdateJournal, max_age: float) -> int:
+    """Обрабатывает апдейты, прерванные прошлой остановкой бота"""
+    rows = await asyncio.to_thread(journal.unfinished, max_age)
+    if rows:
+        logger.info(f"Повтор прерванных апдейтов: {len(rows)}")
+        await _process_batch(
+            application, [Update.de_json(data, application.bot) for _, data in rows]
+        )
+    return len(rows)
+
+
+async def drain_pending(application, journal: UpdateJournal, batch: int = 100) -> int:
+    """Забирает накопившиеся за время простоя апдейты пачками без пауз опроса.
+
+    Каждая пачка подтверждается Telegram (offset следующего запроса) только
+    после обработки. Работает только в режиме polling.
+    """
+    last = await asyncio.to_thread(journal.last_update_id)
+    offset = None if last is None else last + 1
+    total = 0
+    while True:
+        updates = await application.bot.get_updates(
+            offset=offset, limit=batch, timeout=0, allowed_updates=Update.ALL_TYPES
+        )
+        if not updates:
+            break
+        await _process_batch(application, updates)
+        total += len(updates)
+        offset = updates[-1].update_id + 1
+    if total:
+        logger.info(f"Обработано апдейтов, накопившихся за время простоя: {total}")
+    return total
@@ -0,0 +1,169 @@
+"""
+Параллельная обработка апдейтов с сохранением порядка для каждого пользователя
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from update_journal import update_age
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object):
+    """Ключ упорядочивания: пользователь, а если его нет - чат"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты разных пользователей обрабатываются параллельно (не больше
+    max_concurrent_updates одновременно), апдейты одного пользователя - строго
+    по очереди.
+
+    Пока апдейт пользователя обрабатывается, следующие его апдейты ждут в
+    очереди этого пользователя и не занимают слоты параллельности.
+
+    С journal (update_journal.UpdateJournal) повторно доставленные апдейты
+    отбрасываются, а сообщения старше max_age секунд не обрабатываются.
+    """
+
+    def __init__(
+        self, max_concurrent_updates: int, journal=None, max_age: float = None
+    ):
+        super().__init__(max_concurrent_updates)
+        self._pending = {}  # ключ -> deque (апдейт, корутина), ожидающих очереди
+        self.queued = 0
+        self.journal = journal
+        self.max_age = max_age
+        self.duplicates = 0
+        self.expired = 0
+        # Задачи, обрабатывающие апдейты прямо сейчас; при остановке их можно
+        # отменить, а новые апдейты - отложить до следующего запуска
+        self._tasks = set()
+        self.deferring = False
+        self.deferred = 0
+
+    def _journaled(self, update) -> bool:
+        return self.journal is not None and isinstance(update, Update)
+
+    async def do_process_update(self, update, coroutine) -> None:
+        if self.deferring:
+            await self._defer(update, coroutine)
+            return
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._process(update, coroutine)
+        finally:
+            self._tasks.discard(task)
+
+    async def _process(self, update, coroutine) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        backlog = self._pending.get(key)
+        if backlog is not None:
+            # Пользователь уже обрабатывается: апдейт выполнит текущий обработчик
+            backlog.append((update, coroutine))
+            self.queued += 1
+            return
+
+        backlog = self._pending[key] = deque()
+        try:
+            await self._run(update, coroutine)
+            while backlog:
+                self.queued -= 1
+                await self._run(*backlog.popleft())
+        finally:
+            del self._pending[key]
+            # Обработка прервана (например, отменой задачи при остановке):
+            # ожидавшие апдейты ещё не записаны в журнал, записываем их
+            # незавершёнными, чтобы повторить после запуска
+            for leftover_update, leftover in backlog:
+                leftover.close()
+                self.queued -= 1
+                if self._journaled(leftover_update):
+                    self._remember(leftover_update)
+
+    def in_flight(self) -> int:
+        """Апдейты в обработке и в очередях пользователей"""
+        return self.current_concurrent_updates + self.queued
+
+    def cancel_in_flight(self) -> int:
+        """Прерывает обработку при остановке. С журналом прерванные и все
+        следующие апдейты будут обработаны после запуска"""
+        self.deferring = True
+        count = self.in_flight()
+        for task in self._tasks:
+            task.cancel()
+        return count
+
+    async def _defer(self, update, coroutine) -> None:
+        coroutine.close()
+        self.deferred += 1
+        if self._journaled(update):
+            await asyncio.to_thread(self._remember, update)
+
+    def _remember(self, update: Update) -> None:
+        # Апдейт записывается незавершённым и будет повторён после запуска
+        if self.journal.begin(update.update_id, update.to_dict()):
+            self.journal.release(update.update_id)
+
+    async def _admit(self, update: Update) -> bool:
+        age = update_age(update)
+        if self.max_age and age is not None and age > self.max_age:
+            self.expired += 1
+            logger.warning(
+                f"Апдейт {update.update_id} старше {self.max_age:.0f} с пропущен"
+            )
+            await asyncio.to_thread(self.journal.finish, update.update_id)
+            return False
+        data = update.to_dict()
+        if not await asyncio.to_thread(self.journal.begin, update.update_id, data):
+            self.duplicates += 1
+            logger.info(f"Повторный апдейт {update.update_id} пропущен")
+            return False
+        return True
+
+    async def _run(self, update, coroutine) -> None:
+        # Запись в журнал - уже в очереди пользователя: иначе ответы потоков
+        # могли бы переставить его апдейты местами
+        try:
+            if self._journaled(update) and not await self._admit(update):
+                coroutine.close()
+                return
+            await coroutine
+        except asyncio.CancelledError:
+            # Остановка бота: апдейт останется в журнале и будет повторён
+            if self._journaled(update):
+                self.journal.release(update.update_id)
+            raise
+        except Exception as e:
+            # Ошибки обработчиков уже переданы в error_handler приложением,
+            # здесь важно лишь не прервать очередь пользователя
+            logger.error(f"Ошибка обработки апдейта: {e}")
+        if self._journaled(update):
+            await asyncio.to_thread(self.journal.finish, update.update_id)
+
+    @property
+    def active_users(self) -> int:
+        return len(self._pending)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self.queued:
+            logger.warning(f"Остановка с необработанными апдейтами: {self.queued}")